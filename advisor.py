@@ -0,0 +1,222 @@
+# Advisor for Desperate Defenders
+#
+# Suggests the player's next action, or plays the game by itself. Every
+# action the player could take (buying a unit in a cell, upgrading a
+# unit, healing an area or ending the turn) is tried on the game, which
+# is then played a few turns further with a simple policy (a rollout)
+# and restored from a snapshot (see engine.snapshot()), so a rollout
+# only copies the cells it changes. The action whose rollouts end best
+# on average is chosen. Rollouts are handed out to the actions as in a
+# multi-armed bandit (UCB1): mostly to the actions doing best so far,
+# but now and then to the others in case they were unlucky.
+#
+# What the rollouts found is kept in a transposition table, keyed by the
+# Zobrist hash of the game (see engine.state_hash()) and the action
+# tried, so an action tried from the same game before (for example,
+# after an upgrade that does not take a turn, or a suggestion the player
+# did not follow) starts with the rollouts already played. The table
+# keeps the entries used most recently, up to a set number.
+#
+# Decisions are made within a time budget (80 ms by default, so answers
+# come in under 100 ms on the default board), or with a set number of
+# rollouts, which plays out the same every time for the same seed.
+
+import random
+import time
+from collections import OrderedDict
+from math import log, sqrt
+from typing import Optional
+
+import catalog
+import engine
+import sinks
+
+# How many turns every rollout plays past the action tried.
+ROLLOUT_TURNS = 5
+
+# How much the bandit explores actions that have done badly so far,
+# relative to the values of evaluate().
+EXPLORATION = 20
+
+####################
+# Search
+####################
+
+
+class TranspositionTable:
+    """The rollouts played for every (game, action) pair, keeping only
+    the pairs used most recently.
+
+    Attributes:
+        size (int): The largest number of pairs kept.
+    """
+
+    def __init__(self, size=65536):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> list:
+        """Returns the total value and number of the rollouts played for
+        a pair, adding the pair if it is new.
+
+        Returns:
+            list: The total value and the number of rollouts, which the
+            caller updates in place.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [0.0, 0]
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+
+def candidate_actions(state: engine.GameState) -> list:
+    """Lists the actions the player can take that the engine would
+    accept: buying any unit that can be afforded in the free cells
+    furthest back and furthest forward in every lane of the player's
+    half (the cells between rarely play differently, and trying them all
+    would spread the rollouts thin), upgrading any unit that can be
+    upgraded and afforded, healing around any hurt unit, and ending the
+    turn.
+
+    Returns:
+        list: The actions, ending the turn first.
+    """
+    variables, units = state.variables, engine.units()
+    gold, half = variables["gold"], variables["columns"] // 2
+    actions = [engine.EndTurn()]
+    affordable = [template["id"] for template in state.characters["player"] if template["cost"] <= gold]
+    for r_index, row in enumerate(state.field):
+        free = [c_index for c_index in range(half) if row[c_index] is None]
+        for c_index in sorted(set(free[:1] + free[-1:])):
+            actions.extend(engine.Buy(unit, r_index, c_index) for unit in affordable)
+        for c_index in range(half):
+            entity = row[c_index]
+            if entity is not None and entity.type == "player":
+                if units.upgrades[entity.code] is not None and \
+                        units.upgrade_cost(entity.code, entity.upgrade_count) <= gold:
+                    actions.append(engine.Upgrade(r_index, c_index))
+                if entity.current_health < entity.health and gold >= 5:
+                    actions.append(engine.Heal(r_index, c_index))
+    return actions
+
+
+def rollout_action(state: engine.GameState, rng: random.Random) -> engine.Action:
+    """The policy rollouts are played with: buys a random shooting unit
+    that can be afforded in the lane of the enemy closest to the city
+    that has room, as far back as there is room, and ends the turn
+    otherwise."""
+    units = engine.units()
+    shooters = [template for template in state.characters["player"]
+                if template["cost"] <= state.variables["gold"] and
+                units.attacks[units.code(template["id"])] == catalog.SHOOT]
+    if shooters:
+        lanes = sorted((enemies[0], r_index) for r_index, enemies in enumerate(state.enemy_lanes) if enemies)
+        for _, r_index in lanes:
+            for c_index in range(state.variables["columns"] // 2):
+                if state.field[r_index][c_index] is None:
+                    return engine.Buy(rng.choice(shooters)["id"], r_index, c_index)
+    return engine.EndTurn()
+
+
+def evaluate(state: engine.GameState) -> float:
+    """Scores how well a game is going for the player: kills and gold
+    count for the player, as do its units, each worth what it cost for
+    the share of its health it has left; the health of the enemies
+    counts against it, the more so the closer they are to the city. A
+    game won or lost scores far above or below any other.
+
+    Returns:
+        float: The score.
+    """
+    if state.outcome == "win":
+        return 1000.0
+    elif state.outcome == "loss":
+        return -1000.0 + state.variables["turn"]
+
+    columns = state.variables["columns"]
+    costs = {template["id"]: template["cost"] for template in state.characters["player"]}
+    score = 10.0 * state.variables["killed"] + state.variables["gold"]
+    for row, enemies in zip(state.field, state.enemy_lanes):
+        for entity in row:
+            if entity is not None and entity.type == "player":
+                score += costs.get(entity.id, 0) * entity.current_health / entity.health
+        for c_index in enemies:
+            score -= 0.5 * row[c_index].current_health + 3.0 * (columns - c_index)
+    return score
+
+
+class Advisor:
+    """Chooses actions for the player by Monte Carlo search. An advisor
+    keeps its transposition table from one decision to the next, so the
+    same advisor should be asked throughout a game.
+
+    Attributes:
+        budget (float): The time a decision takes, in seconds, unless a
+        number of rollouts is given instead.
+        rollout_turns (int): How many turns every rollout plays.
+        table (TranspositionTable): The rollouts played so far.
+        rollouts (int): The number of rollouts played for the last
+        decision.
+    """
+
+    def __init__(self, budget=0.08, rollout_turns=ROLLOUT_TURNS, table_size=65536, seed=None):
+        self.budget, self.rollout_turns = budget, rollout_turns
+        self.table = TranspositionTable(table_size)
+        self.rollouts = 0
+        self._rng = random.Random(seed)
+        self._events = sinks.NullSink()
+
+    def _rollout(self, state: engine.GameState, action: engine.Action) -> float:
+        # Rollouts draw from the advisor's generator, so the game's is
+        # left as it was.
+        point, game_rng = engine.snapshot(state, random_state=False), state.rng
+        state.rng = self._rng
+        try:
+            engine.step(state, action, self._events)
+            last_turn = state.variables["turn"] + self.rollout_turns
+            while state.outcome is None and state.variables["turn"] < last_turn:
+                engine.step(state, rollout_action(state, self._rng), self._events)
+            return evaluate(state)
+        finally:
+            state.rng = game_rng
+            engine.restore(state, point)
+
+    def advise(self, state: engine.GameState, rollouts: Optional[int] = None) -> engine.Action:
+        """Chooses the best action for the player.
+
+        Parameters:
+            state (GameState): The game to choose an action in. It is
+            left as it was.
+            rollouts (int): The number of rollouts to play; if not given,
+            rollouts are played until the time budget runs out.
+
+        Returns:
+            Action: The action.
+        """
+        deadline = time.perf_counter() + self.budget
+        actions = candidate_actions(state)
+        self.rollouts = 0
+        if len(actions) == 1:
+            return actions[0]
+        game = engine.state_hash(state)
+        entries = [self.table.get((game, action)) for action in actions]
+
+        while (self.rollouts < rollouts) if rollouts is not None else (time.perf_counter() < deadline):
+            # Every action is tried once before any is tried again.
+            total = sum(entry[1] for entry in entries) + 1
+            index = max(range(len(actions)), key=lambda index: float("inf") if entries[index][1] == 0 else
+                        entries[index][0] / entries[index][1] + EXPLORATION * sqrt(log(total) / entries[index][1]))
+            entries[index][0] += self._rollout(state, actions[index])
+            entries[index][1] += 1
+            self.rollouts += 1
+
+        best = max(range(len(actions)), key=lambda index: -float("inf") if entries[index][1] == 0 else
+                   entries[index][0] / entries[index][1])
+        return actions[best]
@@ -0,0 +1,187 @@
+# Crash-safe saving for Desperate Defenders
+#
+# Save files are never written in place. Every save is written to a
+# temporary file next to the save file and flushed to disk, and only
+# then renamed over the save file, so a crash or Ctrl-C part way through
+# leaves the previous save untouched. The last few saves are also kept
+# as generations (saved_game.ddc.1 being the newest) to fall back on.
+#
+# The Autosaver does the writing on a background thread, so that the
+# game never waits for the disk, or for the game to be turned into the
+# bytes of a save file. All the game is held up by is a snapshot of the
+# game (see engine.snapshot()) and shallow copies of the rows of its
+# field: the game carries on changing while the thread writes it, and
+# what every cell held when the save was made is read from the copies,
+# or from the snapshot's log for the cells changed since. The snapshot
+# logs every change, even with the snapshots of undoing actions and of
+# the advisor's rollouts taken and restored on top of it.
+
+import io
+import os
+import threading
+from typing import Optional
+
+import engine
+import savefile
+
+# The number of older saves kept next to a save file.
+GENERATIONS = 3
+
+
+def generation_file_names(file_name: str, generations=GENERATIONS) -> list:
+    """Lists a save file and its older generations, newest first."""
+    return [file_name] + ["{}.{}".format(file_name, generation) for generation in range(1, generations + 1)]
+
+
+def _sync_directory(file_name: str):
+    """Flushes a renamed file's directory entry to disk, where the
+    platform allows it."""
+    try:
+        descriptor = os.open(os.path.dirname(
+            os.path.abspath(file_name)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def write_atomic(data: bytes, file_name: str, generations=GENERATIONS):
+    """Writes a save file without ever leaving a partly written file in
+    its place, keeping the previous saves as older generations.
+
+    Parameters:
+        data (bytes): The contents of the save file.
+        file_name (str): The name of the save file.
+        generations (int): The number of older saves to keep.
+    """
+    temporary_file_name = file_name + ".tmp"
+    with open(temporary_file_name, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+    # Shifts every generation one place back, dropping the oldest one.
+    if os.path.exists(file_name) and generations > 0:
+        names = generation_file_names(file_name, generations)
+        for older, newer in zip(reversed(names[1:]), reversed(names[:-1])):
+            if os.path.exists(newer):
+                os.replace(newer, older)
+
+    os.replace(temporary_file_name, file_name)
+    _sync_directory(file_name)
+
+
+def load(file_name: str, generations=GENERATIONS, sparse=False) -> tuple:
+    """Loads the newest readable generation of a compact save file,
+    with a sparse field if sparse is given (see engine.new_field()).
+
+    Returns:
+        tuple: The game, and the name of the file it was loaded from.
+
+    Raises:
+        SaveFileError: If no generation of the save file can be read.
+    """
+    first_error = None
+    for name in generation_file_names(file_name, generations):
+        if not os.path.exists(name):
+            continue
+        try:
+            with open(name, "rb") as file:
+                return savefile.read_compact(file, sparse), name
+        except (OSError, savefile.SaveFileError) as error:
+            first_error = first_error or error
+    raise savefile.SaveFileError(
+        str(first_error) if first_error is not None else "No saved game found.")
+
+
+class Autosaver:
+    """Writes save files on a background thread.
+
+    Saves are queued by file name; if a file is saved again before the
+    thread has got to it, only the newest save is written. The thread is
+    started on the first save.
+
+    A game is read through a snapshot taken when it is queued, which
+    logs every change to the game until flush() or the next save() finds
+    the save written, whatever snapshots are taken, restored or released
+    on top of it in the meantime. A game that is still being saved must
+    not be restored to a snapshot taken before the save, as that would
+    drop the save's snapshot with it; flush() first.
+
+    Attributes:
+        generations (int): The number of older saves kept for every file.
+        error (OSError): The last error met while writing, if any.
+    """
+
+    def __init__(self, generations=GENERATIONS):
+        self.generations = generations
+        self.error = None
+        self._pending = {}
+        self._writing = False
+        # The saves written since, whose snapshots are yet to be
+        # released. Only the game's own thread changes its snapshots.
+        self._written = []
+        self._thread = None
+        self._condition = threading.Condition()
+
+    def save(self, state: engine.GameState, file_name: str):
+        """Queues a game to be saved. Returns straight away."""
+        point = engine.snapshot(state)
+        rows = [row.copy() for row in state.field]
+        with self._condition:
+            self._release(self._written)
+            replaced = self._pending.get(file_name)
+            if replaced is not None:
+                self._release([replaced])
+            self._pending[file_name] = (state, point, rows)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="autosave", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self) -> Optional[OSError]:
+        """Waits until every queued save has been written.
+
+        Returns:
+            OSError: The last error met while writing, or None if every
+            save was written.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self._pending and not self._writing)
+            self._release(self._written)
+            error, self.error = self.error, None
+            return error
+
+    def _release(self, saves: list):
+        """Releases the snapshots of saves that are no longer read."""
+        for state, point, _ in saves:
+            try:
+                engine.release(state, point)
+            except ValueError:
+                # The game was restored to before the save.
+                pass
+        saves.clear()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                file_name, save = self._pending.popitem()
+                self._writing = True
+            try:
+                buffer = io.BytesIO()
+                savefile.write_snapshot(*save, buffer)
+                write_atomic(buffer.getvalue(), file_name, self.generations)
+            except OSError as error:
+                self.error = error
+            finally:
+                with self._condition:
+                    self._written.append(save)
+                    self._writing = False
+                    self._condition.notify_all()
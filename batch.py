@@ -0,0 +1,473 @@
+# Batches of Desperate Defenders games played in lockstep
+#
+# Playing one game at a time through engine.py spends most of its time
+# on Python overhead: a turn on the default 7x5 board only does a few
+# dozen operations. A GameBatch holds many independent games as stacked
+# arrays instead, with the games along the first axis, and plays a turn
+# of every game at once. The cells are still walked in the same order as
+# engine.advance_entities() (lane by lane, column by column), but every
+# step is done for all the games in one array operation, so the cost of
+# the Python loop is shared by the whole batch. This is meant for
+# playing huge numbers of games, for example to evaluate policies.
+#
+# The games follow the same rules as engine.py, but draw their random
+# numbers from a NumPy generator, so a game in a batch does not play out
+# like a game in the engine with the same seed.
+#
+# NumPy is only needed for this file; the rest of the game runs without
+# it.
+
+from copy import deepcopy
+from typing import Optional
+
+import numpy as np
+
+import catalog
+import engine
+
+# The planes of GameBatch.cells, one for each stat an entity can have.
+KIND, TYPE, HP, MAX_HP, MIN_DAMAGE, MAX_DAMAGE, MOVES, REWARD, UPGRADES = range(9)
+PLANES = 9
+
+# The values of the TYPE plane.
+EMPTY, PLAYER, ENEMY = 0, 1, 2
+
+
+def _kinds(characters: dict) -> list:
+    """Lists the templates of a game as (type, template) tuples, in the
+    order of the codes of the KIND plane; code 0 is reserved for empty
+    cells."""
+    return [(None, {})] + [("player", template) for template in characters["player"]] + \
+        [("enemy", template) for template in characters["enemy"]]
+
+
+# The actions a game in a batch can take; see GameBatch.step().
+END_TURN, BUY, UPGRADE, HEAL = range(4)
+
+# The values of GameBatch.outcome.
+PLAYING, WIN, LOSS = range(3)
+_OUTCOMES = {None: PLAYING, "win": WIN, "loss": LOSS}
+
+
+class GameBatch:
+    """Many games of the same size and with the same units, stored as
+    stacked arrays.
+
+    Attributes:
+        size (int): The number of games.
+        rows (int): The number of rows of every field.
+        columns (int): The number of columns of every field.
+        cells (numpy.ndarray): The fields, with the shape (games, planes,
+        rows, columns): one plane per stat (see KIND to UPGRADES), so
+        every plane is its own contiguous array while moving an entity
+        from one cell to another is still a single assignment.
+        variables (dict): The game variables (except rows and columns),
+        each as an array with a value for every game.
+        enemy_health (numpy.ndarray): The health enemies spawn with, by
+        game and enemy template, as it grows over a game.
+        outcome (numpy.ndarray): PLAYING, WIN or LOSS for every game.
+        rng (numpy.random.Generator): The random number generator every
+        game in the batch draws from.
+    """
+
+    def __init__(self, size: int, variables=None, characters=None, seed=None):
+        variables = dict(
+            engine.GAME_VARIABLES if variables is None else variables)
+        self.characters = deepcopy(
+            engine.units().characters if characters is None else characters)
+        self.size, self.rows, self.columns = size, variables["rows"], variables["columns"]
+
+        self.kinds = _kinds(self.characters)
+        self.names = [template.get("name") for _, template in self.kinds]
+        self.codes = {template["id"]: code for code, (_, template) in enumerate(self.kinds) if code > 0}
+        self.cells = np.zeros((size, PLANES, self.rows, self.columns), dtype=np.int64)
+        self.variables = {key: np.full(size, value, dtype=np.int64)
+                          for key, value in variables.items() if key not in ["rows", "columns"]}
+        self._initial_variables = {key: variables[key] for key in self.variables}
+        self.enemy_health = np.array(
+            [[template["health"] for template in self.characters["enemy"]]] * size, dtype=np.int64).reshape(size, -1)
+        self.outcome = np.full(size, PLAYING, dtype=np.int8)
+        self.rng = np.random.Generator(np.random.Philox(seed))
+
+        # The cell a fresh entity of every kind fills, and the cost of
+        # every kind; enemies spawn with the health in enemy_health.
+        self._spawns = np.zeros((len(self.kinds), PLANES), dtype=np.int64)
+        self._costs = np.zeros(len(self.kinds), dtype=np.int64)
+        for code, (type, template) in enumerate(self.kinds):
+            if code == 0:
+                continue
+            entity = engine.Entity.spawn(template, type)
+            self._spawns[code, [KIND, TYPE, HP, MAX_HP, MIN_DAMAGE, MAX_DAMAGE, MOVES, REWARD]] = [
+                code, PLAYER if type == "player" else ENEMY, entity.current_health, entity.health,
+                entity.min_damage, entity.max_damage, entity.moves, entity.reward]
+            self._costs[code] = template.get("cost", 0)
+        self._players = np.array([self.codes[template["id"]]
+                                 for template in self.characters["player"]], dtype=np.int64)
+        self._enemies = np.array([self.codes[template["id"]]
+                                 for template in self.characters["enemy"]], dtype=np.int64)
+        self._max_moves = max([template["moves"]
+                              for template in self.characters["enemy"]], default=0)
+
+        # How every kind behaves, from the tables of engine.units() (see
+        # catalog.py), as arrays indexed by kind. Damage is multiplied by
+        # numerators[attacker, target] // denominators[attacker, target].
+        units = engine.units()
+        codes = [units.code(template["id"]) for _, template in self.kinds[1:]]
+        self._shoots = np.array([False] + [units.attacks[code] == catalog.SHOOT for code in codes])
+        self._fires_every = np.array([1] + [units.fires_every[code] for code in codes], dtype=np.int64)
+        self._knockback = np.array([False] + [units.knockback[code] for code in codes])
+        self._detonates = np.array([False] + [units.detonates[code] is not None for code in codes])
+        self._areas = np.array([(0, 0)] + [units.detonates[code] or (0, 0) for code in codes], dtype=np.int64)
+        self._numerators = np.ones((len(self.kinds), len(self.kinds)), dtype=np.int64)
+        self._denominators = np.ones((len(self.kinds), len(self.kinds)), dtype=np.int64)
+        for attacker, attacker_code in enumerate(codes, 1):
+            for target, target_code in enumerate(codes, 1):
+                multiplier = units.damage_against[attacker_code][target_code]
+                if multiplier is not None:
+                    self._numerators[attacker, target], self._denominators[attacker, target] = multiplier
+        self._upgradable = np.array([False] + [units.upgrades[code] is not None for code in codes])
+        self._upgrades = np.array([(0,) * 5] + [units.upgrades[code] or (0,) * 5 for code in codes], dtype=np.int64)
+
+    @classmethod
+    def from_states(cls, states: list, seed=None) -> "GameBatch":
+        """Builds a batch from games of the same size, played with the
+        same units. Batches spawn enemies as the games go, so games
+        following a wave plan (see waves.py) cannot be batched.
+
+        Parameters:
+            states (list): The games.
+            seed: The seed for the batch's random number generator.
+
+        Returns:
+            GameBatch: The batch.
+
+        Raises:
+            ValueError: If the games differ in size or units, or follow a
+            wave plan.
+        """
+        first = states[0]
+        batch = cls(len(states), first.variables, first.characters, seed)
+        for index, state in enumerate(states):
+            if (state.variables["rows"], state.variables["columns"]) != (batch.rows, batch.columns):
+                raise ValueError("All the games in a batch must be of the same size.")
+            if [template["id"] for template in state.characters["player"] + state.characters["enemy"]] != \
+                    [template["id"] for template in first.characters["player"] + first.characters["enemy"]]:
+                raise ValueError("All the games in a batch must have the same units.")
+            if state.waves is not None:
+                raise ValueError("Games following a wave plan cannot be batched.")
+            for r_index, row in enumerate(state.field):
+                for c_index, cell in engine.occupied_cells(row):
+                    batch.cells[index, :, r_index, c_index] = [
+                        batch.codes[cell.id], PLAYER if cell.type == "player" else ENEMY,
+                        cell.current_health, cell.health, cell.min_damage, cell.max_damage,
+                        cell.moves, cell.reward, cell.upgrade_count]
+            for key in batch.variables:
+                batch.variables[key][index] = state.variables[key]
+            batch.enemy_health[index] = [template["health"]
+                                         for template in state.characters["enemy"]]
+            batch.outcome[index] = _OUTCOMES[state.outcome]
+        return batch
+
+    def to_state(self, index: int) -> engine.GameState:
+        """Rebuilds the GameState of one game of the batch.
+
+        Returns:
+            GameState: The game, with a random number generator of its
+            own.
+        """
+        characters = deepcopy(self.characters)
+        for template, health in zip(characters["enemy"], self.enemy_health[index].tolist()):
+            template["health"] = health
+        kinds, cells = _kinds(characters), self.cells[index].tolist()
+        field = engine.new_field(self.rows, self.columns)
+        for r_index, row in enumerate(field):
+            for c_index in range(self.columns):
+                values = [plane[r_index][c_index] for plane in cells]
+                if values[TYPE] != EMPTY:
+                    type, template = kinds[values[KIND]]
+                    row[c_index] = engine.Entity(engine.kind_of(template, type), values[HP], values[MAX_HP],
+                                                 values[MIN_DAMAGE], values[MAX_DAMAGE], values[REWARD],
+                                                 values[UPGRADES])
+        variables = {key: int(values[index])
+                     for key, values in self.variables.items()}
+        variables.update(rows=self.rows, columns=self.columns)
+        state = engine.GameState(field, variables, characters)
+        state.outcome = {WIN: "win", LOSS: "loss"}.get(int(self.outcome[index]))
+        return state
+
+    def reset(self, mask: np.ndarray):
+        """Starts new games in place of the games given by a mask, for
+        example once they have ended, and begins their first turn."""
+        self.cells[mask] = 0
+        for key, values in self.variables.items():
+            values[mask] = self._initial_variables[key]
+        self.enemy_health[mask] = [template["health"]
+                                   for template in self.characters["enemy"]]
+        self.outcome[mask] = PLAYING
+        self.begin_turn(mask)
+
+    ####################
+    # Turn functions
+    # The batch versions of engine.begin_turn() and engine.step().
+    ####################
+
+    def begin_turn(self, mask: Optional[np.ndarray] = None):
+        """Begins a turn in the games given by a mask (all games still
+        being played, by default). See engine.begin_turn().
+        """
+        variables = self.variables
+        mask = self.outcome == PLAYING if mask is None else mask & (
+            self.outcome == PLAYING)
+
+        won = mask & (variables["killed"] >= variables["target"])
+        self.outcome[won] = WIN
+        mask = mask & ~won
+
+        enhanced = mask & (variables["turn"] > 0) & (
+            variables["turn"] % 12 == 0)
+        if enhanced.any():
+            enemies = (self.cells[:, TYPE] == ENEMY) & enhanced[:, None, None]
+            for plane in [MIN_DAMAGE, MAX_DAMAGE, REWARD]:
+                self.cells[:, plane][enemies] += 1
+            self.enemy_health[enhanced] += 1
+            variables["danger_level"][enhanced] += 1
+
+        self._spawn_enemies(
+            mask & ~(self.cells[:, TYPE] == ENEMY).any(axis=(1, 2)))
+
+    def step(self, action, unit=0, row=0, column=0) -> np.ndarray:
+        """Carries out an action in every game still being played. See
+        engine.step().
+
+        Every argument is either an array with a value for every game or
+        a single value for all of them.
+
+        Parameters:
+            action: END_TURN, BUY, UPGRADE or HEAL.
+            unit: The index of the unit to buy, in the player's templates.
+            row: The row of the cell to buy in, upgrade or heal.
+            column: The column of the cell to buy in, upgrade or heal.
+
+        Returns:
+            numpy.ndarray: For every game, whether its action was carried
+            out (rather than rejected, or the game having already ended).
+        """
+        variables, cells, columns = self.variables, self.cells, self.columns
+        action, unit, row, column = [np.broadcast_to(np.asarray(value, dtype=np.int64), (self.size,))
+                                     for value in (action, unit, row, column)]
+        playing = self.outcome == PLAYING
+        in_player_half = (row >= 0) & (row < self.rows) & (
+            column >= 0) & (column < columns // 2)
+        took_turn = playing & (action == END_TURN)
+        accepted = took_turn.copy()
+
+        games = np.flatnonzero(playing & (action == BUY) & in_player_half &
+                               (unit >= 0) & (unit < len(self._players)))
+        if games.size:
+            r, c = row[games], column[games]
+            code = self._players[unit[games]]
+            cost = self._costs[code]
+            placed = (variables["gold"][games] >= cost) & (
+                cells[games, TYPE, r, c] == EMPTY)
+            games, r, c, code, cost = games[placed], r[placed], c[placed], code[placed], cost[placed]
+            cells[games, :, r, c] = self._spawns[code]
+            variables["gold"][games] -= cost
+            took_turn[games] = accepted[games] = True
+
+        games = np.flatnonzero(playing & (action == UPGRADE) & in_player_half)
+        if games.size:
+            r, c = row[games], column[games]
+            kind, upgrades = cells[games, KIND, r, c], cells[games, UPGRADES, r, c]
+            cost, cost_increase, health, min_damage, max_damage = self._upgrades[kind].T
+            cost = cost + cost_increase * upgrades
+            upgraded = self._upgradable[kind] & (variables["gold"][games] >= cost)
+            games, r, c, cost = games[upgraded], r[upgraded], c[upgraded], cost[upgraded]
+            variables["gold"][games] -= cost
+            cells[games, MIN_DAMAGE, r, c] += min_damage[upgraded]
+            cells[games, MAX_DAMAGE, r, c] += max_damage[upgraded]
+            cells[games, HP, r, c] += health[upgraded]
+            cells[games, MAX_HP, r, c] += health[upgraded]
+            cells[games, UPGRADES, r, c] += 1
+            accepted[games] = True
+
+        games = np.flatnonzero(playing & (action == HEAL) & in_player_half &
+                               (variables["gold"] >= 5))
+        if games.size:
+            variables["gold"][games] -= 5
+            took_turn[games] = accepted[games] = True
+            for r_offset in (-1, 0, 1):
+                for c_offset in (-1, 0, 1):
+                    r, c = row[games] + r_offset, column[games] + c_offset
+                    inside = (r >= 0) & (r < self.rows) & (
+                        c >= 0) & (c < columns)
+                    g, r, c = games[inside], r[inside], c[inside]
+                    healed = cells[g, TYPE, r, c] == PLAYER
+                    g, r, c = g[healed], r[healed], c[healed]
+                    cells[g, HP, r, c] = np.minimum(
+                        cells[g, HP, r, c] + 5, cells[g, MAX_HP, r, c])
+
+        variables["turn"][took_turn] += 1
+        self.advance(took_turn)
+
+        took_turn &= self.outcome == PLAYING
+        games = np.flatnonzero(took_turn)
+        variables["gold"][games] += 1
+        variables["threat_level"][games] += self.rng.integers(
+            1, variables["danger_level"][games] + 1)
+        while True:
+            threatened = took_turn & (variables["threat_level"] >= 10)
+            if not threatened.any():
+                break
+            self._spawn_enemies(threatened)
+            variables["threat_level"][threatened] -= 10
+        self.begin_turn(took_turn)
+        return accepted
+
+    ####################
+    # Game rules
+    ####################
+
+    def advance(self, mask: np.ndarray):
+        """Advances the round in the games given by a mask: defenses
+        shoot, and enemies attack or move. See engine.advance_entities().
+        """
+        cells, columns, rng = self.cells, self.columns, self.rng
+        advancing = mask & (self.outcome == PLAYING)
+        next_turn = self.variables["turn"] + 1
+
+        for r_index in range(self.rows):
+            for c_index in range(columns):
+                # Only the games with an entity in the cell are looked at
+                # from here on.
+                occupied = np.flatnonzero(advancing & (
+                    cells[:, TYPE, r_index, c_index] != EMPTY))
+                if not occupied.size:
+                    continue
+                kind = cells[occupied, KIND, r_index, c_index]
+
+                # Activates the defenses; units that fire every few turns
+                # skip the turns in between.
+                shooting = self._shoots[kind] & (
+                    next_turn[occupied] % self._fires_every[kind] == 0)
+                games, kind = occupied[shooting], kind[shooting]
+                if games.size and c_index + 1 < columns:
+                    ahead = cells[games, TYPE, r_index,
+                                  c_index + 1:] == ENEMY
+                    found = ahead.any(axis=1)
+                    games = games[found]
+                    target = c_index + 1 + ahead[found].argmax(axis=1)
+                    damage = rng.integers(cells[games, MIN_DAMAGE, r_index, c_index],
+                                          cells[games, MAX_DAMAGE, r_index, c_index] + 1)
+                    attacker, target_kind = kind[found], cells[games, KIND, r_index, target]
+                    damage = damage * self._numerators[attacker, target_kind] // \
+                        self._denominators[attacker, target_kind]
+                    cells[games, HP, r_index, target] -= damage
+
+                    killed = cells[games, HP, r_index, target] <= 0
+                    self._reward(games[killed], r_index, target[killed])
+
+                    # Units such as cannons may knock the enemy back by a
+                    # cell.
+                    knocked = ~killed & self._knockback[attacker] & (
+                        target + 1 < columns)
+                    games, target = games[knocked], target[knocked]
+                    knocked = (cells[games, TYPE, r_index, target + 1] == EMPTY) & (
+                        rng.random(games.size) < 0.5)
+                    self._move(games[knocked], r_index,
+                               target[knocked], target[knocked] + 1)
+
+                # Advances the enemies. Columns left of the field wrap
+                # around to its end, as they do in the engine.
+                games = occupied[cells[occupied, TYPE,
+                                       r_index, c_index] == ENEMY]
+                if not games.size:
+                    continue
+                moves = cells[games, MOVES, r_index, c_index]
+                resulting_col = c_index - moves
+                defended = np.zeros(games.size, dtype=bool)
+                for passed in range(1, self._max_moves + 1):
+                    defended |= (passed <= moves) & (
+                        cells[games, TYPE, r_index, (c_index - passed) % columns] == PLAYER)
+                lost = (resulting_col < 0) & ~defended
+                self.outcome[games[lost]] = LOSS
+                advancing[games[lost]] = False
+                games, resulting_col = games[~lost], resulting_col[~lost] % columns
+
+                damage = rng.integers(cells[games, MIN_DAMAGE, r_index, c_index],
+                                      cells[games, MAX_DAMAGE, r_index, c_index] + 1)
+                ahead_col = (c_index - 1) % columns
+                blocked_by_player = cells[games, TYPE,
+                                          r_index, ahead_col] == PLAYER
+                target = np.where(blocked_by_player,
+                                  ahead_col, resulting_col)
+                blocked = blocked_by_player | (
+                    cells[games, TYPE, r_index, resulting_col] != EMPTY)
+                self._move(games[~blocked], r_index,
+                           c_index, resulting_col[~blocked])
+
+                games, target, resulting_col, damage = games[blocked], target[
+                    blocked], resulting_col[blocked], damage[blocked]
+                mined = self._detonates[cells[games, KIND, r_index, target]]
+                self._detonate(games[mined], r_index, target[mined], c_index)
+
+                games, target, resulting_col, damage = games[~mined], target[
+                    ~mined], resulting_col[~mined], damage[~mined]
+                cells[games, HP, r_index, target] -= damage
+                killed = cells[games, HP, r_index, target] <= 0
+                self._move(games[killed], r_index,
+                           c_index, resulting_col[killed])
+
+    def _move(self, games: np.ndarray, row: int, source, destination):
+        """Moves the entity in a cell to another cell in the same row in
+        the given games, leaving the source cell empty."""
+        if not games.size:
+            return
+        self.cells[games, :, row, destination] = self.cells[games, :, row, source]
+        self.cells[games, :, row, source] = 0
+
+    def _reward(self, games: np.ndarray, row: int, column):
+        """Credits the player in the given games for killing the enemy in
+        a cell, and clears the cell."""
+        if not games.size:
+            return
+        reward = self.cells[games, REWARD, row, column]
+        self.variables["gold"][games] += reward
+        self.variables["killed"][games] += 1
+        self.variables["threat_level"][games] += reward
+        self.cells[games, :, row, column] = 0
+
+    def _detonate(self, games: np.ndarray, row: int, column: np.ndarray, catalyst_column: int):
+        """Detonates the mines in a lane of the given games, moving the
+        enemies that set them off onto them and dealing the damage of
+        every mine's area to every enemy in it. See engine.impact_area().
+        """
+        if not games.size:
+            return
+        radius, damage = self._areas[self.cells[games, KIND, row, column]].T
+        self._move(games, row, catalyst_column, column)
+        reach = int(radius.max())
+        for r_index in range(max(row - reach, 0), min(row + reach + 1, self.rows)):
+            for c_offset in range(-reach, reach + 1):
+                c = column + c_offset
+                inside = (c >= 0) & (c < self.columns) & (abs(r_index - row) <= radius) & (abs(c_offset) <= radius)
+                g, c, d = games[inside], c[inside], damage[inside]
+                hit = self.cells[g, TYPE, r_index, c] == ENEMY
+                g, c, d = g[hit], c[hit], d[hit]
+                self.cells[g, HP, r_index, c] -= d
+                killed = self.cells[g, HP, r_index, c] <= 0
+                self._reward(g[killed], r_index, c[killed])
+
+    def _spawn_enemies(self, mask: np.ndarray):
+        """Spawns a random enemy at the end of a random lane in the games
+        given by a mask, where the cell is free. See engine.spawn_enemy().
+        """
+        games = np.flatnonzero(mask)
+        if not games.size:
+            return
+        template = self.rng.integers(0, len(self._enemies), games.size)
+        row = self.rng.integers(0, self.rows, games.size)
+        free = self.cells[games, TYPE, row, self.columns - 1] == EMPTY
+        games, template, row = games[free], template[free], row[free]
+        spawned = self._spawns[self._enemies[template]]
+        spawned[:, HP] = spawned[:, MAX_HP] = self.enemy_health[games, template]
+        self.cells[games, :, row, self.columns - 1] = spawned
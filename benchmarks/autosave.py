@@ -0,0 +1,111 @@
+# Benchmark for how long saving holds up the game
+#
+# Compares the time the game waits when saving a large board straight
+# to disk (with the file flushed and renamed, as autosave.write_atomic()
+# does) against the time it waits when handing the save to the
+# Autosaver, which only takes a snapshot of the game and copies the rows
+# of its field, and turns it into a save file and writes it on a
+# background thread.
+#
+# First checks that a save reads back as the game was when it was
+# queued, though the game carries on before the thread gets to it, with
+# snapshots taken, restored and released on top of the save's own (as
+# undoing actions and the advisor's rollouts do), on dense and sparse
+# fields.
+#
+# Run with `python3 benchmarks/autosave.py`.
+
+import io
+import os
+import random
+import tempfile
+import time
+
+from boards import crowded_game, random_action
+
+import autosave
+import engine
+import savefile
+
+ROWS, COLUMNS, DENSITY, SAVES = 500, 500, 0.3, 10
+CHECKED_SAVES, CHECKED_ACTIONS = 20, 4
+
+
+def check_pending_saves(directory: str) -> int:
+    """Saves games, and plays on before the thread gets to every save,
+    checking every save reads back as the game was when it was queued.
+
+    Returns:
+        int: The number of saves checked.
+    """
+    file_name, saves = os.path.join(directory, "pending.ddc"), 0
+    for sparse in [False, True]:
+        state = crowded_game(30, 30, density=0.3, seed=3)
+        if sparse:
+            buffer = io.BytesIO()
+            savefile.write_compact(state, buffer)
+            state = savefile.read_compact(io.BytesIO(buffer.getvalue()), sparse=True)
+        state.variables["target"] = 10 ** 9
+        autosaver, rng, points = autosave.Autosaver(), random.Random(1), []
+        for _ in range(CHECKED_SAVES):
+            if state.outcome is not None:
+                break
+            expected = io.BytesIO()
+            savefile.write_compact(state, expected)
+            # Holding the Autosaver's lock keeps its thread from taking
+            # the save until the game has moved on.
+            with autosaver._condition:
+                autosaver.save(state, file_name)
+                for _ in range(CHECKED_ACTIONS):
+                    if state.outcome is not None:
+                        break
+                    points.append(engine.snapshot(state))
+                    engine.step(state, random_action(state, rng))
+                    # A rollout, played and undone on top of the rest.
+                    rollout = engine.snapshot(state, random_state=False)
+                    if state.outcome is None:
+                        engine.step(state, engine.EndTurn())
+                    engine.restore(state, rollout)
+                if len(points) > 2:
+                    engine.restore(state, points.pop())
+                    engine.release(state, points.pop(0))
+            assert autosaver.flush() is None
+            with open(file_name, "rb") as file:
+                assert file.read() == expected.getvalue(), "Save {} was not the game as it was saved".format(saves)
+            saves += 1
+        for point in reversed(points):
+            engine.release(state, point)
+        assert not state.undo_log
+    return saves
+
+
+if __name__ == "__main__":
+    state = crowded_game(ROWS, COLUMNS, density=DENSITY, seed=1)
+    with tempfile.TemporaryDirectory() as directory:
+        print("Checked {} saves made while the game played on.\n".format(check_pending_saves(directory)))
+        file_name = os.path.join(directory, "autosave.ddc")
+
+        blocking = []
+        for _ in range(SAVES):
+            start = time.perf_counter()
+            buffer = io.BytesIO()
+            savefile.write_compact(state, buffer)
+            autosave.write_atomic(buffer.getvalue(), file_name)
+            blocking.append(time.perf_counter() - start)
+
+        autosaver, background = autosave.Autosaver(), []
+        for _ in range(SAVES):
+            start = time.perf_counter()
+            autosaver.save(state, file_name)
+            background.append(time.perf_counter() - start)
+            # Leaves the thread time to write, as the player would while
+            # choosing their next action.
+            autosaver.flush()
+        assert autosaver.flush() is None
+
+    print("Saving a {}x{} board ({} saves)".format(ROWS, COLUMNS, SAVES))
+    print("{:>12} {:>12} {:>12}".format("Mode", "Median (ms)", "Max (ms)"))
+    for name, times in [("blocking", blocking), ("background", background)]:
+        times.sort()
+        print("{:>12} {:>12.1f} {:>12.1f}".format(
+            name, times[len(times) // 2] * 1000, times[-1] * 1000))
@@ -0,0 +1,108 @@
+# Benchmark for batches of games played in lockstep
+#
+# First checks that GameBatch.advance() leaves exactly the same fields,
+# variables and outcome as engine.advance_entities(), on random boards
+# where every unit does a fixed amount of damage (so that the different
+# random number generators do not matter) and without cannons (whose
+# knockback is random). Then plays batches of increasing size, ending
+# every turn and starting over finished games, and reports the game-turns
+# played per second against playing one game at a time with the engine.
+#
+# Run with `python3 benchmarks/batched_games.py`. Needs NumPy.
+
+import copy
+import random
+import time
+
+import numpy as np
+from boards import crowded_game
+
+import batch
+import engine
+
+SECONDS = 2
+
+
+def check_equivalence(boards: int) -> int:
+    """Advances random boards with both the engine and a batch, and
+    compares them.
+
+    Returns:
+        int: The number of boards compared.
+    """
+    rng = random.Random(0)
+    for board in range(boards):
+        rows, columns = rng.randint(1, 8), rng.randint(2, 14)
+        state = crowded_game(rows, columns, density=rng.random() * 0.7, seed=board,
+                             enemy_columns=rng.randint(1, columns))
+        state.variables["turn"] = rng.randint(1, 4)
+        for r_index, row in enumerate(state.field):
+            for c_index, entity in enumerate(row):
+                if entity is None:
+                    continue
+                if entity.id == "CANON":
+                    engine.put_entity(state, r_index, c_index, None)
+                    continue
+                entity.min_damage = entity.max_damage = rng.randint(
+                    entity.min_damage, entity.max_damage)
+                entity.current_health = rng.randint(1, entity.health)
+
+        # The second game is left alone, to check that games outside
+        # the mask are not touched.
+        expected = copy.deepcopy(state)
+        engine.advance_entities(expected, [])
+        games = batch.GameBatch.from_states([state, copy.deepcopy(state)], seed=board)
+        games.advance(np.array([True, False]))
+        advanced, untouched = games.to_state(0), games.to_state(1)
+        assert (advanced.field == expected.field and advanced.variables == expected.variables
+                and advanced.outcome == expected.outcome and untouched.field == state.field), \
+            "The batch differs from the engine on board {}".format(board)
+    return boards
+
+
+def batch_rate(size: int) -> float:
+    """Ends turns in a batch of default games for a few seconds,
+    starting over the games that finish.
+
+    Returns:
+        float: The game-turns played per second.
+    """
+    games = batch.GameBatch(size, seed=0)
+    games.begin_turn()
+    turns, start = 0, time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        before = games.variables["turn"].copy()
+        games.step(batch.END_TURN)
+        turns += int((games.variables["turn"] != before).sum())
+        games.reset(games.outcome != batch.PLAYING)
+    return turns / (time.perf_counter() - start)
+
+
+def engine_rate() -> float:
+    """Ends turns of one default game at a time with the engine for a
+    few seconds, starting over the games that finish.
+
+    Returns:
+        float: The game-turns played per second.
+    """
+    state = engine.new_game(seed=0)
+    engine.begin_turn(state)
+    turns, start = 0, time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        engine.step(state, engine.EndTurn())
+        turns += 1
+        if state.outcome is not None:
+            state = engine.new_game(seed=turns)
+            engine.begin_turn(state)
+    return turns / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print("Compared {} boards; the batch and the engine agree.".format(check_equivalence(2000)))
+
+    baseline = engine_rate()
+    print("\n{:>10} {:>16} {:>8}".format("Games", "Game-turns/sec", "Speedup"))
+    print("{:>10} {:>16.0f} {:>7.1f}x".format("engine", baseline, 1))
+    for size in [1, 100, 1000, 10000]:
+        rate = batch_rate(size)
+        print("{:>10} {:>16.0f} {:>7.1f}x".format(size, rate, rate / baseline))
@@ -0,0 +1,61 @@
+# Board fixtures shared by the benchmarks
+#
+# Builds games on boards of any size, filled with units at a given
+# density: defense units on the player's half, enemies on the other.
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine
+
+
+def crowded_game(rows: int, columns: int, density=0.3, seed=0, enemy_columns=None, sparse=False) -> engine.GameState:
+    """Creates a game with a field randomly filled with units.
+
+    Parameters:
+        rows (int): The number of rows of the field.
+        columns (int): The number of columns of the field.
+        density (float): The chance of any one cell holding a unit.
+        seed (int): The seed deciding which units go where.
+        enemy_columns (int): The number of columns at the end of the
+        field that enemies are placed in. Defaults to the enemy's half.
+        sparse (bool): Whether the field only keeps its occupied cells;
+        see engine.new_field().
+
+    Returns:
+        GameState: The game, at turn 1 with plenty of gold.
+    """
+    rng = random.Random(seed)
+    variables = dict(engine.GAME_VARIABLES, rows=rows,
+                     columns=columns, turn=1, gold=10 ** 9, target=10 ** 9)
+    state = engine.new_game(variables, sparse=sparse)
+    if enemy_columns is None:
+        enemy_columns = columns - columns // 2
+    for r_index in range(rows):
+        for c_index in range(columns):
+            if rng.random() >= density:
+                continue
+            if c_index < columns // 2:
+                engine.spawn_entity(state, rng.choice(
+                    state.characters["player"]), "player", (r_index, c_index), [])
+            elif c_index >= columns - enemy_columns:
+                engine.spawn_entity(state, rng.choice(
+                    state.characters["enemy"]), "enemy", (r_index, c_index), [])
+    return state
+
+
+def random_action(state: engine.GameState, rng: random.Random) -> engine.Action:
+    """Picks a random action for the player, favouring buying units."""
+    rows, user_columns = state.variables["rows"], state.variables["columns"] // 2
+    position = (rng.randrange(rows), rng.randrange(user_columns))
+    roll = rng.random()
+    if roll < 0.5:
+        return engine.Buy(rng.choice(state.characters["player"])["id"], *position)
+    elif roll < 0.6:
+        return engine.Upgrade(*position)
+    elif roll < 0.7:
+        return engine.Heal(*position)
+    return engine.EndTurn()
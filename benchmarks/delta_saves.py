@@ -0,0 +1,69 @@
+# Benchmark for autosaving with the journal instead of full saves
+#
+# Plays turns on a crowded board, saving after every turn, once by
+# writing a full compact save and once by recording the turn in a
+# journal. Reports the time and bytes written per turn, the time taken
+# to load the game back from the journal, and checks the loaded game
+# matches the one played.
+#
+# Run with `python3 benchmarks/delta_saves.py`.
+
+import copy
+import io
+import os
+import tempfile
+import time
+
+from boards import crowded_game
+
+import engine
+import journal
+import savefile
+
+# A board full of defenses, with a wave of enemies in the last few
+# columns.
+ROWS, COLUMNS, DENSITY, ENEMY_COLUMNS, TURNS = 500, 500, 0.3, 4, 40
+
+
+if __name__ == "__main__":
+    state = crowded_game(ROWS, COLUMNS, density=DENSITY,
+                         seed=1, enemy_columns=ENEMY_COLUMNS)
+
+    # Full saves after every turn.
+    full_state, full_times, full_bytes = copy.deepcopy(state), [], 0
+    full_state.rng.seed(1)
+    for _ in range(TURNS):
+        engine.step(full_state, engine.EndTurn())
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+        savefile.write_compact(full_state, buffer)
+        full_times.append(time.perf_counter() - start)
+        full_bytes += len(buffer.getvalue())
+
+    # The journal, with a checkpoint at the start only.
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "autosave.ddj")
+        state.rng.seed(1)
+        game_journal = journal.Journal(
+            file_name, state, checkpoint_every=TURNS + 1)
+        checkpoint_bytes, journal_times = os.path.getsize(file_name), []
+        for _ in range(TURNS):
+            engine.step(state, engine.EndTurn())
+            start = time.perf_counter()
+            game_journal.record(state, engine.EndTurn())
+            journal_times.append(time.perf_counter() - start)
+        game_journal.close()
+        journal_bytes = os.path.getsize(file_name) - checkpoint_bytes
+
+        start = time.perf_counter()
+        loaded = journal.load(file_name)
+        load_time = time.perf_counter() - start
+        assert loaded.field == state.field and loaded.field == full_state.field
+
+    print("{} turns on a {}x{} board".format(TURNS, ROWS, COLUMNS))
+    print("{:>10} {:>14} {:>16}".format("Autosave", "Per turn (ms)", "Per turn (KiB)"))
+    for name, times, size in [("full", full_times, full_bytes), ("journal", journal_times, journal_bytes)]:
+        print("{:>10} {:>14.2f} {:>16.1f}".format(
+            name, sum(times) / TURNS * 1000, size / TURNS / 1024))
+    print("\nJournal checkpoint: {:.1f} KiB; loading the journal: {:.1f} ms".format(
+        checkpoint_bytes / 1024, load_time * 1000))
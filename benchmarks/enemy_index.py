@@ -0,0 +1,119 @@
+# Benchmark for the enemy index
+#
+# Times the three questions the engine asks about enemies on a 100x500
+# board, both by scanning the field (as the engine used to) and through
+# the per-lane enemy index, then times whole turns with the index and
+# checks that the index still matches the field afterwards.
+#
+# Run with `python3 benchmarks/enemy_index.py`.
+
+import copy
+import time
+from bisect import bisect_right
+
+from boards import crowded_game
+
+import engine
+
+ROWS, COLUMNS = 100, 500
+
+
+def best_time(function, repeats=5) -> float:
+    """Returns the best time of a few calls to a function, in seconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def any_enemies_by_scan(state: engine.GameState) -> bool:
+    for row in state.field:
+        for cell in row:
+            if cell is not None and cell.type == "enemy":
+                return True
+    return False
+
+
+def targets_by_scan(state: engine.GameState) -> list:
+    """Finds the first enemy ahead of every archer and cannon by probing
+    the lane cell by cell."""
+    targets = []
+    for row in state.field:
+        for c_index, cell in enumerate(row):
+            if cell is not None and cell.id in ["ARCHR", "CANON"]:
+                for ahead_col in range(c_index + 1, len(row)):
+                    if row[ahead_col] is not None and row[ahead_col].type == "enemy":
+                        targets.append(ahead_col)
+                        break
+    return targets
+
+
+def targets_by_index(state: engine.GameState) -> list:
+    """Finds the first enemy ahead of every archer and cannon with a
+    binary search of the lane's enemy index."""
+    targets = []
+    for row, enemies in zip(state.field, state.enemy_lanes):
+        for c_index, cell in enumerate(row):
+            if cell is not None and cell.id in ["ARCHR", "CANON"]:
+                index = bisect_right(enemies, c_index)
+                if index < len(enemies):
+                    targets.append(enemies[index])
+    return targets
+
+
+def enemy_cells_by_scan(state: engine.GameState) -> int:
+    return sum(1 for row in state.field for cell in row if cell is not None and cell.type == "enemy")
+
+
+def enemy_cells_by_index(state: engine.GameState) -> int:
+    return sum(1 for row, enemies in zip(state.field, state.enemy_lanes) for c_index in enemies if row[c_index])
+
+
+def play_turn(state: engine.GameState):
+    """Plays out a turn as step() does, without the player's action."""
+    events = []
+    engine.advance_entities(state, events)
+    engine.spawn_enemy(state, events)
+    engine.enhance_enemies(state, events)
+
+
+if __name__ == "__main__":
+    print("{}x{} board".format(ROWS, COLUMNS))
+    print("{:>8} {:>26} {:>10} {:>10} {:>8}".format(
+        "Enemies", "Query", "Scan (ms)", "Index (ms)", "Speedup"))
+    for enemies, enemy_columns in [("half", COLUMNS - COLUMNS // 2), ("front", COLUMNS // 10)]:
+        state = crowded_game(ROWS, COLUMNS, density=0.3,
+                             seed=1, enemy_columns=enemy_columns)
+        empty_state = engine.new_game(dict(state.variables))
+        assert targets_by_scan(state) == targets_by_index(state)
+        for query, scan, index in [
+            ("Any enemies? (empty field)", lambda: any_enemies_by_scan(empty_state),
+             lambda: empty_state.enemy_count == 0),
+            ("Every enemy (enhance)", lambda: enemy_cells_by_scan(state),
+             lambda: enemy_cells_by_index(state)),
+            ("Nearest enemy ahead", lambda: targets_by_scan(state),
+             lambda: targets_by_index(state)),
+        ]:
+            scan_time, index_time = best_time(scan), best_time(index)
+            print("{:>8} {:>26} {:>10.2f} {:>10.2f} {:>7.1f}x".format(
+                enemies, query, scan_time * 1000, index_time * 1000, scan_time / index_time))
+
+    # Most enemies die in the first turn on these boards, so every turn
+    # is played from a fresh copy of the board.
+    print("\n{:>8} {:>12} {:>10}".format("Enemies", "Turn (ms)", "Index ok"))
+    for enemies, enemy_columns in [("half", COLUMNS - COLUMNS // 2), ("front", COLUMNS // 10)]:
+        board = crowded_game(ROWS, COLUMNS, density=0.3,
+                             seed=1, enemy_columns=enemy_columns)
+        times = []
+        for repeat in range(5):
+            state = copy.deepcopy(board)
+            state.rng.seed(repeat)
+            start = time.perf_counter()
+            play_turn(state)
+            times.append(time.perf_counter() - start)
+        rebuilt = engine.GameState(
+            state.field, state.variables, state.characters)
+        print("{:>8} {:>12.2f} {:>10}".format(enemies, min(times) * 1000,
+              str(rebuilt.enemy_lanes == state.enemy_lanes and rebuilt.enemy_count == state.enemy_count)))
@@ -0,0 +1,64 @@
+# Benchmark for the memory and speed of entities on a crowded board
+#
+# Measures how much memory a unit takes as an Entity compared to the
+# dict the game used to keep for it (the same dict saved games hold),
+# then times a turn on a crowded 100x500 board.
+#
+# Run with `python3 benchmarks/entities.py`.
+
+import copy
+import time
+import tracemalloc
+
+from boards import crowded_game
+
+import engine
+
+ROWS, COLUMNS, DENSITY = 100, 500, 0.9
+
+
+def traced_size(build) -> int:
+    """Measures the memory taken by whatever a function builds.
+
+    Returns:
+        int: The number of bytes allocated and still held.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del built
+    return size
+
+
+def play_turn(state: engine.GameState):
+    """Plays out a turn as step() does, without the player's action."""
+    events = []
+    engine.advance_entities(state, events)
+    engine.spawn_enemy(state, events)
+    engine.enhance_enemies(state, events)
+
+
+if __name__ == "__main__":
+    state = crowded_game(ROWS, COLUMNS, density=DENSITY, seed=1)
+    units = [cell for row in state.field for cell in row if cell is not None]
+
+    entity_size = traced_size(lambda: [copy.copy(unit) for unit in units])
+    dict_size = traced_size(lambda: [unit.to_dict() for unit in units])
+    print("{} units on a {}x{} board".format(len(units), ROWS, COLUMNS))
+    print("{:>8} {:>12} {:>10}".format("Unit", "Total (MiB)", "Per unit"))
+    for name, size in [("dict", dict_size), ("Entity", entity_size)]:
+        print("{:>8} {:>12.1f} {:>8} B".format(
+            name, size / 2 ** 20, size // len(units)))
+
+    # Every turn is played from a fresh copy of the board, as most
+    # enemies die in the first turn.
+    times = []
+    for repeat in range(5):
+        turn_state = copy.deepcopy(state)
+        turn_state.rng.seed(repeat)
+        start = time.perf_counter()
+        play_turn(turn_state)
+        times.append(time.perf_counter() - start)
+    print("\nTurn: {:.1f} ms".format(min(times) * 1000))
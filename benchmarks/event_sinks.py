@@ -0,0 +1,50 @@
+# Benchmark for event sinks
+#
+# Times a turn of crowded boards with the events going to each kind of
+# sink: a list (as step() returns them), a NullSink (for which the
+# engine does not create the events of every cell), and the console and
+# JSON lines sinks writing to memory.
+#
+# Run with `python3 benchmarks/event_sinks.py`.
+
+import copy
+import io
+import time
+
+from boards import crowded_game
+
+import engine
+import sinks
+
+REPEATS = 50
+
+SINKS = {
+    "list": list,
+    "null": sinks.NullSink,
+    "console": lambda: sinks.ConsoleSink(io.StringIO()),
+    "jsonl": lambda: sinks.JSONLSink(io.StringIO()),
+}
+
+
+def time_turn(state: engine.GameState, make_sink) -> float:
+    """Times advancing copies of a game with events going to new sinks.
+
+    Returns:
+        float: The best time, in seconds.
+    """
+    best = float("inf")
+    for _ in range(REPEATS):
+        copied, sink = copy.deepcopy(state), make_sink()
+        copied.rng.seed(0)
+        start = time.perf_counter()
+        engine.advance_entities(copied, sink)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    print("{:>9}".format("Board") + "".join(" {:>12}".format("{} (ms)".format(name)) for name in SINKS))
+    for rows, columns in [(5, 7), (20, 40), (50, 200)]:
+        state = crowded_game(rows, columns, density=0.3, seed=1, enemy_columns=columns // 2)
+        print("{:>9}".format("{}x{}".format(rows, columns)) + "".join(
+            " {:>12.3f}".format(time_turn(state, make_sink) * 1000) for make_sink in SINKS.values()))
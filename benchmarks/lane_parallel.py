@@ -0,0 +1,104 @@
+# Benchmark for resolving the lanes of a turn in parallel
+#
+# First checks that games playing by lane rules (see
+# engine.advance_lanes()) resolved by lanes.LaneResolver over worker
+# processes play out exactly as they do with engine.step() alone: the
+# same events (with and without a listening sink), fields, variables,
+# outcome and random state, over many turns of randomly played games,
+# on dense and sparse fields. Then times a turn on crowded boards with
+# more and more lanes, resolved by engine.advance_lanes() and by the
+# workers, and reports the speedup of each number of workers over the
+# engine. With a single CPU the workers can only be slower; they need
+# as many CPUs as workers.
+#
+# Run with `python3 benchmarks/lane_parallel.py`.
+
+import copy
+import os
+import random
+import time
+
+from boards import crowded_game, random_action
+
+import engine
+import lanes
+
+COLUMNS, DENSITY, REPEATS = 40, 0.3, 3
+LANE_COUNTS = [100, 1000, 4000]
+WORKERS = [2, 4]
+CHECKED_GAMES, CHECKED_TURNS = 30, 40
+
+
+class QuietEvents(list):
+    """Keeps the events made even for a sink that is not listening."""
+    listening = False
+
+
+def check_games(resolver: lanes.LaneResolver) -> int:
+    """Plays random games with and without the resolver and compares
+    them after every action.
+
+    Returns:
+        int: The number of actions compared.
+    """
+    actions = 0
+    for seed in range(CHECKED_GAMES):
+        rng = random.Random(seed)
+        state = crowded_game(rng.randint(1, 12), rng.randint(4, 16), density=rng.random() * 0.6, seed=seed,
+                             sparse=seed % 3 == 0)
+        state.variables.update(gold=rng.randint(0, 200), target=10 ** 9)
+        state.rng.seed(seed)
+        state.lane_rules = True
+        resolved = copy.deepcopy(state)
+        resolved.resolver = resolver
+        listening = seed % 2 == 0
+        while state.outcome is None and state.variables["turn"] < CHECKED_TURNS:
+            action = random_action(state, rng)
+            expected, events = (engine.step(state, action), engine.step(resolved, action)) if listening else \
+                (engine.step(state, action, QuietEvents()), engine.step(resolved, action, QuietEvents()))
+            assert (events, resolved.field, resolved.variables, resolved.outcome, resolved.rng.getstate()) == \
+                (expected, state.field, state.variables, state.outcome, state.rng.getstate()), \
+                "The lanes differ from the engine in game {} after {}".format(seed, action)
+            actions += 1
+    return actions
+
+
+def timed(state: engine.GameState, resolve) -> tuple:
+    """Times a turn on fresh copies of a game.
+
+    Returns:
+        tuple: The shortest time taken, in seconds, and the game after
+        the last turn.
+    """
+    times = []
+    for repeat in range(REPEATS):
+        copied = copy.deepcopy(state)
+        copied.rng.seed(repeat)
+        start = time.perf_counter()
+        resolve(copied, [])
+        times.append(time.perf_counter() - start)
+    return min(times), copied
+
+
+if __name__ == "__main__":
+    resolvers = {workers: lanes.LaneResolver(workers, min_entities=0) for workers in WORKERS}
+    print("Compared {} actions; the lanes and the engine agree.\n".format(
+        sum(check_games(resolver) for resolver in resolvers.values())))
+
+    print("{} CPUs; {} columns at a density of {}".format(os.cpu_count(), COLUMNS, DENSITY))
+    print("{:>6} {:>12}".format("Lanes", "Engine (ms)") +
+          "".join("{:>18}".format("{} workers (ms)".format(workers)) for workers in WORKERS) +
+          "".join("{:>10}".format("x{}".format(workers)) for workers in WORKERS))
+    for lane_count in LANE_COUNTS:
+        state = crowded_game(lane_count, COLUMNS, density=DENSITY, seed=1)
+        state.lane_rules = True
+        engine_time, expected = timed(state, engine.advance_lanes)
+        times = {}
+        for workers, resolver in resolvers.items():
+            times[workers], resolved = timed(state, resolver)
+            assert (resolved.field, resolved.variables) == (expected.field, expected.variables)
+        print("{:>6} {:>12.1f}".format(lane_count, engine_time * 1000) +
+              "".join("{:>18.1f}".format(times[workers] * 1000) for workers in WORKERS) +
+              "".join("{:>10.2f}".format(engine_time / times[workers]) for workers in WORKERS))
+    for resolver in resolvers.values():
+        resolver.close()
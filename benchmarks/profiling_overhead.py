@@ -0,0 +1,39 @@
+# Benchmark for the cost of profiling
+#
+# Plays the same simulated games without profiling and then with it,
+# reporting how much slower timing every phase makes a game, and the
+# timings themselves.
+#
+# Run with `python3 benchmarks/profiling_overhead.py`.
+
+import time
+
+import boards  # noqa: F401 (puts the game on the path)
+
+import profiling
+import simulate
+
+GAMES = 500
+
+
+def play(configuration: dict) -> float:
+    """Plays the games.
+
+    Returns:
+        float: The time taken, in seconds.
+    """
+    start = time.perf_counter()
+    for seed in range(GAMES):
+        simulate.play_game(configuration, "defend", seed, 1000)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    configuration = simulate.build_configuration("default")
+    play(configuration)
+    disabled = min(play(configuration) for _ in range(3))
+    profiling.enable()
+    enabled = min(play(configuration) for _ in range(3))
+    print("{} games: {:.3f} s without profiling, {:.3f} s with it ({:+.1f}%).\n".format(
+        GAMES, disabled, enabled, (enabled / disabled - 1) * 100))
+    print(profiling.report())
@@ -0,0 +1,132 @@
+# Benchmark for drawing the field
+#
+# Compares drawing the field with a print() for every cell, border and
+# label (as the game used to) against a FieldRenderer building the frame
+# and writing it at once, counting the writes and bytes of each frame
+# and timing them. Also reports the characters written to redraw the
+# field after a turn in ANSI mode, where only the cells that changed are
+# rewritten, against the characters of a whole frame. Finally, times
+# drawing only the window of the field that fits in an 80x24 terminal.
+#
+# Run with `python3 benchmarks/rendering.py`.
+
+import contextlib
+import os
+import time
+
+from boards import crowded_game
+
+import engine
+import render
+
+REPEATS = 20
+
+
+class CountingOutput:
+    """A stand-in for the terminal that counts what is written to it."""
+
+    def __init__(self):
+        self.writes = self.characters = 0
+
+    def write(self, text: str):
+        self.writes += 1
+        self.characters += len(text)
+
+    def flush(self):
+        pass
+
+    def fileno(self) -> int:
+        return 1
+
+
+def print_field(state: engine.GameState):
+    """Draws the field the way the game used to, with a print() for
+    every part of it."""
+    variables = state.variables
+    print(" ", end="")
+    for column in range(variables["columns"] // 2):
+        print(" {:^5}".format(column + 1), end="")
+    print()
+    for row in range(variables["rows"] + 1):
+        print(" ", end="")
+        print("+-----" * variables["columns"] + "+")
+        if row < variables["rows"]:
+            print("{}".format(chr(65 + row)), end="")
+            for row_line in range(2):
+                if row_line == 1:
+                    print(" ", end="")
+                for col in range(variables["columns"]):
+                    cell, value = state.field[row][col], ""
+                    if cell is not None and row_line == 0:
+                        value = cell.id
+                    elif cell is not None and row_line == 1:
+                        value = str(cell.current_health) + "/" + str(cell.health)
+                    print("|{:^5}".format(value), end="")
+                print("|", end="\n" if row_line == 0 else "")
+            print()
+
+
+def measure(draw) -> tuple:
+    """Draws a frame a number of times.
+
+    Returns:
+        tuple: The writes and characters of a frame, and the best time
+        of a frame, in seconds.
+    """
+    best = float("inf")
+    for _ in range(REPEATS):
+        output = CountingOutput()
+        start = time.perf_counter()
+        draw(output)
+        best = min(best, time.perf_counter() - start)
+    return output.writes, output.characters, best
+
+
+def print_frame(state: engine.GameState, output: CountingOutput):
+    with contextlib.redirect_stdout(output):
+        print_field(state)
+
+
+def render_frame(renderer: render.FieldRenderer, state: engine.GameState, output: CountingOutput):
+    renderer.output = output
+    renderer.draw(state)
+
+
+def ansi_turn(state: engine.GameState) -> int:
+    """Plays a turn of a game in ANSI mode.
+
+    Returns:
+        int: The characters written to redraw the field after the turn.
+    """
+    output = CountingOutput()
+    renderer = render.FieldRenderer(ansi=True, output=output)
+    renderer.draw(state)
+    engine.step(state, engine.EndTurn())
+    output.characters = 0
+    renderer.draw(state)
+    return output.characters
+
+
+if __name__ == "__main__":
+    # The renderer draws whole frames unless it is writing to a terminal
+    # big enough to keep the field in place.
+    os.get_terminal_size = lambda *_: os.terminal_size((10000, 10000))
+
+    print("{:>9} {:>14} {:>14} {:>12} {:>12} {:>8} {:>11}".format(
+        "Board", "Print writes", "Render writes", "Print (ms)", "Render (ms)", "Speedup", "ANSI chars"))
+    for rows, columns in [(5, 7), (20, 40), (50, 200)]:
+        state = crowded_game(rows, columns, density=0.3, seed=1)
+        print_writes, characters, print_time = measure(lambda output: print_frame(state, output))
+        renderer = render.FieldRenderer()
+        render_writes, _, render_time = measure(lambda output: render_frame(renderer, state, output))
+        print("{:>9} {:>14} {:>14} {:>12.3f} {:>12.3f} {:>7.1f}x {:>5}/{:<5}".format(
+            "{}x{}".format(rows, columns), print_writes, render_writes, print_time * 1000, render_time * 1000,
+            print_time / render_time, ansi_turn(state), characters))
+
+    os.get_terminal_size = lambda *_: os.terminal_size((80, 24))
+    print("\n{:>9} {:>14} {:>16}".format("Board", "Window (ms)", "Window chars"))
+    for rows, columns in [(5, 7), (50, 200), (500, 500)]:
+        state = crowded_game(rows, columns, density=0.3, seed=1)
+        renderer = render.FieldRenderer(viewport=True)
+        _, characters, window_time = measure(lambda output: render_frame(renderer, state, output))
+        print("{:>9} {:>14.3f} {:>16}".format("{}x{}".format(rows, columns), window_time * 1000, characters))
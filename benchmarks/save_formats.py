@@ -0,0 +1,68 @@
+# Benchmark for saving and loading games in both save file formats
+#
+# Saves and loads boards of growing size in the text format (.dd) and
+# the compact format (.ddc), reporting the time taken and the size of
+# the file, and checks that both formats restore the same field.
+#
+# Run with `python3 benchmarks/save_formats.py`.
+
+import os
+import tempfile
+import time
+
+from boards import crowded_game
+
+import savefile
+
+BOARDS = [(5, 7, 0.3), (50, 200, 0.3), (500, 500, 0.05), (500, 500, 0.3)]
+
+
+def timed(function) -> tuple:
+    """Runs a function and times it.
+
+    Returns:
+        tuple: The result of the function and the seconds taken.
+    """
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def save_and_load(state, path: str, compact: bool) -> tuple:
+    """Saves a game to a file and loads it back.
+
+    Returns:
+        tuple: The loaded game, the seconds taken to save and to load,
+        and the size of the file in bytes.
+    """
+    def save():
+        with open(path, "wb" if compact else "w") as file:
+            (savefile.write_compact if compact else savefile.write_text)(
+                state, file)
+
+    def load():
+        if compact:
+            with open(path, "rb") as file:
+                return savefile.read_compact(file)
+        with open(path, "r") as file:
+            return savefile.read_text(file.readlines(), state.variables)[0]
+
+    _, save_time = timed(save)
+    loaded, load_time = timed(load)
+    return loaded, save_time, load_time, os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    print("{:>12} {:>8} {:>8} {:>10} {:>10} {:>12}".format(
+        "Board", "Density", "Format", "Save (ms)", "Load (ms)", "Size (KiB)"))
+    with tempfile.TemporaryDirectory() as directory:
+        for rows, columns, density in BOARDS:
+            state = crowded_game(rows, columns, density=density, seed=1)
+            for name, compact in [("text", False), ("compact", True)]:
+                path = os.path.join(directory, "saved_game.dd" + "c" * compact)
+                loaded, save_time, load_time, size = save_and_load(
+                    state, path, compact)
+                assert loaded.field == state.field, "{} save differs".format(name)
+                print("{:>12} {:>8} {:>8} {:>10.1f} {:>10.1f} {:>12.1f}".format(
+                    "{}x{}".format(rows, columns), density, name,
+                    save_time * 1000, load_time * 1000, size / 1024))
@@ -0,0 +1,177 @@
+# Load test for the game server
+#
+# Starts server.py on a Unix socket, opens a number of idle games (which
+# only start a game and wait), then plays a number of games at once,
+# ending turns as fast as the server answers and starting over games
+# that finish. Reports the time from sending a command to receiving the
+# frame it caused (p50 and p99), the turns played per second, and the
+# memory of the server for every idle game. Also checks that a player
+# who stops reading is disconnected rather than having frames pile up in
+# the server's memory.
+#
+# Run with `python3 benchmarks/server_load.py --help` for the options.
+# An address can be given to test a server that is already running, in
+# which case its memory is not reported.
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+
+
+def resident_memory(pid: int) -> int:
+    """Returns the resident memory of a process in bytes, or 0 if it
+    cannot be read (outside Linux)."""
+    try:
+        with open("/proc/{}/status".format(pid), "r") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+async def connect(address: str) -> tuple:
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        reader, writer = await asyncio.open_connection(host, int(port), limit=2 ** 20)
+    else:
+        reader, writer = await asyncio.open_unix_connection(address, limit=2 ** 20)
+    await reader.readuntil(b"\n\n")
+    return reader, writer
+
+
+async def start_game(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, seed: int):
+    writer.write("new {}\n".format(seed).encode())
+    await reader.readuntil(b"\n\n")
+
+
+async def play(address: str, seed: int, deadline: float, latencies: list) -> int:
+    """Ends turns of games until the deadline.
+
+    Returns:
+        int: The number of games finished.
+    """
+    reader, writer = await connect(address)
+    await start_game(reader, writer, seed)
+    finished = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        writer.write(b"end\n")
+        frame = await reader.readuntil(b"\n\n")
+        latencies.append(time.perf_counter() - start)
+        if b"All is lost!" in frame or b"You win!" in frame:
+            finished += 1
+            writer.write(b"leave\n")
+            await reader.readuntil(b"\n\n")
+            await start_game(reader, writer, seed + finished * 100003)
+    writer.close()
+    return finished
+
+
+async def stalled_player(address: str, frames=10000) -> bool:
+    """Plays a game with a second player that never reads what it is
+    sent, until the server has sent it the given number of frames.
+
+    Returns:
+        bool: Whether the server disconnected the second player.
+    """
+    reader, writer = await connect(address)
+    writer.write(b"new\n")
+    game_id = (await reader.readuntil(b"\n\n")).split()[1]
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        stalled = socket.socket(socket.AF_INET)
+        target = (host, int(port))
+    else:
+        stalled, target = socket.socket(socket.AF_UNIX), address
+    # Keeps the frames waiting in the server rather than on the way.
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.setblocking(False)
+    loop = asyncio.get_running_loop()
+    await loop.sock_connect(stalled, target)
+    await loop.sock_sendall(stalled, b"join " + game_id + b"\n")
+    await asyncio.sleep(0.1)
+    # Buying on a taken cell is turned down, which changes nothing in
+    # the game but still sends everyone a frame.
+    for _ in range(frames):
+        writer.write(b"buy archer A1\n")
+        await reader.readuntil(b"\n\n")
+    writer.close()
+    stalled.settimeout(5)
+    try:
+        while stalled.recv(2 ** 16):
+            pass
+        return True
+    except ConnectionError:
+        return True
+    except socket.timeout:
+        return False
+    finally:
+        stalled.close()
+
+
+async def load_test(address: str, idle: int, active: int, seconds: float, pid=None) -> dict:
+    before = resident_memory(pid) if pid else 0
+    idle_connections = []
+    for index in range(idle):
+        reader, writer = await connect(address)
+        await start_game(reader, writer, index)
+        idle_connections.append(writer)
+    after = resident_memory(pid) if pid else 0
+
+    latencies = []
+    start = time.perf_counter()
+    finished = await asyncio.gather(*[play(address, idle + index, start + seconds, latencies)
+                                      for index in range(active)])
+    elapsed = time.perf_counter() - start
+    for writer in idle_connections:
+        writer.close()
+
+    latencies.sort()
+    return {"turns": len(latencies), "turns_per_second": len(latencies) / elapsed, "games_finished": sum(finished),
+            "p50": latencies[len(latencies) // 2], "p99": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+            "memory_per_idle_game": (after - before) / idle if idle and pid else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load tests the Desperate Defenders game server.")
+    parser.add_argument("--idle", type=int, default=2000, help="the number of idle games to keep open")
+    parser.add_argument("--sessions", type=int, default=100, help="the number of games to play at once")
+    parser.add_argument("--seconds", type=float, default=10, help="how long to play for")
+    parser.add_argument("--address", help="the HOST:PORT or Unix socket of a running server to test")
+    arguments = parser.parse_args()
+
+    server, address = None, arguments.address
+    if address is None:
+        directory = tempfile.mkdtemp()
+        address = os.path.join(directory, "server.sock")
+        server = subprocess.Popen([sys.executable, SERVER, "--unix", address], stdout=subprocess.PIPE)
+        server.stdout.readline()
+    try:
+        result = asyncio.run(load_test(address, arguments.idle, arguments.sessions, arguments.seconds,
+                                       server.pid if server else None))
+        dropped = asyncio.run(stalled_player(address))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            os.remove(address)
+            os.rmdir(directory)
+
+    print("Played {} turns in {} games at once ({} games finished), with {} idle games open.".format(
+        result["turns"], arguments.sessions, result["games_finished"], arguments.idle))
+    print("{:.0f} turns/sec; p50 {:.2f} ms, p99 {:.2f} ms.".format(
+        result["turns_per_second"], result["p50"] * 1000, result["p99"] * 1000))
+    if result["memory_per_idle_game"] is not None:
+        print("{:.1f} KB of server memory per idle game.".format(result["memory_per_idle_game"] / 1024))
+    print("A player who stopped reading was {}.".format("disconnected" if dropped else "NOT disconnected"))
+    if not dropped:
+        sys.exit(1)
@@ -0,0 +1,40 @@
+# Benchmark for how simulations scale with worker processes
+#
+# Plays the same games with 1, 2, 4, ... worker processes (up to the
+# number of processors), reporting the games played per second and how
+# close the speedup comes to linear, and checks that every run gives the
+# same results.
+#
+# Run with `python3 benchmarks/simulation.py`.
+
+import os
+import time
+
+import boards  # noqa: F401 (puts the game on the path)
+
+import simulate
+
+GAMES = 2000
+
+
+if __name__ == "__main__":
+    configurations = [simulate.build_configuration("default")]
+    counts, workers = [], 1
+    while workers < (os.cpu_count() or 1):
+        counts.append(workers)
+        workers *= 2
+    counts.append(os.cpu_count() or 1)
+
+    print("{:>8} {:>12} {:>9} {:>11}".format(
+        "Workers", "Games/sec", "Speedup", "Efficiency"))
+    baseline = expected = None
+    for workers in counts:
+        start = time.perf_counter()
+        results = simulate.simulate(configurations, GAMES, workers=workers)
+        rate = GAMES / (time.perf_counter() - start)
+        baseline = baseline or rate
+        expected = expected or results
+        assert results == expected, "results differ with {} workers".format(
+            workers)
+        print("{:>8} {:>12.0f} {:>8.2f}x {:>10.0f}%".format(
+            workers, rate, rate / baseline, rate / baseline / workers * 100))
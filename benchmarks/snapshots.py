@@ -0,0 +1,69 @@
+# Benchmark for snapshots and hashing of games
+#
+# Plays a turn on boards of several sizes and undoes it, once by copying
+# the game beforehand with copy.deepcopy and once with a snapshot (see
+# engine.snapshot()); then hashes the game after every turn, once from
+# scratch and once keeping the hash up to date as the game changes (see
+# engine.state_hash()). Checks both ways give the same result.
+#
+# Run with `python3 benchmarks/snapshots.py`.
+
+import copy
+import time
+
+from boards import crowded_game
+
+import engine
+
+# The boards, as (rows, columns, density, enemy columns), and the turns
+# played on each.
+BOARDS = [(5, 7, 0.4, None), (50, 200, 0.3, 4), (500, 500, 0.3, 4)]
+TURNS = 10
+
+
+def fresh_hash(state: engine.GameState) -> int:
+    """Hashes a game from scratch, as if it had never been hashed."""
+    state.field_hash, state.unhashed_cells = None, {}
+    return engine.state_hash(state)
+
+
+if __name__ == "__main__":
+    print("{:>12} {:>12} {:>14} {:>14} {:>14}".format(
+        "Board", "Copy (ms)", "Snapshot (ms)", "Hash (ms)", "Updated (ms)"))
+    for rows, columns, density, enemy_columns in BOARDS:
+        state = crowded_game(rows, columns, density=density, seed=1, enemy_columns=enemy_columns)
+        state.rng.seed(1)
+        copy_time = snapshot_time = hash_time = updated_time = 0
+
+        for _ in range(TURNS):
+            # Undoing a turn with a copy of the game.
+            start = time.perf_counter()
+            copied = copy.deepcopy(state)
+            engine.step(copied, engine.EndTurn())
+            copied = None
+            copy_time += time.perf_counter() - start
+
+            # Undoing a turn with a snapshot.
+            expected = copy.deepcopy(state)
+            start = time.perf_counter()
+            point = engine.snapshot(state)
+            engine.step(state, engine.EndTurn())
+            engine.restore(state, point)
+            snapshot_time += time.perf_counter() - start
+            assert state.field == expected.field and state.variables == expected.variables
+
+            # Hashing the turn played.
+            engine.step(state, engine.EndTurn())
+            start = time.perf_counter()
+            updated = engine.state_hash(state)
+            updated_time += time.perf_counter() - start
+            hashed = copy.deepcopy(state)
+            start = time.perf_counter()
+            assert fresh_hash(hashed) == updated
+            hash_time += time.perf_counter() - start
+            if state.outcome is not None:
+                break
+
+        print("{:>12} {:>12.2f} {:>14.2f} {:>14.2f} {:>14.2f}".format(
+            "{}x{}".format(rows, columns), copy_time / TURNS * 1000, snapshot_time / TURNS * 1000,
+            hash_time / TURNS * 1000, updated_time / TURNS * 1000))
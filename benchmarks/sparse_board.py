@@ -0,0 +1,76 @@
+# Benchmark for sparse fields on huge, mostly empty boards
+#
+# Builds the same huge board with a few units on it twice, once with
+# every row a list of all its cells and once with sparse rows that only
+# keep their occupied cells (see engine.new_field()). Reports the memory
+# the field takes, and times playing a turn, enhancing the enemies,
+# hashing the game and saving it in the compact format. Checks both
+# boards end the turn alike.
+#
+# Run with `python3 benchmarks/sparse_board.py`.
+
+import copy
+import io
+import time
+import tracemalloc
+
+from boards import crowded_game
+
+import engine
+import savefile
+
+ROWS, COLUMNS, DENSITY, REPEATS = 20, 100000, 0.002, 5
+
+
+def timed(function, state: engine.GameState) -> float:
+    """Times a function on fresh copies of a game, as some change it.
+
+    Returns:
+        float: The shortest time taken, in seconds.
+    """
+    times = []
+    for repeat in range(REPEATS):
+        copied = copy.deepcopy(state)
+        copied.rng.seed(repeat)
+        start = time.perf_counter()
+        function(copied)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def save(state: engine.GameState):
+    savefile.write_compact(state, io.BytesIO())
+
+
+CASES = {
+    "turn": lambda state: engine.step(state, engine.EndTurn()),
+    "enhance": lambda state: engine.enhance_enemies(state, []),
+    "hash": engine.state_hash,
+    "save": save,
+}
+
+
+if __name__ == "__main__":
+    results = {}
+    for sparse in [False, True]:
+        tracemalloc.start()
+        state = crowded_game(ROWS, COLUMNS, density=DENSITY, seed=1, sparse=sparse)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[sparse] = (memory, {name: timed(case, state) for name, case in CASES.items()})
+
+        state.rng.seed(0)
+        engine.step(state, engine.EndTurn())
+        if not sparse:
+            dense_field = state.field
+        else:
+            assert state.field == dense_field
+
+    units = sum(len(engine.occupied_cells(row)) for row in state.field)
+    print("{} units on a {}x{} board".format(units, ROWS, COLUMNS))
+    print("{:>8} {:>12} {:>10} {:>12} {:>10} {:>10}".format(
+        "Field", "Memory (MiB)", "Turn (ms)", "Enhance (ms)", "Hash (ms)", "Save (ms)"))
+    for sparse, (memory, times) in results.items():
+        print("{:>8} {:>12.1f} {:>10.2f} {:>12.2f} {:>10.2f} {:>10.2f}".format(
+            "sparse" if sparse else "dense", memory / 2 ** 20,
+            *[times[name] * 1000 for name in ["turn", "enhance", "hash", "save"]]))
@@ -0,0 +1,109 @@
+# Stress benchmark for the console game loop
+#
+# Drives progress_game() in main.py with a scripted player for a given
+# number of actions (1,000,000 by default) and checks that the call
+# stack stays at a constant depth and memory stays flat throughout.
+# The script only uses actions that do not take a turn (opening a menu
+# and cancelling it), so the game can go on for as long as needed.
+#
+# Run with `python3 benchmarks/stress_loop.py [--actions N]`.
+
+import argparse
+import contextlib
+import gc
+import io
+import itertools
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main
+import engine
+
+# The lines the scripted player types in, three actions at a time:
+# cancelling an upgrade, cancelling a heal and not buying a unit.
+SCRIPT = ["2", "X", "3", "X", "1", "5"]
+
+
+class Finished(Exception):
+    """Raised to stop the game once enough actions have been taken."""
+
+
+def stack_depth() -> int:
+    """Counts the frames on the current call stack."""
+    depth, frame = 0, sys._getframe()
+    while frame is not None:
+        depth, frame = depth + 1, frame.f_back
+    return depth
+
+
+def run(actions: int, samples: int) -> list:
+    """Plays a game of the given number of actions, sampling the stack
+    depth, the number of live objects and the peak resident memory at
+    evenly spaced points.
+
+    Returns:
+        list: The samples, as (action, stack depth, objects, peak KiB)
+        tuples.
+    """
+    lines = itertools.cycle(SCRIPT)
+    every = max(1, actions // samples)
+    taken, readings = 0, []
+    show_stats = main.show_stats
+
+    # show_stats() is called exactly once per action, just before the
+    # player is asked for their choice, so it doubles as the counter.
+    def counted_show_stats(state):
+        nonlocal taken
+        if taken == actions:
+            raise Finished
+        taken += 1
+        if taken % every == 0:
+            readings.append((taken, stack_depth(), len(gc.get_objects()),
+                             resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        show_stats(state)
+
+    main.input = lambda message="": next(lines)
+    main.show_stats = counted_show_stats
+    state = engine.new_game()
+    engine.begin_turn(state)
+    try:
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+            main.progress_game(state)
+    except Finished:
+        pass
+    finally:
+        del main.input
+        main.show_stats = show_stats
+    return readings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stress benchmark for the console game loop.")
+    parser.add_argument("--actions", type=int, default=1000000)
+    parser.add_argument("--samples", type=int, default=20)
+    arguments = parser.parse_args()
+
+    start = time.perf_counter()
+    readings = run(arguments.actions, arguments.samples)
+    elapsed = time.perf_counter() - start
+
+    print("{:>10} {:>6} {:>8} {:>10}".format(
+        "Action", "Depth", "Objects", "Peak KiB"))
+    for reading in readings:
+        print("{:>10} {:>6} {:>8} {:>10}".format(*reading))
+
+    depths = {depth for _, depth, _, _ in readings}
+    print("\n{} actions in {:.1f}s ({:.0f} actions/s)".format(
+        arguments.actions, elapsed, arguments.actions / elapsed))
+    print("Stack depth: {}".format(
+        "constant at {}".format(depths.pop()) if len(depths) == 1 else "varies ({})".format(sorted(depths))))
+    print("Live objects: {} at the first sample, {} at the last".format(
+        readings[0][2], readings[-1][2]))
+    print("Peak memory: {} KiB at the first sample, {} KiB at the last".format(
+        readings[0][3], readings[-1][3]))
@@ -0,0 +1,306 @@
+# Benchmark suite for the hot paths of a turn
+#
+# Times the core functions of the game on a fixed set of boards, with
+# fixed seeds, and compares the times against baselines stored in
+# benchmarks/baselines.json, so that a slowdown in any of them shows up
+# as a number. The boards are the default 7x5 game, a crowded 7x5 one,
+# and crowded 50x200 and 500x500 ones; the cases are:
+# - advance_entities: a whole turn of shooting, attacking and moving;
+# - spawn_enemy: spawning an enemy with the threat level overflowing;
+# - mine and heal: impact_area() for a mine going off and a heal;
+# - draw_field: drawing the whole field to a null stream;
+# - save_load: writing the game in the compact save format and reading
+#   it back;
+# - scripted_game: ten turns of random actions from a fixed seed.
+#
+# Every case is run several times, with the garbage collector off, and
+# its best time is kept. The runs are spread over a few rounds in which
+# the cases take turns, so that a moment the machine is busy slows down
+# one round of every case rather than all the runs of one. The suite
+# also times a fixed loop of plain Python, and scales the baselines by
+# how much faster or slower that loop runs than when they were taken, so
+# that a busy or throttled machine is not taken for a slowdown. Baselines
+# still depend on the machine they were taken on, so take them again
+# (with --save) after moving to another one.
+#
+# Timings still vary from one run to the next, so a case is only taken
+# to be slower when it is over its baseline by more than the tolerance
+# plus its noise: how far apart its rounds were when the baselines were
+# taken. A case over that is run again before it counts, and cases that
+# take less than MIN_GATED_SECONDS are shown but not checked, as their
+# times depend more on the machine than on the code.
+#
+# Run with `python3 benchmarks/suite.py`; it exits with an error if any
+# case is slower than its baseline by more than that. See
+# `python3 benchmarks/suite.py --help` for the options.
+
+import argparse
+import copy
+import gc
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+from boards import crowded_game, random_action
+
+import engine
+import render
+import savefile
+
+BASELINES_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# The number of turns of the scripted game.
+SCRIPTED_TURNS = 10
+
+# The number of rounds the runs of every case are spread over, when
+# checking the cases and when taking the baselines.
+ROUNDS = 3
+SAVE_ROUNDS = 5
+
+# How many more times a case over its baseline is run before it counts
+# as slower.
+RETRIES = 2
+
+# Cases faster than this (0.1 ms) are not checked against their
+# baselines.
+MIN_GATED_SECONDS = 0.0001
+
+
+def default_board() -> engine.GameState:
+    state = engine.new_game(seed=0)
+    engine.begin_turn(state)
+    return state
+
+
+# The boards, by name, with how many times to run every case on them
+# (over all the rounds).
+BOARDS = {
+    "default 7x5": (default_board, 200),
+    "crowded 7x5": (lambda: crowded_game(5, 7, density=0.6, seed=0), 200),
+    "crowded 50x200": (lambda: crowded_game(50, 200, density=0.3, seed=0), 10),
+    "crowded 500x500": (lambda: crowded_game(500, 500, density=0.3, seed=0), 3),
+}
+
+####################
+# Cases
+# Every case takes a copy of a game of its own, prepares it, and times
+# only the work being measured.
+####################
+
+
+def time_advance_entities(state: engine.GameState) -> float:
+    start = time.perf_counter()
+    engine.advance_entities(state, [])
+    return time.perf_counter() - start
+
+
+def time_spawn_enemy(state: engine.GameState) -> float:
+    start = time.perf_counter()
+    engine.spawn_enemy(state, [], override=True)
+    return time.perf_counter() - start
+
+
+def _mine_in_front_of_enemy(state: engine.GameState) -> tuple:
+    """Puts a mine in the middle lane with an enemy right behind it.
+
+    Returns:
+        tuple: The positions of the mine and the enemy.
+    """
+    row, column = state.variables["rows"] // 2, state.variables["columns"] // 2 - 1
+    mine = next(template for template in state.characters["player"] if template["id"] == "MINE")
+    engine.put_entity(state, row, column, engine.Entity.spawn(mine, "player"))
+    engine.put_entity(state, row, column + 1, engine.Entity.spawn(state.characters["enemy"][0], "enemy"))
+    return (row, column), (row, column + 1)
+
+
+def time_mine(state: engine.GameState) -> float:
+    mine, enemy = _mine_in_front_of_enemy(state)
+    start = time.perf_counter()
+    engine.impact_area(state, mine, "mine", [], enemy)
+    return time.perf_counter() - start
+
+
+def time_heal(state: engine.GameState) -> float:
+    state.variables["gold"] = max(state.variables["gold"], 5)
+    start = time.perf_counter()
+    engine.impact_area(state, (state.variables["rows"] // 2, 1), "heal", [])
+    return time.perf_counter() - start
+
+
+def time_draw_field(state: engine.GameState) -> float:
+    with open(os.devnull, "w") as null:
+        renderer = render.FieldRenderer(output=null)
+        start = time.perf_counter()
+        renderer.draw(state)
+        return time.perf_counter() - start
+
+
+def time_save_load(state: engine.GameState) -> float:
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    savefile.write_compact(state, buffer)
+    buffer.seek(0)
+    savefile.read_compact(buffer)
+    return time.perf_counter() - start
+
+
+def time_scripted_game(state: engine.GameState) -> float:
+    rng = random.Random(0)
+    start = time.perf_counter()
+    while state.outcome is None and state.variables["turn"] < SCRIPTED_TURNS:
+        engine.step(state, random_action(state, rng))
+    return time.perf_counter() - start
+
+
+CASES = {
+    "advance_entities": time_advance_entities,
+    "spawn_enemy": time_spawn_enemy,
+    "mine": time_mine,
+    "heal": time_heal,
+    "draw_field": time_draw_field,
+    "save_load": time_save_load,
+    "scripted_game": time_scripted_game,
+}
+
+####################
+# Running the suite
+####################
+
+
+def calibrate(repeats=20) -> float:
+    """Times a fixed loop of plain Python, to compare the speed of the
+    machine now with its speed when the baselines were taken.
+
+    Returns:
+        float: The best time, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        total = 0
+        for number in range(20000):
+            total += number % 7
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_case(state: engine.GameState, case, repeats: int) -> float:
+    """Runs a case on copies of a game, with the garbage collector off.
+
+    Returns:
+        float: The best time, in seconds.
+    """
+    best = float("inf")
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            copied = copy.deepcopy(state)
+            copied.rng.seed(0)
+            best = min(best, case(copied))
+    finally:
+        if enabled:
+            gc.enable()
+    return best
+
+
+def run_suite(boards: list, cases: list, rounds=ROUNDS) -> tuple:
+    """Runs the given cases on the given boards, over the given number of
+    rounds, timing the machine (see calibrate()) in every round.
+
+    Returns:
+        tuple: The best time of every case, in seconds, by
+        \"board/case\"; the noise of every case, as how much slower its
+        median round was than its best, by the same names; and the best
+        time of calibrate().
+    """
+    states = {board: BOARDS[board][0]() for board in boards}
+    times, calibration = {}, float("inf")
+    for _ in range(rounds):
+        calibration = min(calibration, calibrate())
+        for board in boards:
+            repeats = -(-BOARDS[board][1] // rounds)
+            for case in cases:
+                times.setdefault("{}/{}".format(board, case), []).append(
+                    run_case(states[board], CASES[case], repeats))
+    calibration = min(calibration, calibrate())
+    results = {name: min(runs) for name, runs in times.items()}
+    noise = {name: sorted(runs)[len(runs) // 2] / results[name] - 1 for name, runs in times.items()}
+    return results, noise, calibration
+
+
+def rerun_case(name: str) -> float:
+    """Runs a case again, for RETRIES rounds.
+
+    Returns:
+        float: The best time, in seconds.
+    """
+    board, case = name.split("/")
+    build, repeats = BOARDS[board]
+    state = build()
+    return min(run_case(state, CASES[case], -(-repeats // ROUNDS)) for _ in range(RETRIES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the hot paths of a turn against stored baselines.")
+    parser.add_argument("--save", action="store_true",
+                        help="stores the times as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="how much slower than its baseline a case can be, as a fraction (default: 0.3)")
+    parser.add_argument("--board", action="append", choices=sorted(BOARDS), default=None,
+                        help="runs only the given board (may be repeated)")
+    parser.add_argument("--case", action="append", choices=sorted(CASES), default=None,
+                        help="runs only the given case (may be repeated)")
+    arguments = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINES_FILE_NAME):
+        with open(BASELINES_FILE_NAME, "r") as file:
+            baselines = json.load(file)
+    stored, stored_noise = baselines.get("results", {}), baselines.get("noise", {})
+
+    results, noise, calibration = run_suite(arguments.board or list(BOARDS), arguments.case or list(CASES),
+                                            SAVE_ROUNDS if arguments.save else ROUNDS)
+    # The noise shown is the one measured now when taking the baselines,
+    # and the one the cases are checked with otherwise.
+    shown_noise = noise if arguments.save else stored_noise
+    speed = calibration / baselines.get("calibration", calibration)
+    print("Machine speed: {:.0%} of the baselines' (the baselines below are scaled to match).\n".format(1 / speed))
+    print("{:<34} {:>12} {:>14} {:>9} {:>7}".format("Case", "Time (ms)", "Baseline (ms)", "Change", "Noise"))
+    slower = []
+    for name, seconds in results.items():
+        baseline = stored.get(name)
+        if baseline is not None:
+            baseline *= speed
+        limit = None if baseline is None or baseline < MIN_GATED_SECONDS else \
+            baseline * (1 + arguments.tolerance + stored_noise.get(name, 0))
+        if not arguments.save and limit is not None and seconds > limit:
+            # The machine may just have been busy.
+            seconds = results[name] = min(seconds, rerun_case(name))
+        change = "" if baseline is None else "{:+.0%}".format(seconds / baseline - 1)
+        if limit is not None and seconds > limit:
+            slower.append(name)
+            change += " !"
+        print("{:<34} {:>12.4f} {:>14} {:>9} {:>7}".format(
+            name, seconds * 1000, "-" if baseline is None else "{:.4f}".format(baseline * 1000), change,
+            "-" if limit is None else "{:.0%}".format(shown_noise.get(name, 0))))
+    print("\nCases under {} ms are not checked.".format(MIN_GATED_SECONDS * 1000))
+
+    if arguments.save:
+        # Baselines kept from before are rescaled to the new calibration.
+        baselines = {"python": platform.python_version(), "machine": platform.machine(),
+                     "calibration": calibration,
+                     "results": dict({name: seconds * speed for name, seconds in stored.items()}, **results),
+                     "noise": dict(stored_noise, **noise)}
+        with open(BASELINES_FILE_NAME, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print("\nStored the baselines in {}.".format(BASELINES_FILE_NAME))
+    elif slower:
+        print("\n{} case{} slower than the baseline by more than {:.0%} and its noise: {}.".format(
+            len(slower), "" if len(slower) == 1 else "s", arguments.tolerance, ", ".join(slower)))
+        sys.exit(1)
@@ -0,0 +1,70 @@
+# Benchmark for wave plans
+#
+# Times making wave plans of more and more turns with waves.plan_waves(),
+# and the spawning of a turn, once as a game without a plan spawns (the
+# threat drawn and spent on enemies, then an enemy if the field has
+# none) and once as a lookup in a plan (see engine.spawn_planned()).
+# The danger level rises every 12 turns in both, as it does in a game,
+# and spawned enemies are cleared after every turn, so every turn spawns
+# into the same field.
+#
+# Run with `python3 benchmarks/wave_schedule.py`.
+
+import time
+
+from boards import crowded_game
+
+import engine
+import sinks
+import waves
+
+# The danger level, and so the number of enemies every turn, rises
+# without end, so plans grow with the square of their turns.
+PLAN_TURNS = [100, 1000, 5000]
+ROWS, COLUMNS, TURNS, REPEATS = 50, 200, 500, 20
+
+
+def reactive_spawns(state: engine.GameState, events):
+    """Spawns as engine.step() and engine.begin_turn() do without a plan."""
+    variables = state.variables
+    variables["threat_level"] += state.rng.randint(1, variables["danger_level"])
+    while variables["threat_level"] >= 10:
+        engine.spawn_enemy(state, events, override=True)
+        variables["threat_level"] -= 10
+    engine.spawn_enemy(state, events)
+
+
+def timed_spawns(state: engine.GameState, spawn) -> float:
+    """Times the spawning of every turn over TURNS turns, REPEATS times.
+
+    Returns:
+        float: The time taken per turn, in seconds.
+    """
+    events, elapsed = sinks.NullSink(), 0
+    for turn in list(range(TURNS)) * REPEATS:
+        state.variables["turn"], state.variables["danger_level"] = turn, 1 + turn // 12
+        start = time.perf_counter()
+        spawn(state, events)
+        elapsed += time.perf_counter() - start
+        for r_index in range(ROWS):
+            if state.field[r_index][-1] is not None:
+                engine.put_entity(state, r_index, -1, None)
+    return elapsed / (TURNS * REPEATS)
+
+
+if __name__ == "__main__":
+    print("{:>8} {:>10} {:>12}".format("Turns", "Enemies", "Plan (ms)"))
+    for turns in PLAN_TURNS:
+        start = time.perf_counter()
+        plan = waves.plan_waves(seed=1, turns=turns)
+        elapsed = time.perf_counter() - start
+        print("{:>8} {:>10} {:>12.1f}".format(turns, len(plan.spawns), elapsed * 1000))
+
+    state = crowded_game(ROWS, COLUMNS, density=0.3, seed=1, enemy_columns=4)
+    for r_index in range(ROWS):
+        engine.put_entity(state, r_index, -1, None)
+    reactive = timed_spawns(state, reactive_spawns)
+    state.waves = waves.plan_waves(dict(state.variables, danger_level=1), seed=1, turns=TURNS)
+    planned = timed_spawns(state, engine.spawn_planned)
+    print("\nSpawning a turn on a {}x{} board over {} turns: {:.2f} us without a plan, {:.2f} us with one".format(
+        COLUMNS, ROWS, TURNS, reactive * 10 ** 6, planned * 10 ** 6))
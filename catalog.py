@@ -0,0 +1,250 @@
+# Unit catalog for Desperate Defenders
+#
+# The units of the game and how they behave are read from a catalog file
+# (units.json, or the file named by the DD_UNITS environment variable)
+# rather than written into the rules, so new units can be added without
+# touching the engine. Every unit has the stats it spawns with (see
+# STATS), and defense units may also have:
+# - "attack": "shoot" to shoot the closest enemy ahead of it in its
+#   lane. Units without an attack only block the way. Enemies always
+#   attack whatever is in their way.
+# - "fires_every": how many turns apart its shots are; 2 fires every
+#   second turn. Defaults to 1.
+# - "knockback": true to knock an enemy it shot and did not kill back by
+#   a cell, on a coin flip.
+# - "damage_against": what the damage it deals to some units is
+#   multiplied by, by unit id, rounded down; 0.5 halves it.
+# - "when_attacked": "detonate" to blow up when an enemy attacks it,
+#   dealing the damage of its "area" ({"radius": ..., "damage": ...}) to
+#   every enemy in the area.
+# - "upgrade": the cost of its first upgrade ("cost"), how much every
+#   upgrade after it costs more ("cost_increase"), and the "health",
+#   "min_damage" and "max_damage" every upgrade adds. Units without one
+#   cannot be upgraded.
+#
+# The catalog is compiled into tables with one entry per unit, indexed
+# by a number given to every unit (its code), so the engine finds out
+# how a unit behaves with a list lookup rather than by comparing ids.
+# Units missing from the catalog (for example, from a game saved with
+# another catalog) are given a code when first seen, and no behaviour.
+
+import math
+import os
+from typing import NamedTuple
+
+CATALOG_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "units.json")
+
+# The stats every unit of a type has, in the order they are kept in
+# entity templates.
+STATS = {
+    "player": ["id", "name", "health", "min_damage", "max_damage", "cost"],
+    "enemy": ["id", "name", "health", "min_damage", "max_damage", "moves", "reward"]
+}
+
+# The behaviours defense units can have; see above.
+BEHAVIOURS = ["attack", "fires_every", "knockback", "damage_against", "when_attacked", "area", "upgrade"]
+
+# The attacks a unit can have, by their name in the catalog file.
+NO_ATTACK, SHOOT = range(2)
+ATTACKS = {"none": NO_ATTACK, "shoot": SHOOT}
+
+
+class CatalogError(ValueError):
+    """Raised when a catalog file is not a valid catalog."""
+
+
+class Area(NamedTuple):
+    """The area a unit deals damage to when it detonates."""
+    radius: int
+    damage: int
+
+
+class UpgradeCurve(NamedTuple):
+    """What upgrading a unit costs and adds to its stats. The nth
+    upgrade costs cost + cost_increase * (n - 1)."""
+    cost: int
+    cost_increase: int
+    health: int
+    min_damage: int
+    max_damage: int
+
+
+class Catalog:
+    """The units of the game, with their behaviours compiled into tables
+    indexed by unit code.
+
+    Attributes:
+        characters (dict): The templates of the units, as in
+        engine.units().characters, with their stats only.
+        codes (dict): The code of every unit, by id.
+        ids (list): The id of every unit, by code.
+        attacks (list): The attack of every unit (NO_ATTACK or SHOOT).
+        fires_every (list): How many turns apart the shots of every unit
+        are.
+        knockback (list): Whether every unit knocks enemies back.
+        detonates (list): The Area of every unit that detonates when
+        attacked, or None for units that do not.
+        damage_against (list): For every unit, a list with the
+        multiplier of the damage it deals to every unit, as a
+        (numerator, denominator) pair, or None where the damage is dealt
+        in full.
+        upgrades (list): The UpgradeCurve of every unit that can be
+        upgraded, or None for units that cannot.
+    """
+
+    def __init__(self, characters: dict):
+        self.characters = characters
+        self.codes, self.ids = {}, []
+        self.attacks, self.fires_every, self.knockback = [], [], []
+        self.detonates, self.damage_against, self.upgrades = [], [], []
+
+    def code(self, id: str) -> int:
+        """Finds the code of a unit, giving units missing from the
+        catalog a new code with no behaviour.
+
+        Returns:
+            int: The code of the unit.
+        """
+        if id not in self.codes:
+            self.codes[id] = len(self.ids)
+            self.ids.append(id)
+            self.attacks.append(NO_ATTACK)
+            self.fires_every.append(1)
+            self.knockback.append(False)
+            self.detonates.append(None)
+            self.upgrades.append(None)
+            for modifiers in self.damage_against:
+                modifiers.append(None)
+            self.damage_against.append([None] * len(self.ids))
+        return self.codes[id]
+
+    def upgrade_cost(self, code: int, upgrade_count: int) -> int:
+        """Returns the cost of the next upgrade of a unit that can be
+        upgraded, after the given number of upgrades."""
+        upgrade = self.upgrades[code]
+        return upgrade.cost + upgrade.cost_increase * upgrade_count
+
+
+def _number(unit: dict, key: str, value, minimum=0) -> int:
+    if type(value) is not int or value < minimum:
+        raise CatalogError("{} of {} should be a whole number of at least {}.".format(
+            key, unit.get("id"), minimum))
+    return value
+
+
+def _ratio(value) -> tuple:
+    """Turns a number into a (numerator, denominator) pair in lowest
+    terms, taking it as written in decimal (0.1 is 1/10, not the nearest
+    binary fraction). Numbers too small or large to be written without
+    an exponent are taken as stored."""
+    text = repr(float(value))
+    if "e" in text:
+        numerator, denominator = float(value).as_integer_ratio()
+    else:
+        whole, decimals = text.split(".")
+        numerator, denominator = int(whole + decimals), 10 ** len(decimals)
+    divisor = math.gcd(numerator, denominator)
+    return numerator // divisor, denominator // divisor
+
+
+def compile_catalog(data: dict) -> Catalog:
+    """Checks the contents of a catalog file and compiles them.
+
+    Parameters:
+        data (dict): The catalog, with lists of \"player\" and \"enemy\"
+        units.
+
+    Returns:
+        Catalog: The compiled catalog.
+
+    Raises:
+        CatalogError: If the catalog is not valid.
+    """
+    if not isinstance(data, dict) or set(data) != set(STATS):
+        raise CatalogError("A catalog should have a list of player units and a list of enemy units.")
+
+    characters = {}
+    for unit_type, stats in STATS.items():
+        if not isinstance(data[unit_type], list) or not data[unit_type]:
+            raise CatalogError("The catalog should have at least one {} unit.".format(unit_type))
+        characters[unit_type] = []
+        for unit in data[unit_type]:
+            if not isinstance(unit, dict) or any(stat not in unit for stat in stats):
+                raise CatalogError("Every {} unit should have the stats {}.".format(unit_type, ", ".join(stats)))
+            allowed = stats + (BEHAVIOURS if unit_type == "player" else [])
+            unknown = [key for key in unit if key not in allowed]
+            if unknown:
+                raise CatalogError("{} has unknown fields: {}.".format(unit["id"], ", ".join(unknown)))
+            if not isinstance(unit["id"], str) or not isinstance(unit["name"], str):
+                raise CatalogError("The id and name of every unit should be text.")
+            for stat in stats[2:]:
+                _number(unit, stat, unit[stat], 1 if stat in ["health", "moves"] else 0)
+            if unit["min_damage"] > unit["max_damage"]:
+                raise CatalogError("min_damage of {} should not be above its max_damage.".format(unit["id"]))
+            characters[unit_type].append({stat: unit[stat] for stat in stats})
+
+    catalog = Catalog(characters)
+    units = data["player"] + data["enemy"]
+    for unit in units:
+        if unit["id"] in catalog.codes:
+            raise CatalogError("There is more than one unit with the id {}.".format(unit["id"]))
+        catalog.code(unit["id"])
+
+    for unit in data["player"]:
+        code = catalog.codes[unit["id"]]
+        if unit.get("attack", "none") not in ATTACKS:
+            raise CatalogError("The attack of {} should be one of {}.".format(unit["id"], ", ".join(ATTACKS)))
+        catalog.attacks[code] = ATTACKS[unit.get("attack", "none")]
+        catalog.fires_every[code] = _number(unit, "fires_every", unit.get("fires_every", 1), 1)
+        catalog.knockback[code] = unit.get("knockback", False) is True
+
+        for target, multiplier in unit.get("damage_against", {}).items():
+            if target not in catalog.codes or type(multiplier) not in [int, float] or not 0 <= multiplier < math.inf:
+                raise CatalogError("damage_against of {} should give a multiplier of at least 0 for units in the catalog.".format(
+                    unit["id"]))
+            # Multipliers are kept as fractions, so damage is rounded
+            # down exactly.
+            if multiplier != 1:
+                catalog.damage_against[code][catalog.codes[target]] = _ratio(multiplier)
+
+        if unit.get("when_attacked") not in [None, "detonate"]:
+            raise CatalogError("when_attacked of {} should be detonate.".format(unit["id"]))
+        if unit.get("when_attacked") == "detonate":
+            area = unit.get("area")
+            if not isinstance(area, dict) or set(area) != set(Area._fields):
+                raise CatalogError("{} detonates, so it should have an area with a radius and a damage.".format(unit["id"]))
+            catalog.detonates[code] = Area(_number(unit, "radius", area["radius"]), _number(unit, "damage", area["damage"]))
+
+        if "upgrade" in unit:
+            upgrade = unit["upgrade"]
+            if not isinstance(upgrade, dict) or "cost" not in upgrade or any(
+                    key not in UpgradeCurve._fields for key in upgrade):
+                raise CatalogError("The upgrade of {} should have a cost, and may have {}.".format(
+                    unit["id"], ", ".join(UpgradeCurve._fields[1:])))
+            catalog.upgrades[code] = UpgradeCurve(*[_number(unit, key, upgrade.get(key, 0))
+                                                    for key in UpgradeCurve._fields])
+    return catalog
+
+
+def load(file_name=None) -> Catalog:
+    """Loads and compiles a catalog file.
+
+    Parameters:
+        file_name (str): The catalog file. Defaults to the file named by
+        the DD_UNITS environment variable, or units.json.
+
+    Returns:
+        Catalog: The compiled catalog.
+
+    Raises:
+        CatalogError: If the file cannot be read or is not a valid
+        catalog.
+    """
+    import json
+    file_name = file_name or os.environ.get("DD_UNITS") or CATALOG_FILE_NAME
+    try:
+        with open(file_name, "r") as file:
+            data = json.load(file)
+    except (OSError, ValueError) as error:
+        raise CatalogError("The catalog {} could not be read: {}".format(file_name, error))
+    return compile_catalog(data)
@@ -0,0 +1,76 @@
+# Commands typed by the player
+#
+# Turns the positions and one-line commands players type into actions
+# for the engine. Commands are used where a game goes on without waiting
+# for the menus of the console game: in real-time mode (see main.py) and
+# on the game server (see server.py).
+#
+# Invalid input raises an AssertionError with a message for the player,
+# as the console game's prompts do.
+
+from typing import Union
+
+import engine
+
+HELP = "Commands: buy UNIT CELL, upgrade CELL, heal CELL, end, save, quit (for example, buy archer A1)."
+
+
+def parse_position(state: engine.GameState, position: str) -> tuple:
+    """Turns a position typed by the player into a cell of the player's
+    half of the field.
+
+    Parameters:
+        state (GameState): The game the position is on.
+        position (str): The position, in the format XY (where X is an
+        alphabet, Y is a numeral).
+
+    Returns:
+        tuple: The position, comprised of (row, col).
+
+    Raises:
+        AssertionError: If the position is not valid, with a message for
+        the player.
+    """
+    import re
+    position = position.strip()
+    assert re.fullmatch(
+        r"[A-Za-z]\d{1,2}", position), "Please provide the position in the format XY (where X is an alphabet, Y is a numeral)."
+
+    # Checks if the provided row and col values are valid.
+    row, col = position[0].upper(), int(position[1:])
+    assert 0 <= ord(row) - 65 <= state.variables["rows"] - 1, "Please provide a valid row between A and {}.".format(
+        chr(64 + state.variables["rows"]))
+    assert 1 <= col <= state.variables["columns"] // 2, "Please provide a valid column between 1 and {}.".format(
+        state.variables["columns"] // 2)
+    return ord(row) - 65, col - 1
+
+
+def parse_command(state: engine.GameState, command: str) -> Union[engine.Action, str]:
+    """Turns a command typed by the player into an action.
+
+    Parameters:
+        state (GameState): The game the command is for.
+        command (str): The command.
+
+    Returns:
+        Action: The action to take, or \"save\" or \"quit\".
+
+    Raises:
+        AssertionError: If the command is not valid, with a message for
+        the player.
+    """
+    words = command.lower().split()
+    assert words, HELP
+    if words[0] in ["end", "save", "quit"]:
+        assert len(words) == 1, "{} takes nothing after it.".format(words[0].capitalize())
+        return engine.EndTurn() if words[0] == "end" else words[0]
+    elif words[0] == "buy":
+        assert len(words) == 3, "Please give a unit and a cell to buy it in, for example buy archer A1."
+        unit = next((defense for defense in state.characters["player"]
+                     if words[1] in [defense["id"].lower(), defense["name"].lower()]), None)
+        assert unit is not None, "There is no unit called {}.".format(words[1])
+        return engine.Buy(unit["id"], *parse_position(state, words[2]))
+    elif words[0] in ["upgrade", "heal"]:
+        assert len(words) == 2, "Please give a cell to {}, for example {} A1.".format(words[0], words[0])
+        return (engine.Upgrade if words[0] == "upgrade" else engine.Heal)(*parse_position(state, words[1]))
+    raise AssertionError(HELP)
@@ -0,0 +1,1341 @@
+# Desperate Defenders game engine
+#
+# This file holds the rules of Desperate Defenders, separated from the
+# console input and output in main.py. The engine never reads from or
+# writes to the terminal and keeps no game state at the module level:
+# everything a game needs lives in a GameState, and a game only changes
+# through begin_turn() and step(). Whatever happens in a turn is returned
+# as a list of events, leaving it to the caller to decide how (or
+# whether) to display them.
+
+import functools
+import random
+from bisect import bisect_right, insort
+from copy import deepcopy
+from typing import NamedTuple, Optional, Union
+
+import catalog
+
+# The random keys of the parts of games, for state_hash(); a key is
+# drawn the first time its part is seen, so keys are the same throughout
+# a run but not from one run to the next.
+_zobrist_keys = {}
+_zobrist_rng = random.Random(0)
+
+# The units of the game and how they behave, compiled from the catalog
+# file (see catalog.py), are returned by units(), with the templates
+# entities are spawned from, with the stats of every unit in the
+# catalog, as its characters. To keep importing this file quick, the
+# catalog is only read the first time units() is called.
+
+
+@functools.lru_cache(maxsize=None)
+def units() -> catalog.Catalog:
+    """Returns the units of the game, reading the catalog the first time.
+
+    Returns:
+        catalog.Catalog: The units of the game.
+    """
+    return catalog.load()
+
+
+GAME_VARIABLES = {
+    "columns": 7,
+    "rows": 5,
+    "turn": 0,
+    "threat_level": 0,
+    "danger_level": 1,
+    "target": 20,
+    "killed": 0,
+    "gold": 10
+}
+
+
+class Kind(NamedTuple):
+    """The parts of an entity that never change: what it is, what it
+    costs and how far it moves, and its code in the tables of units().
+    Every entity of a kind shares a single Kind, obtained through
+    kind_of()."""
+    id: str
+    name: str
+    type: str
+    cost: int
+    moves: int
+    code: int
+
+
+# Every Kind created so far, so that entities of the same kind share one.
+_kinds = {}
+
+
+def kind_of(template: dict, type: str) -> Kind:
+    """Finds the shared Kind of an entity template.
+
+    Parameters:
+        template (dict): The entity template, as in units().characters.
+        type (str): The type of the entity, either \"player\" or \"enemy\".
+
+    Returns:
+        Kind: The kind of the template.
+    """
+    key = (template["id"], template["name"], type,
+           template.get("cost", 0), template.get("moves", 0))
+    if key not in _kinds:
+        _kinds[key] = Kind(*key, units().code(template["id"]))
+    return _kinds[key]
+
+
+class Entity:
+    """An entity on the field.
+
+    Only the stats that can change over a game are stored in the entity
+    itself; the rest is read from its shared Kind. The id, name, type
+    and code of the kind are also kept in the entity, as the engine
+    looks at them the most.
+
+    Attributes:
+        kind (Kind): The kind of the entity.
+        id (str): The id of the entity.
+        name (str): The name of the entity.
+        type (str): The type of the entity, either \"player\" or \"enemy\".
+        code (int): The code of the entity in the tables of units().
+        current_health (int): The current health of the entity.
+        health (int): The maximum health of the entity.
+        min_damage (int): The minimum damage the entity can deal.
+        max_damage (int): The maximum damage the entity can deal.
+        reward (int): The reward the entity gives the player. (if type is
+        enemy)
+        upgrade_count (int): The number of times the entity has been
+        upgraded. (if type is player)
+    """
+    __slots__ = ["kind", "id", "name", "type", "code", "current_health", "health",
+                 "min_damage", "max_damage", "reward", "upgrade_count"]
+
+    def __init__(self, kind: Kind, current_health: int, health: int, min_damage: int, max_damage: int, reward=0, upgrade_count=0):
+        self.kind, self.id, self.name, self.type, self.code = kind, kind.id, kind.name, kind.type, kind.code
+        self.current_health, self.health = current_health, health
+        self.min_damage, self.max_damage = min_damage, max_damage
+        self.reward, self.upgrade_count = reward, upgrade_count
+
+    @property
+    def moves(self) -> int:
+        return self.kind.moves
+
+    @classmethod
+    def spawn(cls, template: dict, type: str) -> "Entity":
+        """Creates a fresh, unhurt entity from a template."""
+        return cls(kind_of(template, type), template["health"], template["health"],
+                   template["min_damage"], template["max_damage"], template.get("reward", 0))
+
+    def copy(self) -> "Entity":
+        """Creates an entity of the same kind with the same stats."""
+        return Entity(self.kind, self.current_health, self.health, self.min_damage, self.max_damage,
+                      self.reward, self.upgrade_count)
+
+    def __reduce__(self):
+        # Pickles the entity as the arguments it is created from, which
+        # is several times quicker than pickling every slot by name.
+        return Entity, (self.kind, self.current_health, self.health, self.min_damage, self.max_damage,
+                        self.reward, self.upgrade_count)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Entity":
+        """Creates an entity from its dict form, as kept in saved games.
+
+        Raises:
+            KeyError: If a stat of the entity is missing.
+        """
+        return cls(kind_of(data, data["type"]), data["current_health"], data["health"], data["min_damage"],
+                   data["max_damage"], data.get("reward", 0), data.get("upgrade_count", 0))
+
+    def to_dict(self) -> dict:
+        """Turns the entity into its dict form, as kept in saved games.
+
+        Returns:
+            dict: The entity, with the keys used by the game before
+            entities were objects.
+        """
+        data = {"id": self.kind.id, "name": self.kind.name, "health": self.health,
+                "min_damage": self.min_damage, "max_damage": self.max_damage}
+        if self.type == "player":
+            data.update({"cost": self.kind.cost, "type": self.type,
+                        "upgrade_count": self.upgrade_count})
+        else:
+            data.update({"moves": self.kind.moves,
+                        "reward": self.reward, "type": self.type})
+        data["current_health"] = self.current_health
+        return data
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Entity):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self) -> str:
+        return "Entity({}, {}/{})".format(self.kind.id, self.current_health, self.health)
+
+
+class SparseRow:
+    """A row of the field that only keeps its occupied cells, for huge
+    fields that are mostly empty: its memory grows with the entities in
+    it rather than its length. It behaves as a list of its cells (an
+    Entity, or None if empty), so the field can be indexed and sliced as
+    usual, including with negative columns; going through every cell of
+    it, though, takes as long as for a list. occupied() and scan() go
+    through the occupied cells only.
+
+    Attributes:
+        length (int): The number of cells in the row.
+        cells (dict): The entity in every occupied cell, by column.
+        columns (list): The occupied columns, sorted.
+    """
+    __slots__ = ["length", "cells", "columns"]
+
+    def __init__(self, length: int):
+        self.length, self.cells, self.columns = length, {}, []
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _column(self, col: int) -> int:
+        if not -self.length <= col < self.length:
+            raise IndexError("column {} is out of the row".format(col))
+        return col % self.length
+
+    def __getitem__(self, col):
+        # Columns within the row are looked up the most, so they are
+        # checked for first.
+        if type(col) is int and 0 <= col < self.length:
+            return self.cells.get(col)
+        elif isinstance(col, slice):
+            return [self.cells.get(c_index) for c_index in range(*col.indices(self.length))]
+        return self.cells.get(self._column(col))
+
+    def __setitem__(self, col: int, entity: Optional[Entity]):
+        col = self._column(col)
+        if entity is None:
+            if self.cells.pop(col, None) is not None:
+                del self.columns[bisect_right(self.columns, col) - 1]
+        else:
+            if col not in self.cells:
+                insort(self.columns, col)
+            self.cells[col] = entity
+
+    def __iter__(self):
+        return (self.cells.get(c_index) for c_index in range(self.length))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, SparseRow):
+            return self.length == other.length and self.cells == other.cells
+        return isinstance(other, list) and list(self) == other
+
+    def __repr__(self) -> str:
+        return "SparseRow({}, {})".format(self.length, {col: self.cells[col] for col in self.columns})
+
+    def copy(self) -> "SparseRow":
+        """Returns a shallow copy of the row, as list.copy() does for a
+        row that is a list."""
+        row = SparseRow(self.length)
+        row.cells, row.columns = dict(self.cells), list(self.columns)
+        return row
+
+    def occupied(self) -> list:
+        """Returns the (column, entity) of every occupied cell, in order
+        of column."""
+        return [(col, self.cells[col]) for col in self.columns]
+
+    def scan(self):
+        """Goes through the occupied columns in order, as the row is
+        changed: every column given is the first occupied one after the
+        last, at the time it is asked for. Entities moved further along
+        the row are reached again, as they are when going through every
+        column of a list.
+
+        Yields:
+            int: The next occupied column.
+        """
+        columns, col = self.columns, -1
+        while True:
+            index = bisect_right(columns, col)
+            if index == len(columns):
+                return
+            col = columns[index]
+            yield col
+
+
+def new_field(rows: int, columns: int, sparse=False) -> list:
+    """Creates an empty field.
+
+    Parameters:
+        rows (int): The number of rows.
+        columns (int): The number of columns.
+        sparse (bool): Whether the rows only keep their occupied cells
+        (see SparseRow), for huge fields that are mostly empty. Every
+        pass over the field then takes time in step with the entities on
+        it, rather than its size.
+
+    Returns:
+        list: The field, as a list of rows.
+    """
+    if sparse:
+        return [SparseRow(columns) for _ in range(rows)]
+    return [[None] * columns for _ in range(rows)]
+
+
+def occupied_cells(row) -> list:
+    """Returns the (column, entity) of every occupied cell of a row of
+    the field, in order of column, looking at the occupied cells only if
+    the row is sparse."""
+    if type(row) is SparseRow:
+        return row.occupied()
+    return [(c_index, cell) for c_index, cell in enumerate(row) if cell is not None]
+
+
+class GameState:
+    """Everything needed to play a single game.
+
+    The field is a row by column (defined in variables) matrix. Cells in
+    the matrix either hold an Entity, or None if nothing is occupying the
+    cell.
+
+    Alongside the field, the game keeps an index of where the enemies
+    are, so that finding them does not need a scan of the whole field.
+    The index is built from the field when the GameState is created;
+    from then on, the field must only be changed through put_entity()
+    to keep the two in step.
+
+    Attributes:
+        field (list): The field the game is played on.
+        variables (dict): The game variables, with the same keys as
+        GAME_VARIABLES.
+        characters (dict): The templates entities are spawned from. Each
+        game has its own copy, as enemies grow stronger over a game.
+        outcome (str): None while the game is being played; \"win\" or
+        \"loss\" once it has ended.
+        enemy_lanes (list): For every row, the sorted columns holding an
+        enemy.
+        enemy_count (int): The number of enemies on the field.
+        rng (random.Random): The random number generator every random
+        decision in the game is drawn from. Two games with generators
+        seeded alike play out the same for the same actions.
+        changed_cells (set): The (row, column) of every cell changed
+        since the set was last emptied, or None (the default) if changes
+        are not being tracked. Set by journal.py.
+        field_hash (int): The Zobrist hash of the field as of the last
+        call to state_hash(), or None before the first.
+        unhashed_cells (dict): The cells changed since the last call to
+        state_hash(), with the key each had then.
+        undo_log (list): For every snapshot of the game still held, the
+        cells changed since it was taken, with what was in them then;
+        see snapshot().
+        lane_rules (bool): Whether the game plays by lane rules, in which
+        the lanes of a turn play out apart from one another (see
+        advance_lanes()), as games started with --lanes do; False (the
+        default) for the rules of advance_entities(). Kept in saves.
+        resolver: What plays out the moves of the entities in a turn of
+        a game playing by lane rules in place of advance_lanes(), called
+        with the game and the events, or None (the default) for
+        advance_lanes(). See lanes.py.
+        waves: The waves.WavePlan deciding which enemies spawn on every
+        turn it covers, or None (the default) for enemies to spawn as the
+        game goes. See spawn_planned().
+    """
+
+    def __init__(self, field: list, variables: dict, characters: dict, outcome: Optional[str] = None,
+                 rng: Optional[random.Random] = None):
+        self.field, self.variables, self.characters, self.outcome = field, variables, characters, outcome
+        self.rng = random.Random() if rng is None else rng
+        self.enemy_lanes = [[c_index for c_index, cell in occupied_cells(row) if cell.type == "enemy"]
+                            for row in self.field]
+        self.enemy_count = sum(len(lane) for lane in self.enemy_lanes)
+        self.changed_cells, self.field_hash, self.unhashed_cells, self.undo_log = None, None, {}, []
+        self.lane_rules, self.resolver, self.waves = False, None, None
+
+    # Games are equal if they are at the same point of the same game;
+    # their generators and what is keeping track of their changes are
+    # left out.
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return (self.field, self.variables, self.characters, self.outcome) == \
+            (other.field, other.variables, other.characters, other.outcome)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "GameState(field={!r}, variables={!r}, characters={!r}, outcome={!r})".format(
+            self.field, self.variables, self.characters, self.outcome)
+
+
+def new_game(variables=None, characters=None, seed=None, sparse=False) -> GameState:
+    """Creates a new game with an empty field.
+
+    Parameters:
+        variables (dict): The game variables to start with. Defaults to
+        GAME_VARIABLES.
+        characters (dict): The entity templates to use. Defaults to
+        units().characters.
+        seed: The seed for the game's random number generator. Defaults
+        to a seed taken from the system.
+        sparse (bool): Whether the field only keeps its occupied cells;
+        see new_field().
+
+    Returns:
+        GameState: The new game.
+    """
+    variables = dict(GAME_VARIABLES if variables is None else variables)
+    characters = deepcopy(units().characters if characters is None else characters)
+    field = new_field(variables["rows"], variables["columns"], sparse)
+    return GameState(field, variables, characters, rng=random.Random(seed))
+
+
+####################
+# Actions
+# An action is what the player chooses to do in a turn; step() takes
+# one of these.
+####################
+
+
+class Buy(NamedTuple):
+    """Buys a defense unit (by its id) and places it on the field."""
+    unit: str
+    row: int
+    column: int
+
+
+class Upgrade(NamedTuple):
+    """Upgrades the defense unit at the given position."""
+    row: int
+    column: int
+
+
+class Heal(NamedTuple):
+    """Heals all defense units in a 3-by-3 area around the position."""
+    row: int
+    column: int
+
+
+class EndTurn(NamedTuple):
+    """Ends the turn without doing anything else."""
+
+
+Action = Union[Buy, Upgrade, Heal, EndTurn]
+
+####################
+# Events
+# Events describe what happened while an action or a turn was carried
+# out. Lanes and columns are zero-indexed.
+####################
+
+
+class Spawn(NamedTuple):
+    lane: int
+    column: int
+    name: str
+
+
+class Shot(NamedTuple):
+    """A defense unit shot an enemy."""
+    lane: int
+    attacker: str
+    target: str
+    damage: int
+
+
+class Attack(NamedTuple):
+    """An enemy attacked whatever was in its way."""
+    lane: int
+    attacker: str
+    target: str
+    damage: int
+
+
+class Kill(NamedTuple):
+    """An entity died; by is the type of entity that killed it."""
+    lane: int
+    column: int
+    name: str
+    by: str
+
+
+class Advance(NamedTuple):
+    lane: int
+    name: str
+
+
+class Knockback(NamedTuple):
+    lane: int
+    name: str
+
+
+class Detonation(NamedTuple):
+    """A mine was detonated by the named enemy."""
+    lane: int
+    name: str
+
+
+class Blast(NamedTuple):
+    """An enemy was caught in the blast of a mine in the given lane."""
+    lane: int
+    name: str
+    damage: int
+
+
+class Healed(NamedTuple):
+    lane: int
+    name: str
+    amount: int
+
+
+class Enhance(NamedTuple):
+    """The enemies grew stronger; danger_level is the new danger level."""
+    danger_level: int
+
+
+class Upgraded(NamedTuple):
+    lane: int
+    column: int
+    name: str
+
+
+class Rejected(NamedTuple):
+    """The action could not be carried out; the game is unchanged."""
+    message: str
+
+
+class GameOver(NamedTuple):
+    """The game has ended; catalyst is the name of the enemy that
+    reached the city on a loss."""
+    outcome: str
+    catalyst: Optional[str] = None
+
+####################
+# Game rules
+# All functions in this chunk handle the logic of a turn. They append
+# whatever happens to the given list of events, or sink. Events that
+# happen for every cell are not created at all for a sink that is not
+# listening (see sinks.NullSink).
+####################
+
+
+def put_entity(state: GameState, row: int, col: int, entity: Optional[Entity]):
+    """Puts an entity (or None to empty the cell) in a cell, replacing
+    whatever was there, and updates the enemy index to match.
+
+    As with indexing the field directly, negative columns count from the
+    end of the row.
+
+    Parameters:
+        state (GameState): The game to change.
+        row (int): The row of the cell.
+        col (int): The column of the cell.
+        entity (Entity): The entity to put in the cell.
+    """
+    col %= state.variables["columns"]
+    mark_changed(state, row, col)
+    cells, lane = state.field[row], state.enemy_lanes[row]
+    if cells[col] is not None and cells[col].type == "enemy":
+        del lane[bisect_right(lane, col) - 1]
+        state.enemy_count -= 1
+    cells[col] = entity
+    if entity is not None and entity.type == "enemy":
+        insort(lane, col)
+        state.enemy_count += 1
+
+
+def mark_changed(state: GameState, row: int, col: int):
+    """Records that a cell is about to change, for whatever is keeping
+    track of the changes to the game: the changed cells (see
+    GameState.changed_cells), the hash of the game (see state_hash())
+    and its snapshots (see snapshot()). Entities changed in place must
+    be marked here before they are changed; put_entity() marks the
+    cells it changes itself."""
+    if state.changed_cells is not None:
+        state.changed_cells.add((row, col % state.variables["columns"]))
+    if state.field_hash is not None or state.undo_log:
+        _log_cell(state, row, col % state.variables["columns"])
+
+
+def _log_cell(state: GameState, row: int, col: int):
+    """Keeps what a cell held before its first change since the hash of
+    the game was last taken, and since every snapshot still held."""
+    cell, entity = (row, col), state.field[row][col]
+    if state.field_hash is not None and cell not in state.unhashed_cells:
+        state.unhashed_cells[cell] = _cell_key(row, col, entity)
+    undo_log = state.undo_log
+    if undo_log and cell not in undo_log[-1]:
+        # A cell changed since a snapshot has also changed since every
+        # snapshot before it, so the snapshots yet to log it are the
+        # latest few. Each keeps a copy of its own, as restore() puts
+        # the copy back in the field.
+        for cells in reversed(undo_log):
+            if cell in cells:
+                break
+            cells[cell] = None if entity is None else entity.copy()
+
+
+def move_entity(state: GameState, row: int, source: int, destination: int):
+    """Moves the entity in a cell to another cell in the same row,
+    replacing whatever was there and leaving the source cell empty."""
+    put_entity(state, row, destination, state.field[row][source])
+    put_entity(state, row, source, None)
+
+
+def _reward(state: GameState, entity: Entity):
+    """Credits the player for killing an enemy."""
+    state.variables["gold"] += entity.reward
+    state.variables["killed"] += 1
+    state.variables["threat_level"] += entity.reward
+
+
+def _in_player_half(state: GameState, row: int, column: int) -> bool:
+    """Checks if a position lies on the half of the field the player
+    can place units on."""
+    return 0 <= row < state.variables["rows"] and 0 <= column < state.variables["columns"] // 2
+
+
+def spawn_entity(state: GameState, entity: dict, type: str, position: tuple, events: list) -> bool:
+    """Spawns a copy of the provided entity template at the provided
+    position, if the position is free.
+
+    Parameters:
+        state (GameState): The game to spawn the entity in.
+        entity (dict): The template of the entity to spawn.
+        type (str): The type of the entity, either \"player\" or \"enemy\".
+        position (tuple): The position to spawn the entity, comprised of (row, col).
+        events (list): The list (or sink) to append events to.
+
+    Returns:
+        bool: True if the entity was spawned, False if not.
+    """
+    placed_entity = Entity.spawn(entity, type)
+
+    # Checks if the entity can be spawned in the given position.
+    row, col = position
+    if state.field[row][col] is None:
+        put_entity(state, row, col, placed_entity)
+        events.append(Spawn(row, col, placed_entity.name))
+        return True
+    else:
+        return False
+
+
+def spawn_enemy(state: GameState, events: list, override=False):
+    """Spawns a random enemy in any row of the last column.
+
+    By default, an enemy will only be spawned when there are no more
+    enemies on the board. In some special cases though, like when the
+    threat level surpases the limit, an override can be used to spawn
+    the enemy regardless of the state of the field.
+
+    Parameters:
+        state (GameState): The game to spawn the enemy in.
+        events (list): The list (or sink) to append events to.
+        override (bool): If True, spawns an enemy regardless of the
+        current circumstances."""
+    if state.enemy_count == 0 or override:
+        enemy = state.rng.choice(state.characters["enemy"])
+        position = (state.rng.randint(
+            0, state.variables["rows"] - 1), state.variables["columns"] - 1)
+        spawn_entity(state, enemy, "enemy", position, events)
+
+
+def spawn_planned(state: GameState, events: list):
+    """Spawns the enemies the game's wave plan has for the turn, each in
+    the last column of its lane if the cell is free. See waves.py.
+
+    Parameters:
+        state (GameState): The game to spawn the enemies in.
+        events (list): The list (or sink) to append events to.
+    """
+    field, kinds = state.field, state.waves.kinds
+    for spawn in state.waves.spawns_on(state.variables["turn"]):
+        if field[spawn.lane][-1] is None:
+            enemy = Entity(kinds[spawn.unit], spawn.health, spawn.health, spawn.min_damage, spawn.max_damage,
+                           spawn.reward)
+            put_entity(state, spawn.lane, -1, enemy)
+            events.append(Spawn(spawn.lane, state.variables["columns"] - 1, enemy.name))
+
+
+def impact_area(state: GameState, position: tuple, type: str, events: list, catalyst_entity_position=None, blasts=None):
+    """Performs a circular impact area around a given position depending
+    on the type of impact (expecting either a type of \"mine\" or \"heal\").
+    A mine deals the damage of its area in the catalog (see catalog.py)
+    to every enemy in it; a heal heals every defense unit in a 3-by-3
+    area by 5.
+
+    An assumption is made that healing defenses will take a turn.
+
+    Parameters:
+        state (GameState): The game to perform the impact in.
+        position (tuple): The position to impact the area around.
+        type (str): The type of impact to perform. Expects either \"mine\" or \"heal\".
+        events (list): The list (or sink) to append events to.
+        catalyst_entity_position (tuple): The position of the entity
+        that caused the impact.
+        blasts (list): If given, a mine only deals its damage to its own
+        lane at once, and its blast is recorded in the list, as (row,
+        column, radius, damage), for apply_blasts() to deal to the other
+        lanes later.
+    """
+    field, variables = state.field, state.variables
+    listening = getattr(events, "listening", True)
+    row, col = position
+    radius, amount = units().detonates[field[row][col].code] if type == "mine" else (1, 5)
+    if catalyst_entity_position is not None:
+        cat_row, cat_col = catalyst_entity_position
+        put_entity(state, row, col, field[cat_row][cat_col])
+        put_entity(state, cat_row, cat_col, None)
+
+    if type == "mine":
+        events.append(Detonation(row, field[row][col].name))
+        if blasts is not None:
+            blasts.append((row, col, radius, amount))
+            _blast(state, row, col, radius, amount, [row], events, listening)
+        else:
+            _blast(state, row, col, radius, amount, range(row - radius, row + radius + 1), events, listening)
+        return
+
+    if variables["gold"] - 5 < 0:
+        events.append(Rejected("You don't have enough gold to heal!"))
+        return
+    variables["gold"] -= 5
+    variables["turn"] += 1
+    for r_index in range(row - radius, row + radius + 1):
+        for c_index in range(col - radius, col + radius + 1):
+            if 0 <= r_index < variables["rows"] and 0 <= c_index < variables["columns"]:
+                entity_in_radius = field[r_index][c_index]
+                if entity_in_radius is not None and entity_in_radius.type == "player":
+                    if listening:
+                        events.append(Healed(r_index, entity_in_radius.name, amount))
+                    mark_changed(state, r_index, c_index)
+                    entity_in_radius.current_health += amount
+                    if entity_in_radius.current_health > entity_in_radius.health:
+                        entity_in_radius.current_health = entity_in_radius.health
+
+
+def _blast(state: GameState, row: int, col: int, radius: int, amount: int, lanes, events: list, listening: bool):
+    """Deals the damage of a mine's blast to the enemies in the given
+    lanes of its area."""
+    field, variables = state.field, state.variables
+    for r_index in lanes:
+        if not 0 <= r_index < variables["rows"]:
+            continue
+        for c_index in range(max(0, col - radius), min(variables["columns"], col + radius + 1)):
+            entity_in_radius = field[r_index][c_index]
+            if entity_in_radius is not None and entity_in_radius.type == "enemy":
+                # The blast is reported in the lane of the mine, not the
+                # lane of the entity caught in it.
+                if listening:
+                    events.append(Blast(row, entity_in_radius.name, amount))
+                mark_changed(state, r_index, c_index)
+                entity_in_radius.current_health -= amount
+                if entity_in_radius.current_health <= 0:
+                    if listening:
+                        events.append(
+                            Kill(r_index, c_index, entity_in_radius.name, "player"))
+                    _reward(state, entity_in_radius)
+                    put_entity(state, r_index, c_index, None)
+
+
+def apply_blasts(state: GameState, blasts: list, events: list):
+    """Deals the blasts of the mines that went off in a turn to the
+    lanes next to them, once every lane has been played out; see
+    impact_area() and advance_lanes().
+
+    Parameters:
+        state (GameState): The game the mines went off in.
+        blasts (list): The blasts, as (row, column, radius, damage), in
+        the order the mines went off.
+        events (list): The list (or sink) to append events to.
+    """
+    listening = getattr(events, "listening", True)
+    for row, col, radius, amount in blasts:
+        _blast(state, row, col, radius, amount,
+               [r_index for r_index in range(row - radius, row + radius + 1) if r_index != row], events, listening)
+
+
+# Under lane rules, every lane draws the random numbers of a turn from a
+# generator of its own, seeded with lane_seed(): a 64-bit linear
+# congruential generator, of which the top 32 bits of every step are
+# used.
+_LANE_MULTIPLIER, _LANE_INCREMENT, _MASK_64 = 6364136223846793005, 1442695040888963407, (1 << 64) - 1
+
+
+def lane_seed(base: int, lane: int) -> int:
+    """Seeds the generator a lane draws from in a turn under lane rules
+    (see advance_lanes()), from a number drawn from the game's generator
+    once for the turn. Neighbouring lanes get unrelated seeds."""
+    seed = (base + (lane + 1) * 0x9E3779B97F4A7C15) & _MASK_64
+    seed = ((seed ^ (seed >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    seed = ((seed ^ (seed >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return seed ^ (seed >> 31)
+
+
+class LaneRandom:
+    """The generator a lane draws from in a turn under lane rules; see
+    lane_seed(). It has the randint() and choice() of random.Random that
+    advance_lane() draws with."""
+    __slots__ = ["seed"]
+
+    def __init__(self, seed: int):
+        self.seed = seed
+
+    def randint(self, a: int, b: int) -> int:
+        self.seed = seed = (self.seed * _LANE_MULTIPLIER + _LANE_INCREMENT) & _MASK_64
+        return a + ((seed >> 32) * (b - a + 1) >> 32)
+
+    def choice(self, sequence):
+        self.seed = seed = (self.seed * _LANE_MULTIPLIER + _LANE_INCREMENT) & _MASK_64
+        return sequence[(seed >> 32) * len(sequence) >> 32]
+
+
+def advance_entities(state: GameState, events: list):
+    """Performs all the logical code to advance the round, including
+    performing damage calculations and advancing enemies.
+
+    The lanes are played out one after another with advance_lane(), all
+    drawing from the game's generator, and the blast of a mine reaches
+    the lanes next to it at once. Games playing by lane rules are
+    advanced by advance_lanes() instead.
+
+    If an enemy reaches the city, the game is lost and the round stops
+    there.
+
+    Parameters:
+        state (GameState): The game to advance.
+        events (list): The list (or sink) to append events to.
+    """
+    rng = state.rng
+    for r_index, enemies in enumerate(state.enemy_lanes):
+        # Nothing happens in a lane without enemies: there is nothing
+        # to shoot and nothing to advance.
+        if enemies and advance_lane(state, r_index, rng, events):
+            return
+
+
+def advance_lanes(state: GameState, events: list):
+    """Advances the round of a game playing by lane rules (see
+    GameState.lane_rules), in which no lane depends on another, so that
+    the lanes can be played out apart from one another, or on other
+    processes (see lanes.py), with the same result: every lane draws
+    from a LaneRandom of its own, and the blasts of mines only reach the
+    lanes next to them once every lane has been played out (see
+    apply_blasts()).
+
+    Parameters:
+        state (GameState): The game to advance.
+        events (list): The list (or sink) to append events to.
+    """
+    base, blasts = state.rng.getrandbits(64), []
+    for r_index, enemies in enumerate(state.enemy_lanes):
+        if enemies and advance_lane(state, r_index, LaneRandom(lane_seed(base, r_index)), events, blasts):
+            return
+    apply_blasts(state, blasts, events)
+
+
+def advance_lane(state: GameState, r_index: int, rng, events: list, blasts=None) -> bool:
+    """Plays out the moves of the entities in a lane: defenses shoot and
+    enemies attack or advance, from the city outwards.
+
+    Parameters:
+        state (GameState): The game to advance.
+        r_index (int): The row of the lane.
+        rng: The generator the lane draws from: the game's, or a
+        LaneRandom under lane rules.
+        events (list): The list (or sink) to append events to.
+        blasts (list): If given, the blasts of the mines that go off
+        only reach the lane itself, and are recorded in the list to be
+        dealt to the other lanes later; see impact_area().
+
+    Returns:
+        bool: True if an enemy reached the city, losing the game.
+    """
+    row, enemies, variables = state.field[r_index], state.enemy_lanes[r_index], state.variables
+    listening = getattr(events, "listening", True)
+    # How every unit behaves is looked up by its code; see catalog.py.
+    unit_catalog = units()
+    attacks, fires_every, knockback = unit_catalog.attacks, unit_catalog.fires_every, unit_catalog.knockback
+    detonates, damage_against, shoot = unit_catalog.detonates, unit_catalog.damage_against, catalog.SHOOT
+    next_turn = variables["turn"] + 1
+
+    # Sparse rows are gone through an occupied cell at a time; see
+    # SparseRow.scan().
+    for c_index in range(variables["columns"]) if type(row) is list else row.scan():
+        entity = row[c_index]
+
+        # Activates the defense entities; the code below performs the
+        # attacking in a way that is expected of the entities. Units
+        # that fire every few turns (such as cannons, which fire every
+        # second turn) skip the turns in between.
+        if entity is not None and attacks[entity.code] == shoot:
+            if next_turn % fires_every[entity.code]:
+                continue
+
+            # Looks up the first enemy that lies in front of the defense
+            # entity, and deals damage to it.
+            index = bisect_right(enemies, c_index)
+            if index < len(enemies):
+                ahead_col = enemies[index]
+                entity_ahead = row[ahead_col]
+                damage = rng.randint(
+                    entity.min_damage, entity.max_damage)
+                # Manages the cases where a unit deals more or less damage
+                # to some enemies, such as archers dealing half the damage
+                # to skeletons.
+                multiplier = damage_against[entity.code][entity_ahead.code]
+                if multiplier is not None:
+                    damage = damage * multiplier[0] // multiplier[1]
+                mark_changed(state, r_index, ahead_col)
+                entity_ahead.current_health -= damage
+                if listening:
+                    events.append(
+                        Shot(r_index, entity.name, entity_ahead.name, damage))
+
+                if entity_ahead.current_health <= 0:
+                    if listening:
+                        events.append(
+                            Kill(r_index, ahead_col, entity_ahead.name, "player"))
+                    _reward(state, entity_ahead)
+                    put_entity(state, r_index, ahead_col, None)
+                elif knockback[entity.code] and ahead_col + 1 < len(row):
+                    # Checks if the entity can be moved back by a cell. If
+                    # a random choice is true, the entity may be moved
+                    # back.
+                    if row[ahead_col + 1] is None and rng.choice([True, False]):
+                        move_entity(state, r_index,
+                                    ahead_col, ahead_col + 1)
+                        if listening:
+                            events.append(
+                                Knockback(r_index, entity_ahead.name))
+
+        # Advances the enemies; the code below advances the enemies and
+        # performs any attacks that are expected of the enemies.
+        elif entity is not None and entity.type == "enemy":
+            resulting_col = c_index - entity.moves
+            future_cell = row[resulting_col]
+            ahead_cell = row[c_index - 1]
+
+            no_defense = True
+            for cell_index in range(resulting_col, c_index):
+                if row[cell_index] is not None and row[cell_index].type == "player":
+                    no_defense = False
+                    break
+
+            if resulting_col < 0 and no_defense:
+                state.outcome = "loss"
+                events.append(GameOver("loss", entity.name))
+                return True
+
+            damage = rng.randint(
+                entity.min_damage, entity.max_damage)
+            entity_to_attack, target_col = None, None
+
+            # Checks if the cell in front of the enemy is occupied by a
+            # defence entity. If so, the enemy attacks that entity
+            # instead.
+            if ahead_cell is not None and ahead_cell.type == "player":
+                entity_to_attack, target_col = ahead_cell, c_index - 1
+            # Checks if the cell the enemy wishes to occupy is empty; if
+            # not, there is another entity in the way.
+            elif future_cell is not None:
+                entity_to_attack, target_col = future_cell, resulting_col
+            else:
+                move_entity(state, r_index, c_index, resulting_col)
+                if listening:
+                    events.append(Advance(r_index, entity.name))
+
+            if entity_to_attack is not None and detonates[entity_to_attack.code] is not None:
+                impact_area(state, (r_index, target_col),
+                            "mine", events, (r_index, c_index), blasts)
+            elif entity_to_attack is not None:
+                mark_changed(state, r_index, target_col)
+                entity_to_attack.current_health -= damage
+                if listening:
+                    events.append(
+                        Attack(r_index, entity.name, entity_to_attack.name, damage))
+
+                if entity_to_attack.current_health <= 0:
+                    if listening:
+                        events.append(
+                            Kill(r_index, target_col, entity_to_attack.name, "enemy"))
+                    move_entity(state, r_index, c_index, resulting_col)
+                    if listening:
+                        events.append(Advance(r_index, entity.name))
+    return False
+
+
+def enhance_enemies(state: GameState, events: list):
+    """Enhances the enemies in the field and increases the danger level
+    by one.
+
+    The enhancement to health only affects future enemies; current
+    enemies on the field are not affected when an enhancement takes
+    place.
+
+    Parameters:
+        state (GameState): The game to enhance the enemies in.
+        events (list): The list (or sink) to append events to.
+    """
+    for r_index, (row, enemies) in enumerate(zip(state.field, state.enemy_lanes)):
+        for c_index in enemies:
+            enemy = row[c_index]
+            mark_changed(state, r_index, c_index)
+            enemy.min_damage += 1
+            enemy.max_damage += 1
+            enemy.reward += 1
+    for enemy in state.characters["enemy"]:
+        enemy["health"] += 1
+    state.variables["danger_level"] += 1
+    events.append(Enhance(state.variables["danger_level"]))
+
+
+def purchase_defense(state: GameState, unit: str, position: tuple, events: list):
+    """Buys a defense unit and places it at the given position, taking
+    a turn.
+
+    Parameters:
+        state (GameState): The game to buy the unit in.
+        unit (str): The id of the defense unit to buy.
+        position (tuple): The position to place the unit, comprised of (row, col).
+        events (list): The list (or sink) to append events to.
+    """
+    defense = None
+    for template in state.characters["player"]:
+        if template["id"] == unit:
+            defense = template
+            break
+
+    row, col = position
+    if defense is None:
+        events.append(Rejected("There is no unit called {}!".format(unit)))
+    elif state.variables["gold"] - defense["cost"] < 0:
+        events.append(
+            Rejected("You don't have enough gold to place this unit!"))
+    elif not _in_player_half(state, row, col):
+        events.append(
+            Rejected("Units can only be placed on your half of the field!"))
+    elif state.field[row][col] is not None:
+        events.append(Rejected("{} is already in the given position!".format(
+            state.field[row][col].name)))
+    elif spawn_entity(state, defense, "player", position, events):
+        state.variables["gold"] -= defense["cost"]
+        state.variables["turn"] += 1
+
+
+def _upgradable_units(state: GameState) -> str:
+    """Lists the defense units of a game that can be upgraded, as in
+    \"an archer or a wall\"."""
+    unit_catalog = units()
+    names = [template["name"].lower() for template in state.characters["player"]
+             if unit_catalog.upgrades[unit_catalog.code(template["id"])] is not None]
+    return " or ".join("{} {}".format("an" if name[:1] in "aeiou" else "a", name) for name in names) or "upgradable"
+
+
+def enhance_defense(state: GameState, position: tuple, events: list):
+    """Enhances the defense at the given position. The enhancement can
+    only be applied to units with an upgrade in the catalog, which gives
+    its cost and what it adds (see catalog.py). By default, these are:
+    - Archers: min_damage + 1, max_damage + 1, health + 1
+    - Walls: health + 5
+
+    It is assumed that, as with enemies being advanced, enhancing
+    defense does not advance the game by a turn.
+
+    Parameters:
+        state (GameState): The game to enhance the defense in.
+        position (tuple): The position of the defense, comprised of (row, col).
+        events (list): The list (or sink) to append events to.
+    """
+    # Checks if the entity at the given position is a valid entity.
+    row, col = position
+    entity = state.field[row][col]
+    message = ""
+    if entity is None:
+        message = "There is no entity in lane {}, column {}!"
+    elif entity.type == "enemy":
+        message = "The entity in lane {}, column {} is an enemy!"
+    elif units().upgrades[entity.code] is None:
+        message = "The entity in lane {}, column {} is not {}! It cannot be upgraded."
+
+    if message != "":
+        events.append(Rejected(message.format(chr(65 + row), col + 1, _upgradable_units(state))))
+        return
+
+    unit_catalog = units()
+    upgrade, cost = unit_catalog.upgrades[entity.code], unit_catalog.upgrade_cost(entity.code, entity.upgrade_count)
+    if state.variables["gold"] < cost:
+        events.append(
+            Rejected("You do not have enough gold to upgrade this {}!".format(entity.name.lower())))
+        return
+
+    state.variables["gold"] -= cost
+    mark_changed(state, row, col)
+    entity.min_damage += upgrade.min_damage
+    entity.max_damage += upgrade.max_damage
+    entity.current_health += upgrade.health
+    entity.health += upgrade.health
+    entity.upgrade_count += 1
+    events.append(Upgraded(row, col, entity.name))
+
+
+####################
+# Turn functions
+# The two entry points into the engine.
+####################
+
+
+def begin_turn(state: GameState, events=None) -> list:
+    """Performs everything that happens at the start of a turn: checking
+    for a win, enhancing the enemies every 12 turns and spawning an
+    enemy if the field has none, or the enemies of the turn if the game
+    follows a wave plan.
+
+    step() calls this by itself after every action that takes a turn;
+    call it directly only once, when a game is started. A restored game
+    carries on in the turn it was saved in, which has already begun, so
+    this is not called for it again.
+
+    Parameters:
+        state (GameState): The game to begin the turn in.
+        events (list): The list (or sink) to append events to. Defaults
+        to a new list.
+
+    Returns:
+        list: The events that happened (or the sink they were sent to).
+    """
+    events = [] if events is None else events
+    variables = state.variables
+
+    # Checks if the conditions are met to warrant a win.
+    if variables["killed"] >= variables["target"]:
+        state.outcome = "win"
+        events.append(GameOver("win"))
+        return events
+
+    if variables["turn"] > 0 and variables["turn"] % 12 == 0:
+        enhance_enemies(state, events)
+
+    if state.waves is not None and state.waves.covers(variables["turn"]):
+        spawn_planned(state, events)
+    else:
+        spawn_enemy(state, events)
+    return events
+
+
+def step(state: GameState, action: Action, events=None) -> list:
+    """Carries out an action in the game. If the action takes a turn,
+    the turn is played out and the next turn begins.
+
+    Parameters:
+        state (GameState): The game to carry the action out in.
+        action (Action): The action to carry out.
+        events (list): The list (or sink) to append events to. Defaults
+        to a new list.
+
+    Returns:
+        list: The events that happened (or the sink they were sent to).
+        An action that cannot be carried out leaves the game unchanged
+        and gives a Rejected event.
+    """
+    if state.outcome is not None:
+        raise ValueError("The game has already ended.")
+
+    events = [] if events is None else events
+    variables = state.variables
+    previous_turn = variables["turn"]
+
+    if isinstance(action, Buy):
+        purchase_defense(state, action.unit,
+                         (action.row, action.column), events)
+    elif isinstance(action, Upgrade):
+        if _in_player_half(state, action.row, action.column):
+            enhance_defense(state, (action.row, action.column), events)
+        else:
+            events.append(
+                Rejected("Only units on your half of the field can be upgraded!"))
+    elif isinstance(action, Heal):
+        if _in_player_half(state, action.row, action.column):
+            impact_area(state, (action.row, action.column), "heal", events)
+        else:
+            events.append(
+                Rejected("Only your half of the field can be healed!"))
+    elif isinstance(action, EndTurn):
+        variables["turn"] += 1
+    else:
+        raise TypeError("Unknown action: {!r}".format(action))
+
+    if previous_turn != variables["turn"]:
+        if not state.lane_rules:
+            advance_entities(state, events)
+        elif state.resolver is None:
+            advance_lanes(state, events)
+        else:
+            state.resolver(state, events)
+        if state.outcome is not None:
+            return events
+
+        variables["gold"] += 1
+        if state.waves is not None and state.waves.covers(variables["turn"]):
+            # The plan spawns the enemies, so the threat of kills does
+            # not; it is only kept below 10 as it would otherwise be.
+            variables["threat_level"] %= 10
+        else:
+            variables["threat_level"] += state.rng.randint(
+                1, variables["danger_level"])
+            while variables["threat_level"] >= 10:
+                spawn_enemy(state, events, override=True)
+                variables["threat_level"] -= 10
+        begin_turn(state, events)
+    return events
+
+####################
+# Hashing and snapshots
+# For searches (see advisor.py) and undoing actions: a hash of a game
+# that is kept up to date as the game changes, and snapshots that a game
+# can be restored to. Both only look at the cells changed since they
+# were last used (see mark_changed()), rather than the whole field.
+####################
+
+
+def _zobrist_key(part: tuple) -> int:
+    key = _zobrist_keys.get(part)
+    if key is None:
+        key = _zobrist_keys[part] = _zobrist_rng.getrandbits(64)
+    return key
+
+
+def _cell_key(row: int, col: int, entity: Optional[Entity]) -> int:
+    """Returns the key of what a cell holds: 0 if it is empty, or the
+    key of the entity and its stats in the cell."""
+    if entity is None:
+        return 0
+    return _zobrist_key((row, col, entity.code, entity.current_health, entity.health, entity.min_damage,
+                         entity.max_damage, entity.reward, entity.upgrade_count))
+
+
+def state_hash(state: GameState) -> int:
+    """Hashes a game, Zobrist style: every part of the game (an entity
+    with its stats in a cell, the value of a game variable, the health
+    enemies spawn with and the outcome) has a random 64-bit key, and the
+    hash is the exclusive or of the keys of its parts. Games alike hash
+    alike.
+
+    The hash of the field is kept from one call to the next and only
+    updated for the cells changed in between, so only the first call
+    looks at the whole field.
+
+    Parameters:
+        state (GameState): The game to hash.
+
+    Returns:
+        int: The hash.
+    """
+    field, unhashed = state.field, state.unhashed_cells
+    if state.field_hash is None:
+        state.field_hash = 0
+        for r_index, row in enumerate(field):
+            for c_index, entity in occupied_cells(row):
+                state.field_hash ^= _cell_key(r_index, c_index, entity)
+    elif unhashed:
+        for (r_index, c_index), key in unhashed.items():
+            state.field_hash ^= key ^ _cell_key(r_index, c_index, field[r_index][c_index])
+        unhashed.clear()
+
+    value = state.field_hash ^ _zobrist_key(("outcome", state.outcome))
+    for name, variable in state.variables.items():
+        value ^= _zobrist_key((name, variable))
+    for index, template in enumerate(state.characters["enemy"]):
+        value ^= _zobrist_key(("enemy", index, template["health"]))
+    return value
+
+
+class Snapshot(NamedTuple):
+    """A point a game can be restored to; see snapshot(). Besides the
+    cells changed since (kept in the game's undo log), it holds what
+    else of the game can change: the game variables, the enemy
+    templates, the outcome and the state of the random number
+    generator, if it was kept."""
+    variables: dict
+    enemies: list
+    outcome: Optional[str]
+    random_state: Optional[tuple]
+    cells: dict
+
+
+def snapshot(state: GameState, random_state=True) -> Snapshot:
+    """Takes a snapshot of a game, which it can later be restored to
+    with restore(). Rather than copying the field, the game keeps what
+    every cell held before it was first changed after the snapshot, so
+    taking and restoring a snapshot only costs as much as the cells
+    changed in between.
+
+    Snapshots can be taken on top of one another; every snapshot logs
+    every change made while it is held, whatever snapshots are taken on
+    top of it, so its log (Snapshot.cells) tells what any cell held when
+    it was taken. Every snapshot must end with restore() or release(),
+    or the game keeps logging changes for it.
+
+    Parameters:
+        state (GameState): The game to take a snapshot of.
+        random_state (bool): Whether to keep the state of the game's
+        random number generator. Copying it costs more than the rest of
+        a snapshot of a small game, so callers that give the game a
+        generator of their own until it is restored (such as the
+        rollouts of advisor.py) can leave it out.
+
+    Returns:
+        Snapshot: The snapshot.
+    """
+    cells = {}
+    state.undo_log.append(cells)
+    return Snapshot(dict(state.variables), [dict(template) for template in state.characters["enemy"]],
+                    state.outcome, state.rng.getstate() if random_state else None, cells)
+
+
+def _log_index(state: GameState, point: Snapshot) -> int:
+    for index, cells in enumerate(state.undo_log):
+        if cells is point.cells:
+            return index
+    raise ValueError("The snapshot has already been restored or released.")
+
+
+def restore(state: GameState, point: Snapshot):
+    """Restores a game to a snapshot, dropping it and any snapshot taken
+    after it.
+
+    Parameters:
+        state (GameState): The game to restore.
+        point (Snapshot): The snapshot to restore it to.
+
+    Raises:
+        ValueError: If the snapshot has already been restored or
+        released.
+    """
+    index = _log_index(state, point)
+    cells, state.undo_log = state.undo_log[index], state.undo_log[:index]
+    # The snapshot logged every cell changed since it was taken, which
+    # the snapshots before it have logged too, so their logs are left
+    # alone as the cells are put back.
+    log, state.undo_log = state.undo_log, []
+    for (r_index, c_index), entity in cells.items():
+        put_entity(state, r_index, c_index, entity)
+    state.undo_log = log
+
+    state.variables.clear()
+    state.variables.update(point.variables)
+    state.characters["enemy"] = point.enemies
+    state.outcome = point.outcome
+    if point.random_state is not None:
+        state.rng.setstate(point.random_state)
+
+
+def release(state: GameState, point: Snapshot):
+    """Drops a snapshot that is no longer needed, leaving the game as it
+    is. The snapshots before it have logged everything it did.
+
+    Raises:
+        ValueError: If the snapshot has already been restored or
+        released.
+    """
+    del state.undo_log[_log_index(state, point)]
@@ -0,0 +1,288 @@
+# Journal of a Desperate Defenders game
+#
+# Rather than writing the whole game after every action, the journal
+# appends what the action changed: the action itself, the game
+# variables, and the cells the engine changed (see
+# GameState.changed_cells). Every so often a full checkpoint of the game
+# is written as well, which holds the state of the game's random number
+# generator (see savefile.write_compact()). A game is restored by
+# loading the latest checkpoint and playing the actions recorded after it
+# again, which leaves the random number generator where it was, and a
+# game can be replayed exactly by loading any checkpoint and playing the
+# recorded actions again from it.
+#
+# The journal is a text file with one JSON record per line. A line cut
+# short by a crash is ignored when the journal is read.
+#
+# Games can be replayed from the command line, checking every action
+# gives the same result as it did when it was recorded:
+#     python3 journal.py replay autosave.ddj
+
+import base64
+import io
+import json
+import sys
+
+import engine
+import savefile
+import waves
+
+# The number of actions between checkpoints.
+CHECKPOINT_EVERY = 50
+
+
+def _encode_action(action) -> list:
+    return [type(action).__name__] + list(action)
+
+
+def _decode_action(data: list):
+    action_type = getattr(engine, data[0], None)
+    if action_type not in [engine.Buy, engine.Upgrade, engine.Heal, engine.EndTurn]:
+        raise savefile.SaveFileError(
+            "The journal has an unknown action ({}).".format(data[0]))
+    return action_type(*data[1:])
+
+
+def _encode_cell(entity: engine.Entity) -> list:
+    if entity is None:
+        return None
+    return [entity.id, entity.current_health, entity.health, entity.min_damage,
+            entity.max_damage, entity.reward, entity.upgrade_count]
+
+
+def _decode_cell(data: list, kinds: dict) -> engine.Entity:
+    if data is None:
+        return None
+    return engine.Entity(kinds[data[0]], *data[1:])
+
+
+class Journal:
+    """Records a game to a journal file as it is played.
+
+    Creating a journal starts tracking the changes to the game and
+    writes a checkpoint of it. record() must then be called after every
+    action.
+
+    Attributes:
+        file_name (str): The name of the journal file.
+        checkpoint_every (int): The number of actions between checkpoints.
+        autoflush (bool): Whether every record is flushed to the file as
+        it is written; if not, flush() has to be called.
+    """
+
+    def __init__(self, file_name: str, state: engine.GameState, append=False, checkpoint_every=CHECKPOINT_EVERY,
+                 autoflush=True):
+        self.file_name, self.checkpoint_every, self.autoflush = file_name, checkpoint_every, autoflush
+        self._file = open(file_name, "a" if append else "w")
+        self._characters = json.dumps(state.characters)
+        self._since_checkpoint = 0
+        self._waves = None
+        state.changed_cells = set()
+        self.checkpoint(state)
+
+    def checkpoint(self, state: engine.GameState):
+        """Writes the whole game to the journal."""
+        buffer = io.BytesIO()
+        savefile.write_compact(state, buffer, waves=False)
+        record = {"checkpoint": base64.b64encode(buffer.getvalue()).decode("ascii")}
+        # Save files do not keep the outcome, as ended games are not
+        # saved, but the journal carries on to the end of the game.
+        if state.outcome is not None:
+            record["outcome"] = state.outcome
+        # Games following a wave plan are replayed with it. Plans can be
+        # long, so they are only written in full when they change.
+        if state.waves is not None:
+            record["waves"] = True if state.waves is self._waves else state.waves.to_data()
+            self._waves = state.waves
+        self._write(record)
+        state.changed_cells.clear()
+        self._since_checkpoint = 0
+
+    def record(self, state: engine.GameState, action):
+        """Writes the changes an action made to the game.
+
+        Parameters:
+            state (GameState): The game, after the action.
+            action (Action): The action that was taken.
+        """
+        delta = {"action": _encode_action(action), "variables": state.variables,
+                 "cells": [[r_index, c_index, _encode_cell(state.field[r_index][c_index])]
+                           for r_index, c_index in sorted(state.changed_cells)]}
+        # Templates only change when the enemies are enhanced.
+        characters = json.dumps(state.characters)
+        if characters != self._characters:
+            delta["characters"], self._characters = state.characters, characters
+        if state.outcome is not None:
+            delta["outcome"] = state.outcome
+        self._write(delta)
+        state.changed_cells.clear()
+
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint(state)
+
+    def flush(self):
+        """Writes the records not yet written out to the file."""
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        if self.autoflush:
+            self._file.flush()
+
+
+def read_records(file_name: str) -> list:
+    """Reads the records of a journal file, leaving out a last line cut
+    short by a crash.
+
+    Raises:
+        SaveFileError: If a record other than the last cannot be read.
+    """
+    with open(file_name, "r") as file:
+        lines = file.readlines()
+    records = []
+    for index, line in enumerate(lines):
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            if index == len(lines) - 1:
+                break
+            raise savefile.SaveFileError(
+                "Error in line {} of the journal: The record cannot be read.".format(index + 1))
+    return records
+
+
+def _restore_checkpoint(record: dict, sparse=False, plan=None) -> engine.GameState:
+    """Restores the game at a checkpoint. plan is the wave plan written
+    in full last before the checkpoint, which the checkpoint refers to
+    if its game still follows it."""
+    state = savefile.read_compact(io.BytesIO(
+        base64.b64decode(record["checkpoint"])), sparse)
+    state.outcome = record.get("outcome")
+    if "waves" in record:
+        if record["waves"] is not True:
+            plan = record["waves"]
+        try:
+            state.waves = waves.from_data(plan, state.characters)
+        except waves.WaveError as error:
+            raise savefile.SaveFileError("The journal is damaged ({}).".format(error))
+    return state
+
+
+def apply(state: engine.GameState, delta: dict):
+    """Applies the changes recorded for an action to a game."""
+    state.variables.clear()
+    state.variables.update(delta["variables"])
+    kinds = {template["id"]: engine.kind_of(template, type)
+             for type in ["player", "enemy"] for template in state.characters[type]}
+    for r_index, c_index, cell in delta["cells"]:
+        engine.put_entity(state, r_index, c_index, _decode_cell(cell, kinds))
+    if "characters" in delta:
+        state.characters = delta["characters"]
+    state.outcome = delta.get("outcome")
+
+
+def load(file_name: str, sparse=False) -> engine.GameState:
+    """Restores the game at the end of a journal, from its latest
+    checkpoint and the actions recorded after it, with a sparse field if
+    sparse is given (see engine.new_field()).
+
+    Raises:
+        SaveFileError: If the journal cannot be read or has no
+        checkpoint.
+    """
+    try:
+        records = read_records(file_name)
+        latest = max(index for index, record in enumerate(
+            records) if "checkpoint" in record)
+    except OSError as error:
+        raise savefile.SaveFileError(str(error))
+    except ValueError:
+        raise savefile.SaveFileError("The journal has no checkpoint.")
+
+    try:
+        plan = next((record["waves"] for record in reversed(records[:latest])
+                     if isinstance(record.get("waves"), dict)), None)
+        state = _restore_checkpoint(records[latest], sparse, plan)
+        for delta in records[latest + 1:]:
+            engine.step(state, _decode_action(delta["action"]))
+            if not _matches(state, delta):
+                break
+        else:
+            return state
+
+        # Journals whose actions do not play out as recorded again are
+        # restored from the recorded changes alone.
+        state = _restore_checkpoint(records[latest], sparse, plan)
+        for delta in records[latest + 1:]:
+            apply(state, delta)
+    except (KeyError, TypeError, ValueError) as error:
+        raise savefile.SaveFileError(
+            "The journal is damaged ({}).".format(error))
+    return state
+
+
+def replay(file_name: str):
+    """Plays a journal again from its first checkpoint, checking every
+    action has the same result as when it was recorded.
+
+    Yields:
+        tuple: The number of the action, the action, the events it
+        caused and whether its result matched the journal.
+    """
+    records, state, plan = read_records(file_name), None, None
+    number = 0
+    for record in records:
+        if "checkpoint" in record:
+            # Carries on from the checkpoint, so that actions recorded
+            # after the game was loaded again replay from the state it
+            # was loaded in.
+            state = _restore_checkpoint(record, plan=plan)
+            if isinstance(record.get("waves"), dict):
+                plan = record["waves"]
+            continue
+        if state is None:
+            raise savefile.SaveFileError("The journal has no checkpoint.")
+
+        number += 1
+        action = _decode_action(record["action"])
+        events = engine.step(state, action)
+        yield number, action, events, _matches(state, record)
+
+
+def _matches(state: engine.GameState, delta: dict) -> bool:
+    """Checks a game matches the changes recorded for an action."""
+    if state.variables != delta["variables"] or state.outcome != delta.get("outcome"):
+        return False
+    for r_index, c_index, cell in delta["cells"]:
+        if _encode_cell(state.field[r_index][c_index]) != cell:
+            return False
+    return "characters" not in delta or state.characters == delta["characters"]
+
+
+####################
+# Execution point
+# Replays a journal.
+####################
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "replay":
+        print("Usage: python3 journal.py replay <journal>")
+        sys.exit(2)
+
+    matched = True
+    try:
+        for number, action, events, match in replay(sys.argv[2]):
+            print("{:>6} {}".format(number, action))
+            for event in events:
+                print("       {}".format(event))
+            if not match:
+                print("[!] Action {} did not give the recorded result.".format(number))
+                matched = False
+    except (OSError, savefile.SaveFileError) as error:
+        print(error)
+        sys.exit(1)
+    sys.exit(0 if matched else 1)
@@ -0,0 +1,217 @@
+# Lane-parallel turn resolution for Desperate Defenders
+#
+# In a game playing by lane rules (see engine.GameState.lane_rules),
+# every lane (row) of the field plays out on its own within a turn:
+# engine.advance_lanes() plays the lanes with engine.advance_lane(),
+# every lane drawing from a random number generator of its own, seeded
+# from a single draw of the game's generator, and the blasts of mines
+# only reach the lanes next to them once every lane has been played out
+# (see engine.apply_blasts()). This file plays the lanes of a turn out
+# over worker processes instead, for very tall fields, each lane on a
+# field of its own with engine.advance_lane(), and then merges them.
+#
+# Lane rules are not the rules of engine.advance_entities(), which draws
+# from the game's generator lane after lane and blasts the lanes next to
+# a mine at once, so a game playing by lane rules plays out differently
+# from one that does not, even with the same seed. Only games started
+# with --lanes play by them.
+#
+# The lanes are merged in order: the cells each lane changed, its
+# events and the gold, kills and threat its kills were worth. As in
+# advance_lanes(), the game is lost to the first lane, in order, that
+# an enemy got through, and the lanes after it are left as they were;
+# otherwise, the blasts of the mines are dealt last. A game resolved
+# over workers plays out exactly as it does with advance_lanes(),
+# down to its events and random state; benchmarks/lane_parallel.py
+# checks this.
+#
+# Handing the lanes to the workers and merging their changes back is
+# itself about as costly as playing them out in one process (see the
+# benchmark), so the workers need several CPUs to pay off, and turns
+# with fewer than MIN_ENTITIES entities in lanes with enemies are played
+# out by advance_lanes() itself. A game playing by lane rules is
+# resolved over workers by setting its resolver:
+#     state.lane_rules, state.resolver = True, lanes.LaneResolver(workers=4)
+
+import random
+
+import engine
+
+# The fewest entities in lanes with enemies for a turn to be handed to
+# the workers.
+MIN_ENTITIES = 20000
+
+
+class _Quiet:
+    """Keeps the events made even for a sink that is not listening (such
+    as the end of the game), for lanes whose other events nobody is
+    listening to."""
+    listening = False
+
+    def __init__(self):
+        self.events = []
+
+    def append(self, event):
+        self.events.append(event)
+
+
+# Every lane draws from a LaneRandom of its own, so the games lanes are
+# played out on share one generator that is never drawn from, rather
+# than each seeding one of their own.
+_UNUSED_RNG = random.Random(0)
+
+# The events that say which lane they happened in.
+_LANE_EVENTS = {engine.Spawn, engine.Shot, engine.Attack, engine.Kill, engine.Advance, engine.Knockback,
+                engine.Detonation, engine.Blast, engine.Healed, engine.Upgraded}
+
+
+def _encode_cell(entity: engine.Entity) -> tuple:
+    if entity is None:
+        return None
+    return (entity.kind, entity.current_health, entity.health, entity.min_damage, entity.max_damage,
+            entity.reward, entity.upgrade_count)
+
+
+def _decode_cell(data: tuple) -> engine.Entity:
+    if data is None:
+        return None
+    return engine.Entity(*data)
+
+
+def resolve_lanes(ids: list, variables: dict, sparse: bool, listening: bool, lanes: list) -> list:
+    """Plays out lanes apart from one another. This is the work handed to
+    every worker, so it only takes and returns plain data, with entities
+    as tuples of their kind and stats.
+
+    Parameters:
+        ids (list): The ids of the units in the order of their codes, so
+        that units missing from the catalog get the same codes in every
+        process.
+        variables (dict): The game variables.
+        sparse (bool): Whether the rows of the field are sparse.
+        listening (bool): Whether the events of every cell are needed.
+        lanes (list): The lanes to play out, as (row, seed, cells), with
+        seed the seed of the lane's generator (see engine.lane_seed())
+        and cells the
+        (column, entity) of every occupied cell.
+
+    Returns:
+        list: For every lane, its row, the (column, entity) of every cell
+        it changed, its events, the gold, kills and threat it earned, the
+        blasts of its mines (see engine.impact_area()) and whether it
+        lost the game.
+    """
+    for unit_id in ids:
+        engine.units().code(unit_id)
+    variables = dict(variables, rows=1)
+    earned = ["gold", "killed", "threat_level"]
+    results = []
+    for r_index, seed, cells in lanes:
+        row = engine.new_field(1, variables["columns"], sparse)[0]
+        for c_index, data in cells:
+            row[c_index] = _decode_cell(data)
+        game = engine.GameState([row], dict(variables), {"player": [], "enemy": []}, rng=_UNUSED_RNG)
+        game.changed_cells = set()
+        events, blasts = [] if listening else _Quiet(), []
+        lost = engine.advance_lane(game, 0, engine.LaneRandom(seed), events, blasts)
+
+        # Puts the events and blasts back in the lane they happened in;
+        # every event that happens in a lane has it first.
+        events = [type(event)(r_index, *event[1:]) if type(event) in _LANE_EVENTS else event
+                  for event in (events if listening else events.events)]
+        changed = [(c_index, _encode_cell(row[c_index])) for _, c_index in sorted(game.changed_cells)]
+        gains = [game.variables[name] - variables[name] for name in earned]
+        results.append((r_index, changed, events, gains, [(r_index,) + blast[1:] for blast in blasts], lost))
+    return results
+
+
+class LaneResolver:
+    """Plays out the moves of the entities in a turn of a game playing by
+    lane rules over worker processes, in place of engine.advance_lanes();
+    see above.
+
+    Lanes without enemies are left out, as nothing happens in them. The
+    rest are shared out between the workers in runs of neighbouring
+    lanes with about as many entities each.
+
+    Attributes:
+        workers (int): The number of worker processes; with 1, every
+        turn is played out by advance_lanes().
+        min_entities (int): The fewest entities in lanes with enemies for
+        a turn to be handed to the workers; turns with fewer are played
+        out by advance_lanes().
+    """
+
+    def __init__(self, workers=1, min_entities=MIN_ENTITIES):
+        self.workers, self.min_entities = workers, min_entities
+        self._pool = None
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=workers)
+
+    def close(self):
+        """Stops the workers."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> "LaneResolver":
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def _shards(self, lanes: list) -> list:
+        """Splits the lanes into runs with about as many entities each,
+        one for every worker."""
+        total, shards, shard, size = sum(len(cells) for _, _, cells in lanes), [], [], 0
+        for lane in lanes:
+            shard.append(lane)
+            size += len(lane[2])
+            if size * self.workers >= total * (len(shards) + 1) and len(shards) < self.workers - 1:
+                shards.append(shard)
+                shard = []
+        return shards + [shard] if shard else shards
+
+    def __call__(self, state: engine.GameState, events: list):
+        """Plays out the moves of the entities in a turn.
+
+        Parameters:
+            state (GameState): The game to advance.
+            events (list): The list (or sink) to append events to.
+
+        Raises:
+            ValueError: If the game does not play by lane rules.
+        """
+        if not state.lane_rules:
+            raise ValueError("Only games playing by lane rules can be resolved by lanes.")
+        lanes = [(r_index, engine.occupied_cells(row))
+                 for r_index, (row, enemies) in enumerate(zip(state.field, state.enemy_lanes)) if enemies]
+        if self._pool is None or sum(len(cells) for _, cells in lanes) < self.min_entities:
+            engine.advance_lanes(state, events)
+            return
+
+        listening = getattr(events, "listening", True)
+        base = state.rng.getrandbits(64)
+        lanes = [(r_index, engine.lane_seed(base, r_index), [(c_index, _encode_cell(entity)) for c_index, entity in cells])
+                 for r_index, cells in lanes]
+        sparse = type(state.field[0]) is engine.SparseRow
+        arguments = (engine.units().ids, state.variables, sparse, listening)
+        results = [result for shard_results in self._pool.map(
+            resolve_lanes, *[[argument] * self.workers for argument in arguments], self._shards(lanes))
+            for result in shard_results]
+
+        # Merges the lanes in order, as advance_lanes() plays them.
+        variables, blasts = state.variables, []
+        for r_index, changed, lane_events, gains, lane_blasts, lost in results:
+            for c_index, data in changed:
+                engine.put_entity(state, r_index, c_index, _decode_cell(data))
+            for event in lane_events:
+                events.append(event)
+            for name, gain in zip(["gold", "killed", "threat_level"], gains):
+                variables[name] += gain
+            if lost:
+                state.outcome = "loss"
+                return
+            blasts.extend(lane_blasts)
+        engine.apply_blasts(state, blasts, events)
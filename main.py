@@ -8,14 +8,26 @@
 # fight against incoming waves of enemies, the player has to plan and
 # play the game strategically in order to win.
 
-import json
 import os
-import random
-import re
-from datetime import datetime
+import sys
 from math import inf
-from textwrap import wrap
-from typing import Union
+from typing import TYPE_CHECKING, Union
+
+import commands
+import engine
+import render
+import sinks
+
+if TYPE_CHECKING:
+    import asyncio
+
+# Importing this file has no side effects, so the functions of the
+# console game can be used by other programs (for example, a simulation
+# and its worker processes). To keep importing it quick, the modules
+# only some parts of the game need (saving and loading, the settings,
+# moving the view, the real-time mode and profiling) are imported by the
+# functions that use them, and the unit catalog is read when it is first
+# used (see engine.py).
 
 
 def display_intro_menu():
@@ -63,108 +75,15 @@ def get_choice(upper_bound: int, lower_bound=1, message="Your choice? ", val_err
             return choice
 
 
-CHARACTERS = {
-    "player": [
-        {
-            "id": "ARCHR",
-            "name": "Archer",
-            "health": 5,
-            "min_damage": 1,
-            "max_damage": 4,
-            "cost": 5
-        },
-        {
-            "id": "WALL",
-            "name": "Wall",
-            "health": 20,
-            "min_damage": 0,
-            "max_damage": 0,
-            "cost": 3
-        },
-        {
-            "id": "CANON",
-            "name": "Cannon",
-            "health": 8,
-            "min_damage": 3,
-            "max_damage": 5,
-            "cost": 7
-        },
-        {
-            "id": "MINE",
-            "name": "Mine",
-            "health": 10,
-            "min_damage": 10,
-            "max_damage": 10,
-            "cost": 8
-        }
-    ],
-    "enemy": [
-        {
-            "id": "ZOMBI",
-            "name": "Zombie",
-            "health": 15,
-            "min_damage": 3,
-            "max_damage": 6,
-            "moves": 1,
-            "reward": 2
-        },
-        {
-            "id": "WWOLF",
-            "name": "Werewolf",
-            "health": 10,
-            "min_damage": 1,
-            "max_damage": 4,
-            "moves": 2,
-            "reward": 3
-        },
-        {
-            "id": "SKELE",
-            "name": "Skeleton",
-            "health": 10,
-            "min_damage": 1,
-            "max_damage": 3,
-            "moves": 1,
-            "reward": 3
-        },
-    ]
-}
-
-game_variables = {
-    "columns": 7,
-    "rows": 5,
-    "turn": 0,
-    "threat_level": 0,
-    "danger_level": 1,
-    "target": 20,
-    "killed": 0,
-    "gold": 10
-}
+# The game variables the next new game starts with. These can be
+# changed from the settings menu.
+game_variables = engine.GAME_VARIABLES.copy()
 
 # A redundant copy of game_variables, in case game_variables has been
 # amended but needs to revert back to the original values (i.e., on
 # loading a corrupted saved game).
 redundant_game_variables = game_variables.copy()
 
-# This variable keeps track of how the game is played. It is a row by
-# column (defined in game_variables) matrix. Cells in the matrix can
-# have one of two values:
-# - {}: There is nothing occupying the cell.
-# - A dict containing the following keys:
-#   - id (str): The id of the entity occupying the cell.
-#   - type (str): The type of entity occupying the cell.
-#       - "player"
-#       - "enemy"
-#   - current_health (int): The current health of the entity occupying
-# the cell.
-#   - health (int): The maximum health of the entity occupying the cell.
-#   - min_damage (int): The minimum damage the entity can deal.
-#   - max_damage (int): The maximum damage the entity can deal.
-#   - moves (int): The number of moves the entity can make.
-#   - reward (int): The reward the entity gives the player. (if type is
-# enemy)
-field = [[{}] * game_variables["columns"]
-         for _ in range(game_variables["rows"])]
-
 ####################
 # Settings functions
 # All functions in this chunk handles the logic for displaying and editing
@@ -174,12 +93,7 @@ field = [[{}] * game_variables["columns"]
 
 def manage_game_settings():
     """Displays the menu with the game settings, and allows the player
-    to alter the game settings."""
-    global field
-
-    for line in ["Game settings", "-" * 19]:
-        print(line)
-
+    to alter the game settings until they go back to the main menu."""
     pretty_titles = ["Columns", "Rows", "Initial threat level",
                      "Initial danger level", "Target", "Initial gold"]
     pretty_descriptions = ["The number of columns in the game.",
@@ -190,47 +104,43 @@ def manage_game_settings():
                            ]
     variables = ["columns", "rows", "threat_level",
                  "danger_level", "target", "gold"]
-    for index, variable in enumerate(variables):
-        print("\n{}. {:<69} {} {}".format(index + 1, pretty_titles[index], game_variables[variable],
-              "" if game_variables[variable] == redundant_game_variables[variable] else "[{}]".format(redundant_game_variables[variable])))
-        for wrapped_line in wrap(pretty_descriptions[index], width=72):
-            print(wrapped_line)
-    print("\n{}. Back to main menu".format(len(variables) + 1))
 
     # Declares the restrictions values can have; used together with the
     # for loop below to replace repetitive lines of if-elifs.
     restrictions = [None, None, (1, 10), (1, 10), None, None]
 
-    choice = get_choice(len(variables) + 1)
-    if choice == len(variables) + 1:
-        return
+    import textwrap
 
-    # Technically a replacement for an if-elif statement spanning all
-    # the cases. This is to save a little more space (if-elifs
-    # continuously don't look that good) and also make the program
-    # adaptable (if more variables are added in the future, the program
-    # cater to them).
-    for index in range(len(variables)):
-        if choice == index + 1:
-            print("\nNow changing {}; current value is {}.".format(
-                pretty_titles[index].lower(), game_variables[variables[index]]))
-            if restrictions[index] is None:
-                game_variables[variables[index]] = get_choice(
-                    inf, message="What value would you like to give this variable? ")
-
-                # Handles special cases where the field needs to be
-                # redeclared if the columns (index 0) or rows (index 1)
-                # are changed.
-                if index == 0 or index == 1:
-                    field = [[{}] * game_variables["columns"]
-                             for _ in range(game_variables["rows"])]
-            else:
-                game_variables[variables[index]] = get_choice(
-                    restrictions[index][1], lower_bound=restrictions[index][0], message="What value would you like to give this variable? ")
-            break
+    while True:
+        for line in ["Game settings", "-" * 19]:
+            print(line)
+
+        for index, variable in enumerate(variables):
+            print("\n{}. {:<69} {} {}".format(index + 1, pretty_titles[index], game_variables[variable],
+                  "" if game_variables[variable] == redundant_game_variables[variable] else "[{}]".format(redundant_game_variables[variable])))
+            for wrapped_line in textwrap.wrap(pretty_descriptions[index], width=72):
+                print(wrapped_line)
+        print("\n{}. Back to main menu".format(len(variables) + 1))
+
+        choice = get_choice(len(variables) + 1)
+        if choice == len(variables) + 1:
+            return
 
-    print()
-    manage_game_settings()
+        # Technically a replacement for an if-elif statement spanning all
+        # the cases. This is to save a little more space (if-elifs
+        # continuously don't look that good) and also make the program
+        # adaptable (if more variables are added in the future, the
+        # program cater to them).
+        index = choice - 1
+        print("\nNow changing {}; current value is {}.".format(
+            pretty_titles[index].lower(), game_variables[variables[index]]))
+        if restrictions[index] is None:
+            game_variables[variables[index]] = get_choice(
+                inf, message="What value would you like to give this variable? ")
+        else:
+            game_variables[variables[index]] = get_choice(
+                restrictions[index][1], lower_bound=restrictions[index][0], message="What value would you like to give this variable? ")
+        print()
 
 ####################
 # Game restoration and saving functions
@@ -239,107 +149,147 @@ def manage_game_settings():
 ####################
 
 
-SAVE_GAME_FILE_NAME = "saved_game.dd"
+SAVE_GAME_FILE_NAME = "saved_game.ddc"
+TEXT_SAVE_GAME_FILE_NAME = "saved_game.dd"
+AUTOSAVE_FILE_NAME = "autosave.ddj"
+
+# Writes saves on a background thread, so the game never waits for the
+# disk. It is created by get_autosaver() when the first save is made.
+autosaver = None
+
+# The journal the game being played is autosaved to; every action is
+# appended to it as it is taken. See journal.py.
+game_journal = None
+
+# The number of actions that can be undone, and the snapshots of the
+# game (see engine.snapshot()) taken before each of them, oldest first.
+UNDO_LIMIT = 20
+undo_points = []
+
+
+def get_autosaver():
+    """Returns the autosaver, creating it if no save has been made yet.
+
+    Returns:
+        Autosaver: The autosaver; see autosave.py.
+    """
+    global autosaver
+    if autosaver is None:
+        import autosave
+        autosaver = autosave.Autosaver()
+    return autosaver
 
 
-def load_game() -> bool:
-    """Attempts to restore a saved game.
+def start_over(file_name: str) -> Union[engine.GameState, None]:
+    """Asks the player whether to start a new game after a saved game
+    could not be fully restored. If so, the save file and its older
+    generations are renamed to keep them for the player to investigate.
+
+    Parameters:
+        file_name (str): The name of the save file.
 
     Returns:
-        bool: True if the game has been restored successfully, False otherwise.
+        GameState: The new game, or None if the player declined.
     """
-    global game_variables, redundant_game_variables, field, redundant_field
-    if not(SAVE_GAME_FILE_NAME in os.listdir()):
-        print("No saved game found. If you have it stored somewhere else or named differently, move the file and rename it to \"saved_game.dd\" and try again.")
-        return False
+    global game_variables
+    from datetime import datetime
+
+    import autosave
+    confirm = input(
+        "Start a new game? Your data will be preserved in a separate file for you to investigate. (y/N) ")
+    if confirm.lower() == "y":
+        preserved_prefix = datetime.now().strftime("%Y%m%d-%H%M%S")
+        for name in autosave.generation_file_names(file_name):
+            if os.path.exists(name):
+                os.replace(name, preserved_prefix + name[len(os.path.splitext(file_name)[0]):])
+
+        # Starts over using the redundant variables.
+        game_variables = redundant_game_variables.copy()
+        return engine.new_game(game_variables)
     else:
-        with open(SAVE_GAME_FILE_NAME, "r") as file:
-            data = file.readlines()
-            changed = []
-
-            # Restores the game variables.
-            variables_restored = True
-            stored_game_variables = data[5:data.index("\n", 5)]
-            for index, variable in enumerate(stored_game_variables):
-                try:
-                    key, value = variable.split(",")
-                    assert key in game_variables
-                except AssertionError:
-                    print("Error in line {} ({}): The key {} is not known to the game.".format(
-                        5 + index, variable.strip(), key))
-                    variables_restored = False
-                except ValueError:
-                    print("Error in line {} ({}): The game variables are not in the right format.".format(
-                        5 + index, variable.strip()))
-                    variables_restored = False
-                except:
-                    print(
-                        "An irrecoverable error occurred while reading game variable data. For safety, the game will end.")
-                    return
-                else:
-                    value = value.strip()
-                    game_variables[key] = int(
-                        value) if value.isdigit() else value
-            if variables_restored:
-                changed.append("Game variables")
+        return None
 
-            # Restores the field.
-            try:
-                field_restored = True
-                saved_field = data[data.index("# Field #\n") + 1:]
-                if len(saved_field) != game_variables["rows"]:
-                    print(
-                        "Error in restoring field: The game-set number of rows does not match the saved number of rows.")
-                    field_restored = False
-                else:
-                    field = [[{}] * game_variables["columns"]
-                             for _ in range(game_variables["rows"])]
-                    for r_index, row in enumerate(saved_field):
-                        row = row.strip().split(";")
-                        for c_index, cell in enumerate(row):
-                            cell_data = json.loads(cell)
-                            field[r_index][c_index] = cell_data
-                if field_restored:
-                    changed.append("Field")
-            except:
-                print(
-                    "An irrecoverable error occurred while reading the game field. For safety, the game will end.")
-                return
 
-            # Checks if the program has encountered any issue while
-            # restoring the game. If so, the program prompts the user
-            # to see if they'd like to start a new game; if so, the
-            # save file is renamed and a new game will begin. Otherwise,
-            # the program will end.
-            if len(changed) != 2:
-                print(
-                    "\n[!] Some data could not be restored. The game may be in an inconsistent state.")
-                print("The following have been fully restored, though:")
-                for change in changed:
-                    print("- {}".format(change))
-
-                confirm = input(
-                    "Start a new game? Your data will be preserved in a separate file for you to investigate. (y/N) ")
-                if confirm.lower() == "y":
-                    preserved_file_name = datetime.now().strftime("%Y%m%d-%H%M%S") + ".dd"
-                    with open(preserved_file_name, "w") as preserved_file:
-                        preserved_file.writelines(data)
-                    os.remove(SAVE_GAME_FILE_NAME)
-
-                    # Restores game_variables and field using the
-                    # redundant variable and recreating the field.
-                    game_variables = redundant_game_variables.copy()
-                    field = [[{}] * game_variables["columns"]
-                             for _ in range(game_variables["rows"])]
-                    return True
-                else:
-                    return False
+def load_game() -> Union[engine.GameState, None]:
+    """Attempts to restore a saved game. Games saved in the compact
+    format are preferred; games saved in the text format by older
+    versions of the game are imported.
+
+    Returns:
+        GameState: The restored game, or None if no game was restored.
+    """
+    import autosave
+    import journal
+    import savefile
+
+    # Offers the autosave if it is newer than the saved game. A game
+    # interrupted while saving may have left only the older generations
+    # of its save file, which autosave.load() falls back to.
+    saved = [name for name in autosave.generation_file_names(SAVE_GAME_FILE_NAME) if os.path.exists(name)]
+    file_name = SAVE_GAME_FILE_NAME if saved else None
+    if AUTOSAVE_FILE_NAME in os.listdir():
+        if file_name is None:
+            file_name = AUTOSAVE_FILE_NAME
+        elif os.path.getmtime(AUTOSAVE_FILE_NAME) > os.path.getmtime(saved[0]):
+            confirm = input(
+                "The game autosaved after your last save. Continue from the autosave instead? (Y/n) ")
+            if confirm.lower() != "n":
+                file_name = AUTOSAVE_FILE_NAME
+
+    if file_name is not None:
+        try:
+            if file_name == AUTOSAVE_FILE_NAME:
+                state, loaded_file_name = journal.load(file_name, sparse_field), file_name
             else:
-                return True
+                state, loaded_file_name = autosave.load(file_name, sparse=sparse_field)
+        except savefile.SaveFileError as error:
+            print("Error in restoring game: {}".format(error))
+            print("\n[!] The saved game could not be restored.")
+            return start_over(file_name)
+        if loaded_file_name != file_name:
+            print("[!] {} could not be restored; an older save ({}) has been restored instead.".format(
+                file_name, loaded_file_name))
+        if state.outcome is not None:
+            print("The saved game has already ended. Start a new game instead!")
+            return None
+        return state
+    elif TEXT_SAVE_GAME_FILE_NAME in os.listdir():
+        with open(TEXT_SAVE_GAME_FILE_NAME, "r") as file:
+            try:
+                state, restored, errors = savefile.read_text(
+                    file.readlines(), game_variables, sparse_field)
+            except savefile.SaveFileError as error:
+                print(error)
+                return None
+        for error in errors:
+            print(error)
+
+        # Checks if the program has encountered any issue while
+        # restoring the game. If so, the program prompts the user to see
+        # if they'd like to start a new game; if so, the save file is
+        # renamed and a new game will begin. Otherwise, the program will
+        # end.
+        if len(restored) != 2:
+            print(
+                "\n[!] Some data could not be restored. The game may be in an inconsistent state.")
+            print("The following have been fully restored, though:")
+            for part in restored:
+                print("- {}".format(part))
+            return start_over(TEXT_SAVE_GAME_FILE_NAME)
+        else:
+            return state
+    else:
+        print("No saved game found. If you have it stored somewhere else or named differently, move the file and rename it to \"{}\" (or \"{}\" for older saves) and try again.".format(
+            SAVE_GAME_FILE_NAME, TEXT_SAVE_GAME_FILE_NAME))
+        return None
 
 
-def save_game() -> bool:
-    """Saves the game to a file.
+def save_game(state: engine.GameState) -> bool:
+    """Saves the game to a file in the compact format, in the background.
+    Use savefile.py to export it to the text format.
+
+    Parameters:
+        state (GameState): The game to save.
 
     Returns:
         bool: True if the game was saved successfully, False otherwise.
@@ -349,44 +299,93 @@ def save_game() -> bool:
         if confirm.lower() != "y":
             return False
 
-    with open(SAVE_GAME_FILE_NAME, "w") as file:
-        lines = []
-
-        # Writes the headers in the file to identify the file as a saved
-        # game.
-        lines.extend(["### DESPERATE DEFENDERS SAVE FILE ###\n"] + [line + "\n" for line in wrap(
-            "This file was created by the desperate Defenders game. Do not change the values in this file; otherwise, your game may change or be corrupted!", width=72)])
-
-        # Writes the game variables to the file.
-        lines.append("\n# Game variables #")
-        for key, value in game_variables.items():
-            lines.append("\n{},{}".format(key, value))
-
-        # Writes the field to the file.
-        lines.append("\n\n# Field #")
-        for row in field:
-            row_values = ""
-            for c_index, cell in enumerate(row):
-                # JSON is practically similar to Python's dictionary
-                # format (in this use case). Therefore, we can use the
-                # json package to handle reading and writing.
-                row_values += json.dumps(cell)
-                if c_index != len(row) - 1:
-                    row_values += ";"
-            lines.append("\n{}".format(row_values))
-
-        # Writes the lines to the file.
-        file.writelines(lines)
-        return True
+    get_autosaver().save(state, SAVE_GAME_FILE_NAME)
+    return True
+
 
+def finish_saving():
+    """Waits for the saves still being written, and tells the player if
+    any of them failed."""
+    if autosaver is None:
+        return
+    error = autosaver.flush()
+    if error is not None:
+        print("[!] The game could not be saved: {}".format(error))
 
 ####################
 # Game functions
-# All functions in this chunk handles the logic for executing the game.
+# All functions in this chunk handles the console side of the game:
+# asking the player for their actions and displaying what happened.
+# The rules themselves are in engine.py.
 ####################
 
+# Draws the field; see render.py. ANSI mode is turned on with --ansi,
+# and fields too big for the terminal are drawn a window at a time
+# unless --full-field is given.
+field_renderer = render.FieldRenderer(viewport=True)
+
+# Shows the player what happened, as messages; see sinks.py.
+console = sinks.ConsoleSink()
+
+# Every event of the game, as lines of JSON, when --events is given.
+event_log = None
+
+# Whether the fields of games only keep their occupied cells, for huge,
+# mostly empty custom fields; turned on with --sparse. See
+# engine.new_field().
+sparse_field = False
+
+# When --lanes is given, new games play by lane rules, and the lanes of
+# their turns are resolved over the given number of worker processes;
+# see lanes.py.
+lane_resolver = None
+
+# The wave plan games follow when --waves is given with a wave file, or
+# PLANNED_WAVES for a plan to be made for every game; see waves.py.
+PLANNED_WAVES = "plan"
+wave_plan = None
+
+# The advisor suggesting actions (with --advisor) or playing by itself
+# (with --bot), if either is given; see advisor.py. A new one is made
+# for every game.
+advisor_mode, game_advisor = None, None
+
+# Whether the phases of every turn are being timed, and the file to
+# write the timings to; see profiling.py.
+profiling_enabled, profile_file_name = False, None
+
+
+def follow_wave_plan(state: engine.GameState):
+    """Has a game follow the wave plan given with --waves, if any. A
+    restored game that was following a plan keeps following it. A plan
+    made for the game is drawn from the game's random number generator,
+    from the game's turn on. A plan that does not fit the game is left
+    out, with a warning."""
+    plan = wave_plan
+    if plan is None or state.waves is not None:
+        return
+    import waves
+    if plan == PLANNED_WAVES:
+        plan = waves.plan_waves(state.variables, state.characters, seed=state.rng.getrandbits(64))
+    try:
+        plan.check(state.variables)
+    except waves.WaveError as error:
+        print("{}\n[!] The wave plan does not fit this game, so enemies will spawn as the game goes.".format(error))
+        return
+    state.waves = plan
+
+
+def show_profile():
+    """Shows how long the phases of the game took, if they were being
+    timed, and writes the timings to a file if asked to."""
+    if profiling_enabled:
+        import profiling
+        print("\n" + profiling.report())
+        if profile_file_name is not None:
+            profiling.write_json(profile_file_name)
+
 
-def end_game(type: str, catalyst_entity=None):
+def end_game(type: str, catalyst_name=None):
     """Ends the game in different ways, depending on the given type
     (expecting either a type value of \"win\" or \"loss\").
 
@@ -395,23 +394,26 @@ def end_game(type: str, catalyst_entity=None):
 
     Parameters:
         type (str): The type of end game to perform.
-        catalyst_entity (dict): The entity that caused the end of the
-        game. Expected only if type is \"loss\".
+        catalyst_name (str): The name of the entity that caused the end
+        of the game. Expected only if type is \"loss\".
     """
+    field_renderer.close()
     if type == "win":
         print("You have protected the city! You win!")
     elif type == "loss":
-        print("A {} has reached the city! All is lost!".format(
-            catalyst_entity["name"]))
+        print("A {} has reached the city! All is lost!".format(catalyst_name))
         print("You have lost the game. :(")
+    finish_saving()
+    show_profile()
     exit()
 
 
-def get_position(message="Place where?") -> Union[tuple, None]:
+def get_position(state: engine.GameState, message="Place where?") -> Union[tuple, None]:
     """Prompts the user for a position and re-prompts them until
     a valid position is provided.
 
     Parameters:
+        state (GameState): The game the position is on.
         message (str): The message to display to the player. The message
         should be whitespace-stripped (no trailing whitespaces).
 
@@ -421,128 +423,80 @@ def get_position(message="Place where?") -> Union[tuple, None]:
     while True:
         try:
             position = input("{} Type X to cancel. ".format(message))
-            assert re.match(
-                r"([A-Za-z]\d{1,2})|[Xx]", position), "Please provide the position in the format XY (where X is an alphabet, Y is a numeral)."
 
             # Checks if the user cancelled the placement.
             if position.lower() == "x":
                 return None
-
-            # Checks if the provided row and col values are valid.
-            row, col = position[0].upper(), int(position[1:])
-            assert 0 <= ord(row) - 65 <= game_variables["rows"] - 1, "Please provide a valid row between A and {}.".format(
-                chr(65 + game_variables["rows"]))
-            assert col <= game_variables["columns"] // 2, "Please provide a valid column between 1 and {}.".format(
-                game_variables["columns"] // 2)
+            return commands.parse_position(state, position)
         except KeyboardInterrupt:
             print()
             break
         except AssertionError as error:
             print(error, end=" ")
-        else:
-            return ord(row) - 65, col - 1
-
-
-def draw_field():
-    """Prints the field in a player-friendly format."""
-    print(" ", end="")
-
-    # Dynamically determines the columns the player can play on. This is
-    # done by splitting the number of columns and allocating the first
-    # half to the player.
-    user_columns = game_variables["columns"] // 2
-    for column in range(user_columns):
-        print(" {:^5}".format(column + 1), end="")
-    print()
-
-    for row in range(game_variables["rows"] + 1):
-        # Prints the border pattern.
-        print(" ", end="")
-        print("+-----" * game_variables["columns"] + "+")
-
-        if row < game_variables["rows"]:
-            # Prints the row alphabet.
-            print("{}".format(chr(65 + row)), end="")
-
-            # Iterates twice, one for each line the row occupies.
-            for row_line in range(2):
-                if row_line == 1:
-                    print(" ", end="")
-                # Iterates through each cell, filling the cell with
-                # either the name of the entity or the health of the
-                # entity depending on which row line it is. If no entity
-                # is present, an empty space is printed instead.
-                for col in range(game_variables["columns"]):
-                    cell, value = field[row][col], ""
-                    if cell != {} and row_line == 0:
-                        value = cell["id"]
-                    elif cell != {} and row_line == 1:
-                        value = str(
-                            cell["current_health"]) + "/" + str(cell["health"])
-                    print("|{:^5}".format(value), end="")
-                print("|", end="\n" if row_line == 0 else "")
-            print()
-
 
-def spawn_entity(entity: dict, position: tuple) -> bool:
-    """Spawns a provided entity at the provided position.
 
-    This function also handles the logic validating if a placement is
-    possible; if not (such as when an entity is in the way, or some
-    other problem that would forbid the placement of the entity), this
-    function handles that by returning False. Otherwise, it returns True.
+def draw_field(state: engine.GameState):
+    """Prints the field in a player-friendly format, in a single write.
+    See render.py.
 
     Parameters:
-        entity (dict): The entity to spawn.
-        position (tuple): The position to spawn the entity, comprised of (row, col).
+        state (GameState): The game to draw the field of.
+    """
+    field_renderer.draw(state)
 
-    Returns:
-        bool: True if the entity was spawned, False if not.
+
+def move_view(state: engine.GameState):
+    """Prompts the player for the directions to move the view of the
+    field in, when the field is too big to be drawn whole.
+
+    Parameters:
+        state (GameState): The game the field is of.
     """
-    placed_entity = entity.copy()
-    if placed_entity in CHARACTERS["enemy"]:
-        placed_entity["type"] = "enemy"
-    elif placed_entity in CHARACTERS["player"]:
-        placed_entity["type"] = "player"
-        placed_entity["upgrade_count"] = 0
-    placed_entity["current_health"] = placed_entity["health"]
-
-    # Checks if the entity can be spawned in the given position.
-    if field[position[0]][position[1]] == {}:
-        field[position[0]][position[1]] = placed_entity
-        return True
-    else:
-        return False
+    import re
+    while True:
+        try:
+            moves = input("Move which way? W, A, S and D move by half a screen and F follows the closest enemy. Type X to cancel. ").lower()
+            assert re.fullmatch(
+                r"[wasd]+|[fx]", moves), "Please type W, A, S or D (as many times as you like), F or X."
+        except KeyboardInterrupt:
+            print()
+            return
+        except AssertionError as error:
+            print(error, end=" ")
+        else:
+            break
 
+    if moves == "f":
+        field_renderer.follow()
+    elif moves != "x":
+        rows, columns = field_renderer.window_size()
+        field_renderer.pan((moves.count("s") - moves.count("w")) * max(1, rows // 2),
+                           (moves.count("d") - moves.count("a")) * max(1, columns // 2))
 
-def spawn_enemy(override=False):
-    """Spawns a random enemy in any row of the last column. Depends on
-    spawn_entity().
 
-    By default, an enemy will only be spawned when there are no more
-    enemies on the board. In some special cases though, like when the
-    threat level surpases the limit, an override can be used to spawn
-    the enemy regardless of the state of the field.
+def show_events(events: list):
+    """Prints the events returned by the engine, ending the game if one
+    of them says so.
 
     Parameters:
-        override (bool): If True, spawns an enemy in the last column of
-        the last row regardless of the current circumstances."""
-    no_enemies = True
-    for row in field:
-        for cell in row:
-            if cell != {} and cell["type"] == "enemy":
-                no_enemies = False
+        events (list): The events to show.
+    """
+    for event in events:
+        if isinstance(event, engine.GameOver):
+            end_game(event.outcome, catalyst_name=event.catalyst)
+        console.append(event)
 
-    if no_enemies or override:
-        enemy = random.choice(CHARACTERS["enemy"])
-        position = (random.randint(
-            0, game_variables["rows"] - 1), game_variables["columns"] - 1)
-        spawn_entity(enemy, position)
 
+def purchase_defense(state: engine.GameState) -> list:
+    """Prompts the player to purchase a defense unit.
 
-def purchase_defense():
-    """Prompts the player to purchase a defense unit."""
-    defenses = CHARACTERS["player"]
+    Parameters:
+        state (GameState): The game to purchase the unit in.
+
+    Returns:
+        list: The events that happened.
+    """
+    defenses = state.characters["player"]
 
     print("What unit do you wish to buy?")
     for index in range(len(defenses) + 1):
@@ -554,334 +508,373 @@ def purchase_defense():
 
     while True:
         choice = get_choice(len(defenses) + 1)
-        if choice != len(defenses) + 1:
-            if game_variables["gold"] - defenses[choice - 1]["cost"] >= 0:
-                position = get_position()
-                if position is None:
-                    break
-                elif field[position[0]][position[1]] != {}:
-                    present_entity = field[position[0]][position[1]]
-                    print("{} is already in the given position!".format(
-                        present_entity["name"]))
-                    break
-                if spawn_entity(defenses[choice - 1], position):
-                    game_variables["gold"] -= defenses[choice - 1]["cost"]
-                    game_variables["turn"] += 1
-                else:
-                    print("Failed to place unit for unknown reasons.")
-                break
-            else:
-                print("You don't have enough gold to place this unit!")
+        if choice == len(defenses) + 1:
+            return []
+        elif state.variables["gold"] - defenses[choice - 1]["cost"] >= 0:
+            position = get_position(state)
+            if position is None:
+                return []
+            return take_action(state, engine.Buy(defenses[choice - 1]["id"], *position))
         else:
-            break
+            print("You don't have enough gold to place this unit!")
 
 
-def impact_area(position: tuple, type: str, catalyst_entity_position=None):
-    """Performs a circular impact area around a given position depending
-    on the type of impact (expecting either a type of \"mine\" or \"heal\").
+def show_stats(state: engine.GameState):
+    """Shows the users statistics of the game. Includes the current turn
+    number, threat level, danger level, amount of gold, and number of
+    monsters killed.
 
-    An assumption is made that healing defenses will take a turn.
+    Parameters:
+        state (GameState): The game to show the statistics of."""
+    print(render.render_stats(state))
+
+
+def enhance_defense(state: engine.GameState) -> list:
+    """Prompts the player for a defense to enhance. Only units with an
+    upgrade in the catalog (archers and walls, by default) can be
+    enhanced, and doing so does not advance the game by a turn.
 
     Parameters:
-        position (tuple): The position to impact the area around.
-        type (str): The type of impact to perform. Expects either \"mine\" or \"heal\".
-        catalyst_entity_position (tuple): The position of the entity
-        that caused the impact.
+        state (GameState): The game to enhance the defense in.
+
+    Returns:
+        list: The events that happened.
     """
-    row, col = position
-    if catalyst_entity_position is not None:
-        cat_row, cat_col = catalyst_entity_position
-        catalyst_entity = field[cat_row][cat_col]
-        field[row][col], field[cat_row][cat_col] = catalyst_entity, {}
-
-    if type == "mine":
-        print("[<] Mine in lane {} was detonated by {}!"
-              .format(chr(65 + row), field[row][col]["name"]))
-    elif type == "heal":
-        if game_variables["gold"] - 5 < 0:
-            print("You don't have enough gold to heal!")
-            return
-        game_variables["gold"] -= 5
-        game_variables["turn"] += 1
-    for r_index in range(row - 1, row + 2):
-        for c_index in range(col - 1, col + 2):
-            if 0 <= r_index < game_variables["rows"] and 0 <= c_index < game_variables["columns"]:
-                entity_in_radius = field[r_index][c_index]
-                if entity_in_radius != {} and entity_in_radius["type"] == "enemy" and type == "mine":
-                    print("[>] {} in lane {} was dealt 10 damage by an exploding mine!".format(
-                        entity_in_radius["name"], chr(65 + row)))
-                    entity_in_radius["current_health"] -= 10
-                    if entity_in_radius["current_health"] <= 0:
-                        print("[>] {} dies!".format(entity_in_radius["name"]))
-                        game_variables["gold"] += entity_in_radius["reward"]
-                        game_variables["killed"] += 1
-                        game_variables["threat_level"] += entity_in_radius["reward"]
-                        field[r_index][c_index] = {}
-                elif entity_in_radius != {} and entity_in_radius["type"] == "player" and type == "heal":
-                    print("[>] {} in lane {} was healed by 5 points!".format(
-                        entity_in_radius["name"], chr(65 + r_index)))
-                    entity_in_radius["current_health"] += 5
-                    if entity_in_radius["current_health"] > entity_in_radius["health"]:
-                        entity_in_radius["current_health"] = entity_in_radius["health"]
-
-
-def advance_entities():
-    """Performs all the logical code to advance the round, including
-    performing damage calculations and advancing enemies."""
-    for r_index in range(len(field)):
-        for c_index in range(game_variables["columns"]):
-            entity = field[r_index][c_index]
-
-            # Activates the defense entities; the code below performs
-            # the attacking in a way that is expected of the
-            # entities.
-            if entity != {} and entity["id"] in ["ARCHR", "CANON"]:
-                for ahead_col in range(c_index + 1, game_variables["columns"]):
-                    # Checks the first entity that lies in front of the
-                    # defense entity that is an enemy, and deals damage
-                    # to it. Additional checks are done to also check if
-                    # the turn is even (for the cannon).
-                    entity_ahead = field[r_index][ahead_col]
-                    if (entity["id"] in ["ARCHR", "SKELE"] or (entity["id"] == "CANON" and game_variables["turn"]) % 2) and (entity_ahead != {} and entity_ahead["type"] == "enemy"):
-                        damage = random.randint(
-                            entity["min_damage"], entity["max_damage"])
-                        # Manages the additional case where skeletons
-                        # take half the damage from archers.
-                        if entity_ahead["id"] == "SKELE" and entity["id"] == "ARCHR":
-                            damage = damage // 2
-                        entity_ahead["current_health"] -= damage
-
-                        print("[>] {} in lane {} shoots {} for {} damage!".format(
-                            entity["name"], chr(65 + r_index), entity_ahead["name"], damage))
-
-                        if entity_ahead["current_health"] <= 0:
-                            print("[>] {} dies!".format(entity_ahead["name"]))
-                            game_variables["gold"] += entity_ahead["reward"]
-                            game_variables["killed"] += 1
-                            game_variables["threat_level"] += entity_ahead["reward"]
-                            field[r_index][ahead_col] = {}
-                        elif entity["id"] == "CANON" and ahead_col + 1 < len(field[r_index]):
-                            # Checks if the entity can be moved back by
-                            # a cell. If a random choice is true, the
-                            # entity may be moved back.
-                            if field[r_index][ahead_col + 1] == {} and random.choice([True, False]):
-                                field[r_index][ahead_col + 1] = entity_ahead
-                                field[r_index][ahead_col] = {}
-                                print("[>] {} was blasted back by the cannon!".format(
-                                    entity_ahead["name"]))
-                                break
-                        break
-
-            # Advances the enemies; the code below advances the enemies
-            # and performs any attacks that are expected of the enemies.
-            elif entity != {} and entity["type"] == "enemy":
-                resulting_col = c_index - entity["moves"]
-                future_cell = field[r_index][resulting_col]
-                ahead_cell = field[r_index][c_index - 1]
-
-                no_defense = True
-                for cell_index in range(resulting_col, c_index):
-                    if field[r_index][cell_index] != {} and field[r_index][cell_index]["type"] == "player":
-                        no_defense = False
-                        break
-
-                if resulting_col < 0 and no_defense:
-                    end_game("loss", catalyst_entity=entity)
-                else:
-                    damage = random.randint(
-                        entity["min_damage"], entity["max_damage"])
-                    entity_to_attack = None
-
-                    # Checks if the cell in front of the enemy is occupied
-                    # by a defence entity. If so, the enemy attacks that
-                    # entity instead.
-                    if ahead_cell != {} and ahead_cell["type"] == "player":
-                        entity_to_attack = ahead_cell
-                    # Checks if the cell the enemy wishes to occupy is
-                    # empty; if not, there is another entity in the way.
-                    elif future_cell != {}:
-                        entity_to_attack = future_cell
-                    else:
-                        field[r_index][resulting_col] = entity
-                        print("[<] {} advances!".format(entity["name"]))
-                        field[r_index][c_index] = {}
-
-                    if entity_to_attack is not None and entity_to_attack["id"] == "MINE":
-                        target_cell = None
-                        if entity_to_attack == ahead_cell:
-                            target_cell = c_index - 1
-                        elif entity_to_attack == future_cell:
-                            target_cell = resulting_col
-                        entity_to_attack = entity
-                        impact_area((r_index, target_cell),
-                                    "mine", (r_index, c_index))
-                    elif entity_to_attack is not None:
-                        entity_to_attack["current_health"] -= damage
-
-                        print("[<] {} in lane {} attacks {} for {} damage!".format(
-                            entity["name"], chr(65 + r_index), entity_to_attack["name"], damage))
-
-                        if entity_to_attack["current_health"] <= 0:
-                            print("[<] {} dies!".format(
-                                entity_to_attack["name"]))
-                            field[r_index][resulting_col] = entity
-                            print("[<] {} advances!".format(entity["name"]))
-                            field[r_index][c_index] = {}
-
-
-def show_stats():
-    """Shows the users statistics of the game. Includes the current turn
-    number, threat level, danger level, amount of gold, and number of
-    monsters killed."""
-    stats = ""
+    position = get_position(state, "Upgrade which cell?")
+    if position is None:
+        return []
+    return take_action(state, engine.Upgrade(*position))
 
-    # Adds turn info to stats.
-    stats += "Turn {:<2}".format(game_variables["turn"] + 1)
-    stats += " " * 5
 
-    # Adds threat level info to stats.
-    stats += "Threat = [{:<10}]".format("-" * game_variables["threat_level"])
-    stats += " " * 5
+def take_action(state: engine.GameState, action: engine.Action) -> list:
+    """Takes an action in the game and records it in the autosave
+    journal. Actions the engine carried out can be undone with
+    undo_action().
 
-    # Adds danger level info to stats.
-    stats += "Danger Level {:<2}".format(game_variables["danger_level"])
-    stats += "\n"
+    Returns:
+        list: The events that happened.
+    """
+    point = engine.snapshot(state)
+    events = log_events(engine.step(state, action))
+    if any(isinstance(event, engine.Rejected) for event in events):
+        engine.release(state, point)
+    else:
+        undo_points.append(point)
+        if len(undo_points) > UNDO_LIMIT:
+            engine.release(state, undo_points.pop(0))
+    game_journal.record(state, action)
+    return events
+
+
+def undo_action(state: engine.GameState):
+    """Undoes the last action taken, restoring the game (down to its
+    random number generator) to how it was before. The autosave journal
+    is given a checkpoint of the restored game, as its actions can no
+    longer be replayed to reach it."""
+    if not undo_points:
+        print("There is nothing to undo!")
+        return
+    # A save still being written reads the game through its snapshot,
+    # which restoring to an earlier one would drop.
+    finish_saving()
+    engine.restore(state, undo_points.pop())
+    game_journal.checkpoint(state)
+    print("The last action was undone.")
 
-    # Adds gold info to stats.
-    stats += "Gold = {:>2}".format(game_variables["gold"])
-    stats += " " * 3
 
-    # Adds killed info to stats.
-    stats += "Monsters killed = {}/{}".format(
-        game_variables["killed"], game_variables["target"])
+def log_events(events: list) -> list:
+    """Writes events to the event log, if the game keeps one.
 
-    print(stats)
+    Returns:
+        list: The events.
+    """
+    if event_log is not None:
+        event_log.extend(events)
+    return events
 
 
-def enhance_enemies():
-    """Enhances the enemies in the field and increases the danger level
-    by one.
+def start_journal(state: engine.GameState, resumed: bool, autoflush=True):
+    """Starts autosaving a game to the journal, replacing the journal of
+    any game played before.
 
-    The enhancement to health only affects future enemies; current
-    enemies on the field are not affected when an enhancement takes
-    place.
+    Parameters:
+        state (GameState): The game to autosave.
+        resumed (bool): Whether the game was loaded, in which case it is
+        added to the end of the journal rather than starting a new one.
+        autoflush (bool): Whether every action is written out to the
+        journal as soon as it is taken.
     """
-    print("The evil grows!")
-    for row in field:
-        for cell in row:
-            if cell != {} and cell["type"] == "enemy":
-                for stat in ["min_damage", "max_damage", "reward"]:
-                    cell[stat] += 1
-    for enemy in CHARACTERS["enemy"]:
-        enemy["health"] += 1
-    game_variables["danger_level"] += 1
-
-
-def enhance_defense():
-    """Enhances the selected defense in the field. The enhancement can
-    only be applied to archers and walls, and enhancements to both are
-    as follows:
-    - Archers: min_damage + 1, max_damage + 1, health + 1
-    - Walls: health + 5
-
-    It is assumed that, as with enemies being advanced, enhancing
-    defense does not advance the game by a turn.
+    global game_journal
+    import journal
+    if game_journal is not None:
+        game_journal.close()
+    game_journal = journal.Journal(AUTOSAVE_FILE_NAME, state, append=resumed, autoflush=autoflush)
+
+
+def progress_game(state: engine.GameState, resumed=False):
+    """Runs the game turn by turn until it has ended.
+
+    Every pass of the loop is one action by the player, so a game can
+    go on for any number of actions without growing the call stack.
+
+    Parameters:
+        state (GameState): The game to progress.
+        resumed (bool): Whether the game was loaded, in which case it is
+        added to the end of the autosave journal rather than starting a
+        new one."""
+    global game_advisor, undo_points
+    start_journal(state, resumed)
+    undo_points = []
+    if advisor_mode is not None:
+        import advisor
+        game_advisor = advisor.Advisor()
+
+    while state.outcome is None:
+        draw_field(state)
+        show_stats(state)
+
+        # Lets the advisor play the turn, if it is playing by itself.
+        if advisor_mode == "bot":
+            action = game_advisor.advise(state)
+            print("The advisor plays: {}.".format(render.describe_action(state, action)))
+            show_events(take_action(state, action))
+            continue
+        elif advisor_mode == "advise":
+            print("The advisor suggests: {}.".format(
+                render.describe_action(state, game_advisor.advise(state))))
+
+        # Gives the player their choices.
+        print("1. Buy unit" + " " * 5 + "2. Upgrade unit")
+        print("3. Heal area" + " " * 4 + "4. End turn")
+        print("5. Save game" + " " * 4 + "6. Quit")
+
+        # Lets the player move the view if the field is not drawn whole.
+        whole = field_renderer.window_size() == (state.variables["rows"], state.variables["columns"])
+        print("7. Undo" + ("" if whole else " " * 9 + "8. Move view"))
+        choice = get_choice(7 if whole else 8)
+
+        events = []
+        if choice == 1:
+            events = purchase_defense(state)
+        elif choice == 2:
+            events = enhance_defense(state)
+        elif choice == 3:
+            position = get_position(state,
+                                    "Heal which area? All defenders in a 3-by-3 radius will be healed.")
+            if position is not None:
+                events = take_action(state, engine.Heal(*position))
+        elif choice == 4:
+            events = take_action(state, engine.EndTurn())
+        elif choice == 5:
+            saved = save_game(state)
+            if saved:
+                print("\nGame saved!")
+        elif choice == 6:
+            field_renderer.close()
+            print("\nSee you next time!")
+            finish_saving()
+            show_profile()
+            exit()
+        elif choice == 7:
+            undo_action(state)
+        elif choice == 8:
+            move_view(state)
+
+        show_events(events)
+
+
+####################
+# Real-time game functions
+# In real-time mode, turns end by themselves on a timer, and the player
+# types commands while the game goes on. The game runs on an asyncio
+# event loop, with reading input, ending turns, drawing and autosaving
+# as separate tasks, so none of them waits on another.
+####################
+
+# The time between frames, so that several changes in quick succession
+# are drawn once.
+FRAME_SECONDS = 0.05
+
+# The time between writing out the autosave journal.
+AUTOSAVE_SECONDS = 5
+
+
+class StdinReader:
+    """Reads lines typed by the player without blocking the event loop.
+
+    Where the event loop can watch a terminal for input, lines are read
+    as they arrive; otherwise (or when input is piped in, and may already
+    be buffered by sys.stdin), they are read on a separate thread.
     """
-    position = get_position("Upgrade which cell?")
-    if position is None:
-        return
 
-    # Checks if the entity at the given position is a valid entity.
-    row, col = position
-    entity = field[row][col]
-    message = ""
-    if entity == {}:
-        message = "There is no entity in lane {}, column {}!"
-    elif entity["type"] == "enemy":
-        message = "The entity in lane {}, column {} is an enemy!"
-    elif entity["id"] not in ["ARCHR", "WALL"]:
-        message = "The entity in lane {}, column {} is not an archer or a wall! It cannot be upgraded."
-
-    if message != "":
-        print(message.format(chr(65 + row), col + 1))
-    else:
-        stats = []
-        value = 0
-        if entity["id"] == "ARCHR":
-            if game_variables["gold"] < 8 + 2 * entity["upgrade_count"]:
-                print("You do not have enough gold to upgrade this archer!")
-                return
+    def __init__(self, loop: "asyncio.AbstractEventLoop"):
+        import asyncio
+        import threading
+        self._loop, self._lines, self._buffer = loop, asyncio.Queue(), b""
+        self._file_number = None
+        if sys.stdin.isatty():
+            try:
+                loop.add_reader(sys.stdin.fileno(), self._read)
+                self._file_number = sys.stdin.fileno()
+            except (NotImplementedError, ValueError, OSError):
+                pass
+        if self._file_number is None:
+            threading.Thread(target=self._read_blocking, daemon=True).start()
+
+    def _read(self):
+        data = os.read(self._file_number, 4096)
+        if not data:
+            self.close()
+            if self._buffer:
+                self._lines.put_nowait(self._buffer.decode(errors="replace"))
+            self._lines.put_nowait(None)
+            return
+        *lines, self._buffer = (self._buffer + data).split(b"\n")
+        for line in lines:
+            self._lines.put_nowait(line.decode(errors="replace"))
 
-            stats = ["min_damage", "max_damage", "current_health", "health"]
-            value = 1
-            game_variables["gold"] -= 8 + 2 * entity["upgrade_count"]
-        elif entity["id"] == "WALL":
-            if game_variables["gold"] < 6 + 2 * entity["upgrade_count"]:
-                print("You do not have enough gold to upgrade this wall!")
-                return
+    def _read_blocking(self):
+        for line in sys.stdin:
+            self._loop.call_soon_threadsafe(self._lines.put_nowait, line.rstrip("\n"))
+        self._loop.call_soon_threadsafe(self._lines.put_nowait, None)
 
-            stats = ["current_health", "health"]
-            value = 5
-            game_variables["gold"] -= 6 + 2 * entity["upgrade_count"]
+    async def readline(self) -> Union[str, None]:
+        """Waits for the next line typed by the player.
 
-        for stat in stats:
-            entity[stat] += value
+        Returns:
+            str: The line, without its line break, or None if there is no
+            more input.
+        """
+        return await self._lines.get()
 
-        print("{} in lane {}, column {} upgraded!".format(
-            entity["name"], chr(65 + row), col + 1))
+    def close(self):
+        """Stops watching standard input."""
+        if self._file_number is not None:
+            self._loop.remove_reader(self._file_number)
+            self._file_number = None
 
 
-def progress_game(previous_turn=0):
-    """Begins all the processes needed to start or progress the game.
+async def play_realtime(state: engine.GameState, turn_seconds: float, resumed=False) -> Union[engine.GameOver, None]:
+    """Runs a game in real-time mode until it has ended or the player
+    quits.
 
     Parameters:
-        previous_turn (int): The turn number of the previous game."""
-    # Checks if the conditions are met to warrant a win.
-    if game_variables["killed"] >= game_variables["target"]:
-        end_game("win")
-
-    if game_variables["turn"] > 0 and game_variables["turn"] % 12 == 0:
-        enhance_enemies()
-
-    spawn_enemy()
-    draw_field()
-    show_stats()
-
-    # Gives the player their choices.
-    print("1. Buy unit" + " " * 5 + "2. Upgrade unit")
-    print("3. Heal area" + " " * 4 + "4. End turn")
-    print("5. Save game" + " " * 4 + "6. Quit")
-    choice = get_choice(6)
-
-    if choice == 1:
-        purchase_defense()
-    elif choice == 2:
-        enhance_defense()
-    elif choice == 3:
-        position = get_position(
-            "Heal which area? All defenders in a 3-by-3 radius will be healed.")
-        if position is not None:
-            impact_area(position, "heal")
-    elif choice == 4:
-        game_variables["turn"] += 1
-    elif choice == 5:
-        saved = save_game()
-        if saved:
-            print("\nGame saved!")
-    elif choice == 6:
-        print("\nSee you next time!")
-        exit()
-
-    if previous_turn != game_variables["turn"]:
-        advance_entities()
-        game_variables["gold"] += 1
-        game_variables["threat_level"] += random.randint(
-            1, game_variables["danger_level"])
-        while game_variables["threat_level"] >= 10:
-            spawn_enemy(override=True)
-            game_variables["threat_level"] -= 10
-
-    progress_game(game_variables["turn"])
+        state (GameState): The game to play.
+        turn_seconds (float): The time before a turn ends by itself.
+        resumed (bool): Whether the game was loaded; see progress_game().
+
+    Returns:
+        GameOver: The event that ended the game, or None if the player
+        quit.
+    """
+    import asyncio
+    start_journal(state, resumed, autoflush=False)
+    loop = asyncio.get_running_loop()
+    reader, pending = StdinReader(loop), asyncio.Queue()
+    changed, messages = asyncio.Event(), [commands.HELP]
+    game_over, late = None, 0.0
+
+    def act(action: engine.Action):
+        nonlocal game_over
+        for event in take_action(state, action):
+            if isinstance(event, engine.GameOver):
+                game_over = event
+            message = render.describe_event(event)
+            if message is not None:
+                messages.append(message)
+        changed.set()
+
+    async def read_commands():
+        while True:
+            line = await reader.readline()
+            if line is None:
+                pending.put_nowait("quit")
+                return
+            try:
+                pending.put_nowait(commands.parse_command(state, line))
+            except AssertionError as error:
+                messages.append(str(error))
+                changed.set()
+
+    async def run_turns():
+        # The turn ends by itself at the deadline, unless the player ends
+        # it first, so a turn is never late by more than the time the
+        # engine takes to play the last action.
+        nonlocal late
+        deadline = loop.time() + turn_seconds
+        while game_over is None:
+            try:
+                command = await asyncio.wait_for(pending.get(), max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                late = max(late, loop.time() - deadline)
+                act(engine.EndTurn())
+                deadline = max(deadline + turn_seconds, loop.time())
+                continue
+
+            if command == "quit":
+                return
+            elif command == "save":
+                get_autosaver().save(state, SAVE_GAME_FILE_NAME)
+                messages.append("Game saved!")
+                changed.set()
+            else:
+                turn = state.variables["turn"]
+                act(command)
+                if state.variables["turn"] != turn:
+                    deadline = loop.time() + turn_seconds
+
+    async def draw():
+        while True:
+            await changed.wait()
+            changed.clear()
+            draw_field(state)
+            show_stats(state)
+            for message in messages:
+                print(message)
+            messages.clear()
+            await asyncio.sleep(FRAME_SECONDS)
+
+    async def write_journal():
+        while True:
+            await asyncio.sleep(AUTOSAVE_SECONDS)
+            game_journal.flush()
+
+    changed.set()
+    helpers = [loop.create_task(task()) for task in [read_commands, draw, write_journal]]
+    try:
+        await run_turns()
+    finally:
+        reader.close()
+        for task in helpers:
+            task.cancel()
+        game_journal.flush()
+
+    # Shows what happened since the last frame.
+    draw_field(state)
+    show_stats(state)
+    for message in messages:
+        print(message)
+    print("Turns ended at most {:.1f} ms late.".format(late * 1000))
+    return game_over
+
+
+def progress_realtime_game(state: engine.GameState, turn_seconds: float, resumed=False):
+    """Runs a game in real-time mode, then ends the program.
+
+    Parameters:
+        state (GameState): The game to progress.
+        turn_seconds (float): The time before a turn ends by itself.
+        resumed (bool): Whether the game was loaded; see progress_game().
+    """
+    import asyncio
+    game_over = asyncio.run(play_realtime(state, turn_seconds, resumed))
+    if game_over is not None:
+        end_game(game_over.outcome, catalyst_name=game_over.catalyst)
+    field_renderer.close()
+    print("\nSee you next time!")
+    finish_saving()
+    show_profile()
+    exit()
 
 
 ####################
@@ -889,21 +882,109 @@ def progress_game(previous_turn=0):
 # The game begins here.
 ####################
 
-if __name__ == "__main__":
-    while True:
-        display_intro_menu()
-        choice = get_choice(4)
 
-        if choice == 1:
-            progress_game()
-        elif choice == 2:
-            loaded = load_game()
-            if loaded:
-                print()
-                progress_game(previous_turn=game_variables["turn"])
-        elif choice == 3:
-            manage_game_settings()
-        elif choice == 4:
-            exit()
-else:
-    print("This file is not meant to be imported. Please run this file with `python3`.")
+def main(argv=None):
+    """Runs the console game until the player quits.
+
+    Parameters:
+        argv (list): The command-line arguments; defaults to sys.argv.
+    """
+    global event_log, field_renderer, profiling_enabled, profile_file_name, advisor_mode, sparse_field, \
+        lane_resolver, wave_plan
+    import argparse
+    import profiling
+
+    parser = argparse.ArgumentParser(description="Desperate Defenders")
+    parser.add_argument("--ansi", action="store_true",
+                        help="keeps the field at the top of the terminal and only redraws the cells that changed")
+    parser.add_argument("--full-field", action="store_true",
+                        help="draws the whole field, even if it does not fit in the terminal")
+    parser.add_argument("--sparse", action="store_true",
+                        help="only keeps the occupied cells of the field, for huge custom fields that are mostly empty")
+    parser.add_argument("--lanes", type=int, metavar="WORKERS",
+                        help="plays new games by lane rules, which resolve the lanes of every turn apart from one "
+                             "another, over the given number of worker processes (at most one per CPU), for huge "
+                             "custom fields (games play out differently from games without it)")
+    parser.add_argument("--waves", nargs="?", const=PLANNED_WAVES, metavar="FILE",
+                        help="spawns the enemies of every game by a wave plan: the given wave file, or one made for "
+                             "the game if none is given")
+    parser.add_argument("--realtime", type=float, metavar="SECONDS",
+                        help="plays in real time, with every turn ending by itself after the given number of seconds")
+    parser.add_argument("--events", metavar="FILE",
+                        help="adds every event of the game to the given file, as lines of JSON")
+    parser.add_argument("--profile", action="store_true",
+                        help="times the phases of every turn and shows the timings when the game ends")
+    parser.add_argument("--profile-json", metavar="FILE",
+                        help="also writes the timings to the given file, as JSON (implies --profile)")
+    advice = parser.add_mutually_exclusive_group()
+    advice.add_argument("--advisor", action="store_const", const="advise", dest="advisor_mode",
+                        help="suggests the best action before every choice")
+    advice.add_argument("--bot", action="store_const", const="bot", dest="advisor_mode",
+                        help="lets the advisor play the game by itself")
+    arguments = parser.parse_args(argv)
+    advisor_mode, sparse_field = arguments.advisor_mode, arguments.sparse
+    if arguments.lanes is not None:
+        import lanes
+        # More workers than CPUs only add to the cost of handing the
+        # lanes over.
+        lane_resolver = lanes.LaneResolver(max(1, min(arguments.lanes, os.cpu_count() or 1)))
+    if arguments.waves not in [None, PLANNED_WAVES]:
+        import waves
+        try:
+            wave_plan = waves.load(arguments.waves)
+        except waves.WaveError as error:
+            parser.error(str(error))
+    else:
+        wave_plan = arguments.waves
+    profile_file_name = arguments.profile_json or os.environ.get("DD_PROFILE_JSON") or None
+    if arguments.profile or profile_file_name is not None or profiling.enabled_by_environment():
+        profiling_enabled = True
+        profiling.enable([(sys.modules[__name__], "draw_field"), (sys.modules[__name__], "save_game")])
+    if arguments.events is not None:
+        event_log = sinks.JSONLSink(open(arguments.events, "a", buffering=1))
+    field_renderer = render.FieldRenderer(ansi=arguments.ansi, viewport=not arguments.full_field)
+
+    try:
+        while True:
+            display_intro_menu()
+            choice = get_choice(4)
+
+            if choice == 1:
+                state = engine.new_game(game_variables, sparse=sparse_field)
+                state.lane_rules, state.resolver = lane_resolver is not None, lane_resolver
+                follow_wave_plan(state)
+                show_events(log_events(engine.begin_turn(state)))
+                if arguments.realtime:
+                    progress_realtime_game(state, arguments.realtime)
+                else:
+                    progress_game(state)
+            elif choice == 2:
+                state = load_game()
+                if state is not None:
+                    # A game keeps the rules it was started with.
+                    if state.lane_rules:
+                        state.resolver = lane_resolver
+                    elif lane_resolver is not None:
+                        print("[!] This game was started without --lanes, so its lanes are resolved one after another.")
+                    follow_wave_plan(state)
+                    # The game carries on in the turn it was saved in, which
+                    # has already begun.
+                    if arguments.realtime:
+                        progress_realtime_game(state, arguments.realtime, resumed=True)
+                    else:
+                        progress_game(state, resumed=True)
+            elif choice == 3:
+                manage_game_settings()
+            elif choice == 4:
+                exit()
+    finally:
+        # Also reached when the game exits, so the event log gets all of
+        # its lines and the lane workers stop.
+        if event_log is not None:
+            event_log.close()
+        if lane_resolver is not None:
+            lane_resolver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Profiling the phases of a turn
+#
+# Counts the calls to the functions that make up a turn (spawning,
+# advancing, impacts, enhancing, drawing, saving, ...) and times them
+# with a monotonic clock, to see where the time of a turn goes in a real
+# game. Profiling works by replacing the functions with timed wrappers
+# when it is turned on, so when it is off the game runs exactly the
+# code it always does, with no checks and no cost at all.
+#
+# The console game profiles itself when run with `--profile` (or
+# `--profile-json FILE` to also write the timings as JSON), or when the
+# DD_PROFILE environment variable is set to 1 (and DD_PROFILE_JSON to a
+# file name), and shows the timings when the game ends.
+
+import functools
+import json
+import os
+from time import perf_counter_ns
+
+import engine
+import journal
+
+# The phases profiled in every game, as the object holding each
+# function and its name. The functions of the console game are added by
+# main.py.
+PHASES = [
+    (engine, "step"),
+    (engine, "begin_turn"),
+    (engine, "spawn_enemy"),
+    (engine, "advance_entities"),
+    (engine, "impact_area"),
+    (engine, "enhance_enemies"),
+    (journal.Journal, "record"),
+]
+
+# The calls, total time and longest call of every profiled phase, in
+# nanoseconds, by name.
+timings = {}
+
+
+def enabled_by_environment() -> bool:
+    """Returns whether the DD_PROFILE environment variable asks for
+    profiling."""
+    return os.environ.get("DD_PROFILE", "") not in ["", "0"]
+
+
+def _timed(name: str, function):
+    timing = timings.setdefault(name, [0, 0, 0])
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = perf_counter_ns() - start
+            timing[0] += 1
+            timing[1] += elapsed
+            if elapsed > timing[2]:
+                timing[2] = elapsed
+    return timed
+
+
+def instrument(phases: list):
+    """Replaces functions with timed wrappers. Functions that are
+    already being timed are left alone.
+
+    Parameters:
+        phases (list): The functions to time, as pairs of the object
+        holding each function (a module or a class) and its name.
+    """
+    for owner, name in phases:
+        function = getattr(owner, name)
+        if getattr(function, "__wrapped__", None) is None:
+            # Methods are reported with the name of their class.
+            label = "{}.{}".format(owner.__name__, name) if isinstance(owner, type) else name
+            setattr(owner, name, _timed(label, function))
+
+
+def enable(extra_phases=()):
+    """Starts timing the phases in PHASES and any others given.
+
+    Parameters:
+        extra_phases (list): More functions to time; see instrument().
+    """
+    instrument(PHASES + list(extra_phases))
+
+
+def summary() -> dict:
+    """Returns the timings of every phase called so far.
+
+    Returns:
+        dict: By phase, the number of calls and the total, mean and
+        longest time of a call, in milliseconds and microseconds.
+    """
+    return {name: {"calls": calls, "total_ms": total / 1e6, "mean_us": total / calls / 1e3, "max_us": longest / 1e3}
+            for name, (calls, total, longest) in timings.items() if calls}
+
+
+def report() -> str:
+    """Builds a table of the timings of every phase called so far, the
+    slowest first. Phases that call other phases include their time.
+
+    Returns:
+        str: The table.
+    """
+    lines = ["{:<18} {:>8} {:>12} {:>10} {:>10}".format("Phase", "Calls", "Total (ms)", "Mean (us)", "Max (us)")]
+    for name, timing in sorted(summary().items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append("{:<18} {:>8} {:>12.2f} {:>10.1f} {:>10.1f}".format(
+            name, timing["calls"], timing["total_ms"], timing["mean_us"], timing["max_us"]))
+    return "\n".join(lines)
+
+
+def write_json(file_name: str):
+    """Writes the timings of every phase called so far to a JSON file."""
+    with open(file_name, "w") as file:
+        json.dump({"phases": summary()}, file, indent=2)
@@ -0,0 +1,356 @@
+# Drawing the field of a game
+#
+# The field used to be drawn with a separate print() for every cell,
+# border and label: about a hundred writes for the default board, and
+# thousands for large custom ones, which could be seen flickering over a
+# slow connection. A FieldRenderer instead builds the whole frame as one
+# string and writes it at once. The borders and labels only depend on
+# the size of the field, so they are built once and kept, and the text
+# of a cell is cached by what is in it.
+#
+# In ANSI mode, the field is kept at the top of the terminal with
+# everything else scrolling beneath it, and after the first frame only
+# the cells that changed since the last frame are rewritten, using ANSI
+# escape codes to move the cursor to them. This needs a terminal that
+# understands them, so it is off unless asked for.
+#
+# In viewport mode, a field too big for the terminal is not drawn whole:
+# only the window of it that fits is, starting from the player's half
+# and following the lane of the enemy closest to the city, and the
+# window can be panned around. Only the cells in the window are looked
+# at (besides the closest enemy of every lane, to follow), so drawing
+# costs about the same however big the field is.
+#
+# The statistics shown under the field and the messages describing what
+# happened are built here too, so the game server can send the same text
+# as the console game prints.
+
+import os
+import sys
+from typing import Union
+
+import engine
+
+# The width of the text in a cell; every cell also has a border to its
+# left.
+CELL_WIDTH = 5
+
+# The lines the terminal needs beneath the field in ANSI or viewport
+# mode, for the stats, the choices and the prompt. In ANSI mode on a
+# smaller terminal, whole frames are drawn instead.
+LOG_LINES = 8
+
+# The number of different cell texts kept before the cache is cleared.
+CACHE_SIZE = 4096
+
+_EMPTY_CELL = ("|" + " " * CELL_WIDTH, "|" + " " * CELL_WIDTH)
+
+
+class FieldRenderer:
+    """Draws the field of a game, with one write for every frame.
+
+    Attributes:
+        ansi (bool): Whether to keep the field at the top of the
+        terminal and only rewrite the cells that changed.
+        viewport (bool): Whether to only draw the window of the field
+        that fits in the terminal.
+        top (int): The first row of the window.
+        left (int): The first column of the window.
+        following (bool): Whether the window follows the lane of the
+        enemy closest to the city; panning stops this.
+        output: The file to write frames to; defaults to sys.stdout.
+    """
+
+    def __init__(self, ansi=False, viewport=False, output=None):
+        self.ansi, self.viewport, self.output = ansi, viewport, output
+        self.top = self.left = 0
+        self.following = True
+        self._window = self._key = None
+        self._header = self._border = self._status = ""
+        self._height = 0
+        self._texts = {}
+        # The cell texts and terminal height of the last frame drawn in
+        # ANSI mode, or None if the next frame has to be drawn whole.
+        self._cells = None
+        self._lines = None
+
+    def _build_template(self, state: engine.GameState, window: tuple):
+        """Builds the parts of a frame that only depend on the size of
+        the field and the window drawn of it."""
+        rows, columns = state.variables["rows"], state.variables["columns"]
+        top, left, height, width = self._window = window
+        self._key = (rows, columns, window)
+        self._header = " " + "".join(" {:^{}}".format(column + 1, CELL_WIDTH)
+                                     for column in range(left, min(left + width, columns // 2))) + "\n"
+        self._border = " " + ("+" + "-" * CELL_WIDTH) * width + "+\n"
+        self._status = ""
+        if (height, width) != (rows, columns):
+            self._status = "Showing rows {} to {} of {} and columns {} to {} of {}.\n".format(
+                chr(65 + top), chr(64 + top + height), rows, left + 1, left + width, columns)
+        self._height = 3 * height + 2 + (1 if self._status else 0)
+        self._cells = None
+
+    def _cell_text(self, entity: engine.Entity) -> tuple:
+        """Returns the text of both lines of a cell, each with the
+        border to its left."""
+        if entity is None:
+            return _EMPTY_CELL
+        key = (entity.id, entity.current_health, entity.health)
+        text = self._texts.get(key)
+        if text is None:
+            if len(self._texts) >= CACHE_SIZE:
+                self._texts.clear()
+            text = self._texts[key] = ("|{:^{}}".format(entity.id, CELL_WIDTH),
+                                       "|{:^{}}".format("{}/{}".format(entity.current_health, entity.health), CELL_WIDTH))
+        return text
+
+    def _frame(self, cells: list) -> str:
+        """Builds a whole frame from the texts of the cells."""
+        parts = [self._header, self._border]
+        for r_index, row in enumerate(cells, self._window[0]):
+            parts.append(chr(65 + r_index))
+            parts.extend(names for names, _ in row)
+            parts.append("|\n ")
+            parts.extend(healths for _, healths in row)
+            parts.append("|\n")
+            parts.append(self._border)
+        parts.append(self._status)
+        return "".join(parts)
+
+    def _terminal_size(self, output) -> os.terminal_size:
+        """Returns the size of the terminal written to, or None if it is
+        not a terminal."""
+        try:
+            return os.get_terminal_size(output.fileno())
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _place_window(self, state: engine.GameState, size: os.terminal_size) -> tuple:
+        """Works out the window of the field to draw.
+
+        Returns:
+            tuple: The first row, first column, number of rows and number
+            of columns of the window.
+        """
+        rows, columns = state.variables["rows"], state.variables["columns"]
+        if not self.viewport or size is None:
+            return (0, 0, rows, columns)
+
+        # Leaves room for the row letters, column numbers, borders and
+        # the line saying which part of the field is shown.
+        width = min(columns, max(1, (size.columns - 2) // (CELL_WIDTH + 1)))
+        height = min(rows, max(1, (size.lines - 3 - LOG_LINES) // 3))
+        if self.following and height < rows:
+            # Only the first enemy of every lane is looked at, as the
+            # lanes are kept sorted.
+            closest = min(((enemies[0], r_index) for r_index, enemies in enumerate(state.enemy_lanes) if enemies),
+                          default=None)
+            if closest is not None:
+                self.top = closest[1] - height // 2
+        self.top = max(0, min(self.top, rows - height))
+        self.left = max(0, min(self.left, columns - width))
+        return (self.top, self.left, height, width)
+
+    def _cell_texts(self, state: engine.GameState, window: tuple) -> list:
+        """Returns the texts of every cell in a window of the field of a
+        game, rebuilding the template first if the window changed."""
+        if (state.variables["rows"], state.variables["columns"], window) != self._key:
+            self._build_template(state, window)
+        top, left, height, width = window
+        return [[self._cell_text(entity) for entity in row[left:left + width]]
+                for row in state.field[top:top + height]]
+
+    def render(self, state: engine.GameState) -> str:
+        """Builds the whole frame of the field of a game, as it is drawn
+        without ANSI mode.
+
+        Parameters:
+            state (GameState): The game to draw the field of.
+
+        Returns:
+            str: The frame.
+        """
+        size = self._terminal_size(self.output or sys.stdout) if self.viewport else None
+        window = self._place_window(state, size)
+        return self._frame(self._cell_texts(state, window))
+
+    def _patch(self, cells: list) -> str:
+        """Builds the escape codes that rewrite the cells that changed
+        since the last frame, leaving the cursor where it was."""
+        parts = []
+        for r_index, (row, previous) in enumerate(zip(cells, self._cells)):
+            if row == previous:
+                continue
+            for c_index, (text, old_text) in enumerate(zip(row, previous)):
+                if text != old_text:
+                    # Rows take three lines under the two header lines,
+                    # and cells six columns after the row letter.
+                    line, column = 3 + r_index * 3, 3 + c_index * (CELL_WIDTH + 1)
+                    parts.append("\x1b[{};{}H{}\x1b[{};{}H{}".format(
+                        line, column, text[0][1:], line + 1, column, text[1][1:]))
+        return "\x1b7" + "".join(parts) + "\x1b8" if parts else ""
+
+    def draw(self, state: engine.GameState):
+        """Draws the field of a game.
+
+        Parameters:
+            state (GameState): The game to draw the field of.
+        """
+        output = self.output or sys.stdout
+        size = self._terminal_size(output)
+        cells = self._cell_texts(state, self._place_window(state, size))
+        if not self.ansi:
+            output.write(self._frame(cells))
+            output.flush()
+            return
+
+        lines = 0 if size is None else size.lines
+        if lines < self._height + LOG_LINES:
+            # There is no room to keep the field in place.
+            self.close()
+            output.write(self._frame(cells))
+        elif self._cells is None or lines != self._lines:
+            # Clears the terminal, draws the field at the top, and lets
+            # only the lines beneath it scroll.
+            output.write("\x1b[r\x1b[H\x1b[2J{}\x1b[{};{}r\x1b[{};1H".format(
+                self._frame(cells), self._height + 1, lines, self._height + 1))
+            self._lines = lines
+        else:
+            output.write(self._patch(cells))
+        self._cells = cells if lines >= self._height + LOG_LINES else None
+        output.flush()
+
+    def pan(self, rows: int, columns: int):
+        """Moves the window by a number of rows and columns, and stops it
+        following the closest enemy. The window is kept within the field
+        when it is next drawn.
+
+        Parameters:
+            rows (int): The rows to move down by (or up, if negative).
+            columns (int): The columns to move right by (or left, if
+            negative).
+        """
+        self.top, self.left = self.top + rows, self.left + columns
+        self.following = False
+
+    def follow(self):
+        """Makes the window follow the lane of the enemy closest to the
+        city again, from the player's half of the field."""
+        self.left, self.following = 0, True
+
+    def window_size(self) -> tuple:
+        """Returns the number of rows and columns in the window of the
+        last frame, or None if nothing has been drawn yet."""
+        return None if self._window is None else self._window[2:]
+
+    def reset(self):
+        """Makes the next frame be drawn whole."""
+        self._cells = None
+
+    def close(self):
+        """Lets the whole terminal scroll again, if the field was being
+        kept at the top of it."""
+        if self._lines is not None:
+            output = self.output or sys.stdout
+            output.write("\x1b[r\x1b[{};1H".format(self._lines))
+            output.flush()
+        self._cells = self._lines = None
+
+
+def render_stats(state: engine.GameState) -> str:
+    """Builds the statistics of a game shown under the field: the
+    current turn number, threat level, danger level, amount of gold, and
+    number of monsters killed.
+
+    Parameters:
+        state (GameState): The game to show the statistics of.
+
+    Returns:
+        str: The statistics, over two lines.
+    """
+    variables = state.variables
+    stats = ""
+
+    # Adds turn info to stats.
+    stats += "Turn {:<2}".format(variables["turn"] + 1)
+    stats += " " * 5
+
+    # Adds threat level info to stats.
+    stats += "Threat = [{:<10}]".format("-" * variables["threat_level"])
+    stats += " " * 5
+
+    # Adds danger level info to stats.
+    stats += "Danger Level {:<2}".format(variables["danger_level"])
+    stats += "\n"
+
+    # Adds gold info to stats.
+    stats += "Gold = {:>2}".format(variables["gold"])
+    stats += " " * 3
+
+    # Adds killed info to stats.
+    stats += "Monsters killed = {}/{}".format(
+        variables["killed"], variables["target"])
+    return stats
+
+
+def describe_event(event) -> Union[str, None]:
+    """Turns an event from the engine into the message shown to the
+    player.
+
+    Parameters:
+        event: The event to describe.
+
+    Returns:
+        str: The message, or None if the event is not shown to the player.
+    """
+    if isinstance(event, engine.Shot):
+        return "[>] {} in lane {} shoots {} for {} damage!".format(
+            event.attacker, chr(65 + event.lane), event.target, event.damage)
+    elif isinstance(event, engine.Attack):
+        return "[<] {} in lane {} attacks {} for {} damage!".format(
+            event.attacker, chr(65 + event.lane), event.target, event.damage)
+    elif isinstance(event, engine.Kill):
+        return "[{}] {} dies!".format(">" if event.by == "player" else "<", event.name)
+    elif isinstance(event, engine.Advance):
+        return "[<] {} advances!".format(event.name)
+    elif isinstance(event, engine.Knockback):
+        return "[>] {} was blasted back by the cannon!".format(event.name)
+    elif isinstance(event, engine.Detonation):
+        return "[<] Mine in lane {} was detonated by {}!".format(chr(65 + event.lane), event.name)
+    elif isinstance(event, engine.Blast):
+        return "[>] {} in lane {} was dealt {} damage by an exploding mine!".format(
+            event.name, chr(65 + event.lane), event.damage)
+    elif isinstance(event, engine.Healed):
+        return "[>] {} in lane {} was healed by {} points!".format(
+            event.name, chr(65 + event.lane), event.amount)
+    elif isinstance(event, engine.Enhance):
+        return "The evil grows!"
+    elif isinstance(event, engine.Upgraded):
+        return "{} in lane {}, column {} upgraded!".format(
+            event.name, chr(65 + event.lane), event.column + 1)
+    elif isinstance(event, engine.Rejected):
+        return event.message
+    return None
+
+
+def describe_action(state: engine.GameState, action: engine.Action) -> str:
+    """Turns an action into words, as the advisor suggests it.
+
+    Parameters:
+        state (GameState): The game the action would be taken in.
+        action (Action): The action to describe.
+
+    Returns:
+        str: The description.
+    """
+    if isinstance(action, engine.Buy):
+        name = next((template["name"] for template in state.characters["player"]
+                     if template["id"] == action.unit), action.unit)
+        return "Buy {} in lane {}, column {}".format(
+            name, chr(65 + action.row), action.column + 1)
+    elif isinstance(action, engine.Upgrade):
+        return "Upgrade the {} in lane {}, column {}".format(
+            state.field[action.row][action.column].name, chr(65 + action.row), action.column + 1)
+    elif isinstance(action, engine.Heal):
+        return "Heal the area around lane {}, column {}".format(chr(65 + action.row), action.column + 1)
+    return "End the turn"
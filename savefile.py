@@ -0,0 +1,399 @@
+# Desperate Defenders save files
+#
+# Games can be saved in two formats:
+# - The compact format (.ddc), used by the game. It is a binary file: a
+# header, whether the game plays by lane rules (see
+# engine.advance_lanes()), the game variables, the state of the game's random number
+# generator and the entity templates, then one block per row of the
+# field holding a packed record for every occupied cell, and last the
+# wave plan the game follows, if any, as a wave file. Only occupied
+# cells are written, and files are written and read a row at a time, so
+# large boards never need the whole file in memory.
+# - The text format (.dd), used by older versions of the game. Every
+# cell of the field is written as JSON, which makes it easy to read and
+# edit by hand, but slow and large for big boards. It is kept to import
+# and export games.
+#
+# Either format can be converted to the other from the command line:
+#     python3 savefile.py export saved_game.ddc saved_game.dd
+#     python3 savefile.py import saved_game.dd saved_game.ddc
+
+import json
+import struct
+import sys
+from copy import deepcopy
+from textwrap import wrap
+
+import engine
+
+MAGIC = b"DDSAVE"
+VERSION = 1
+
+# The layouts of the parts of a compact save file. All numbers are
+# little-endian.
+_HEADER = struct.Struct("<6sB")
+_FLAG = struct.Struct("<?")
+_COUNT = struct.Struct("<I")
+_LENGTH = struct.Struct("<H")
+_VALUE = struct.Struct("<q")
+_TEMPLATE = struct.Struct("<Biiiiii")
+# The state of the random number generator: whether it holds a Gaussian
+# value for its next draw, and the value.
+_GAUSS = struct.Struct("<?d")
+# An occupied cell: its column, the index of its template, then its
+# current health, health, minimum and maximum damage, reward and
+# upgrade count.
+_RECORD = struct.Struct("<IHiiiiii")
+
+# The order templates are written in, and the order of their stats.
+_TYPES = ["player", "enemy"]
+_TEMPLATE_STATS = ["health", "min_damage",
+                   "max_damage", "cost", "moves", "reward"]
+
+
+class SaveFileError(ValueError):
+    """Raised when a save file cannot be read."""
+
+
+####################
+# Compact format
+####################
+
+
+def _write_string(file, string: str):
+    data = string.encode("utf-8")
+    file.write(_LENGTH.pack(len(data)))
+    file.write(data)
+
+
+def _read(file, layout: struct.Struct) -> tuple:
+    data = file.read(layout.size)
+    if len(data) != layout.size:
+        raise SaveFileError("The save file ends unexpectedly.")
+    return layout.unpack(data)
+
+
+def _read_string(file) -> str:
+    length, = _read(file, _LENGTH)
+    data = file.read(length)
+    if len(data) != length:
+        raise SaveFileError("The save file ends unexpectedly.")
+    return data.decode("utf-8")
+
+
+def write_compact(state: engine.GameState, file, waves=True):
+    """Writes a game to a file in the compact format.
+
+    Parameters:
+        state (GameState): The game to write.
+        file: The file to write to, opened in binary mode.
+        waves (bool): Whether to write the game's wave plan; journals
+        write plans apart from their checkpoints (see journal.py).
+    """
+    _write_compact(file, state, state.variables, state.characters, state.rng.getstate(), state.field,
+                   plan=state.waves if waves else None)
+
+
+def write_snapshot(state: engine.GameState, point: engine.Snapshot, rows: list, file):
+    """Writes a game to a file in the compact format as it was when a
+    snapshot of it was taken (see engine.snapshot()), while the game
+    carries on changing on another thread. Cells changed since are
+    written as the snapshot logged them.
+
+    Parameters:
+        state (GameState): The game to write.
+        point (Snapshot): The snapshot, taken with the state of the
+        random number generator and not yet restored or released.
+        rows (list): Shallow copies of the rows of the field, made when
+        the snapshot was taken.
+        file: The file to write to, opened in binary mode.
+    """
+    characters = {"player": state.characters["player"], "enemy": point.enemies}
+    _write_compact(file, state, point.variables, characters, point.random_state, rows, point.cells, state.waves)
+
+
+def _write_compact(file, state: engine.GameState, variables: dict, characters: dict, random_state: tuple,
+                   field: list, logged=None, plan=None):
+    file.write(_HEADER.pack(MAGIC, VERSION))
+    file.write(_FLAG.pack(state.lane_rules))
+
+    # Writes the game variables.
+    file.write(_LENGTH.pack(len(variables)))
+    for key, value in variables.items():
+        _write_string(file, key)
+        file.write(_VALUE.pack(value))
+
+    # Writes the state of the random number generator, so that a loaded
+    # game draws the same numbers it would have drawn if it was never
+    # saved.
+    version, internal_state, gauss_next = random_state
+    file.write(_VALUE.pack(version))
+    file.write(_COUNT.pack(len(internal_state)))
+    file.write(struct.pack("<{}I".format(len(internal_state)), *internal_state))
+    file.write(_GAUSS.pack(gauss_next is not None, gauss_next or 0.0))
+
+    # Writes the entity templates; cells refer to them by their index.
+    templates, indices = [], {}
+    for type in _TYPES:
+        for template in characters[type]:
+            indices[engine.kind_of(template, type)] = len(templates)
+            templates.append((type, template))
+    file.write(_LENGTH.pack(len(templates)))
+    for type, template in templates:
+        _write_string(file, template["id"])
+        _write_string(file, template["name"])
+        file.write(_TEMPLATE.pack(_TYPES.index(type),
+                   *[template.get(stat, 0) for stat in _TEMPLATE_STATS]))
+
+    # Writes the field, one row at a time.
+    file.write(_COUNT.pack(len(field)))
+    file.write(_COUNT.pack(variables["columns"]))
+    for r_index, row in enumerate(field):
+        cells = engine.occupied_cells(row)
+        records = [_RECORD.pack(c_index, indices[cell.kind], cell.current_health, cell.health, cell.min_damage,
+                                cell.max_damage, cell.reward, cell.upgrade_count)
+                   for c_index, cell in cells]
+        # A cell is logged before it is changed, so cells are only
+        # looked up in the log once they have been read: a cell not
+        # logged by then was read as it was.
+        if logged:
+            for index, (c_index, _) in enumerate(cells):
+                cell = logged.get((r_index, c_index))
+                if cell is not None:
+                    records[index] = _RECORD.pack(c_index, indices[cell.kind], cell.current_health, cell.health,
+                                                  cell.min_damage, cell.max_damage, cell.reward, cell.upgrade_count)
+        file.write(_COUNT.pack(len(records)))
+        file.write(b"".join(records))
+
+    # Writes the wave plan as a wave file; an empty one for no plan.
+    data = b"" if plan is None else json.dumps(plan.to_data(), separators=(",", ":")).encode("utf-8")
+    file.write(_COUNT.pack(len(data)))
+    file.write(data)
+
+
+def read_compact(file, sparse=False) -> engine.GameState:
+    """Reads a game from a file in the compact format.
+
+    Parameters:
+        file: The file to read from, opened in binary mode.
+        sparse (bool): Whether the field of the game only keeps its
+        occupied cells; see engine.new_field().
+
+    Returns:
+        GameState: The game.
+
+    Raises:
+        SaveFileError: If the file is not a compact save file, or is
+        damaged.
+    """
+    magic, version = _read(file, _HEADER)
+    if magic != MAGIC:
+        raise SaveFileError("This is not a Desperate Defenders save file.")
+    if version != VERSION:
+        raise SaveFileError(
+            "The save file is from an unknown version ({}) of the game.".format(version))
+    lane_rules, = _read(file, _FLAG)
+
+    # Reads the game variables.
+    variables = {}
+    count, = _read(file, _LENGTH)
+    for _ in range(count):
+        key = _read_string(file)
+        variables[key], = _read(file, _VALUE)
+
+    # Reads the state of the random number generator.
+    random_version, = _read(file, _VALUE)
+    count, = _read(file, _COUNT)
+    internal_state = _read(file, struct.Struct("<{}I".format(count)))
+    has_gauss, gauss_next = _read(file, _GAUSS)
+
+    # Reads the entity templates.
+    characters, kinds = {type: [] for type in _TYPES}, []
+    count, = _read(file, _LENGTH)
+    for _ in range(count):
+        template = {"id": _read_string(file), "name": _read_string(file)}
+        type_index, *stats = _read(file, _TEMPLATE)
+        try:
+            type = _TYPES[type_index]
+        except IndexError:
+            raise SaveFileError(
+                "The save file has an entity of an unknown type.")
+        template.update(zip(_TEMPLATE_STATS, stats))
+        # Players have no moves or reward, and enemies have no cost.
+        for stat in (["moves", "reward"] if type == "player" else ["cost"]):
+            del template[stat]
+        characters[type].append(template)
+        kinds.append(engine.kind_of(template, type))
+
+    # Reads the field, one row at a time.
+    rows, columns = _read(file, _COUNT) + _read(file, _COUNT)
+    if "rows" not in variables or "columns" not in variables or (rows, columns) != (variables["rows"], variables["columns"]):
+        raise SaveFileError(
+            "The size of the saved field does not match the game variables.")
+    field = engine.new_field(rows, columns, sparse)
+    for row in field:
+        count, = _read(file, _COUNT)
+        data = file.read(count * _RECORD.size)
+        if len(data) != count * _RECORD.size:
+            raise SaveFileError("The save file ends unexpectedly.")
+        for c_index, kind_index, *stats in _RECORD.iter_unpack(data):
+            if c_index >= columns or kind_index >= len(kinds):
+                raise SaveFileError("The save file has an invalid cell.")
+            row[c_index] = engine.Entity(kinds[kind_index], *stats)
+
+    state = engine.GameState(field, variables, characters)
+    state.lane_rules = lane_rules
+    try:
+        state.rng.setstate((random_version, internal_state, gauss_next if has_gauss else None))
+    except (TypeError, ValueError):
+        raise SaveFileError("The save file has an invalid random number generator state.")
+
+    # Reads the wave plan.
+    count, = _read(file, _COUNT)
+    data = file.read(count)
+    if len(data) != count:
+        raise SaveFileError("The save file ends unexpectedly.")
+    if count:
+        import waves
+        try:
+            state.waves = waves.from_data(json.loads(data.decode("utf-8")), characters)
+        except ValueError as error:
+            raise SaveFileError("The save file has an invalid wave plan: {}".format(error))
+    return state
+
+
+####################
+# Text format
+####################
+
+
+def write_text(state: engine.GameState, file):
+    """Writes a game to a file in the text format.
+
+    Parameters:
+        state (GameState): The game to write.
+        file: The file to write to, opened in text mode.
+    """
+    # Writes the headers in the file to identify the file as a saved
+    # game.
+    file.writelines(["### DESPERATE DEFENDERS SAVE FILE ###\n"] + [line + "\n" for line in wrap(
+        "This file was created by the desperate Defenders game. Do not change the values in this file; otherwise, your game may change or be corrupted!", width=72)])
+
+    # Writes the game variables to the file.
+    file.write("\n# Game variables #")
+    for key, value in state.variables.items():
+        file.write("\n{},{}".format(key, value))
+
+    # Writes the field to the file, one row at a time. JSON is
+    # practically similar to Python's dictionary format (in this use
+    # case). Therefore, we can use the json package to handle reading
+    # and writing. Empty cells are kept as {}.
+    file.write("\n\n# Field #")
+    for row in state.field:
+        file.write("\n" + ";".join(["{}" if cell is None else json.dumps(cell.to_dict())
+                                    for cell in row]))
+
+
+def read_text(data: list, variables: dict, sparse=False) -> tuple:
+    """Reads a game from the lines of a file in the text format.
+
+    Problems with single game variables or with the field are collected
+    rather than raised, so that whatever could be read is still
+    restored.
+
+    Parameters:
+        data (list): The lines of the file.
+        variables (dict): The game variables to start from; only the
+        variables known here are read from the file.
+        sparse (bool): Whether the field of the game only keeps its
+        occupied cells; see engine.new_field().
+
+    Returns:
+        tuple: The game, the parts of it that were fully restored
+        (\"Game variables\" and \"Field\"), and a list of error messages.
+
+    Raises:
+        SaveFileError: If the file cannot be read at all.
+    """
+    variables, restored, errors = dict(variables), [], []
+
+    # Restores the game variables.
+    variables_restored = True
+    try:
+        stored_game_variables = data[5:data.index("\n", 5)]
+    except ValueError:
+        raise SaveFileError(
+            "An irrecoverable error occurred while reading game variable data. For safety, the game will end.")
+    for index, variable in enumerate(stored_game_variables):
+        try:
+            key, value = variable.split(",")
+            assert key in variables
+        except AssertionError:
+            errors.append("Error in line {} ({}): The key {} is not known to the game.".format(
+                5 + index, variable.strip(), key))
+            variables_restored = False
+        except ValueError:
+            errors.append("Error in line {} ({}): The game variables are not in the right format.".format(
+                5 + index, variable.strip()))
+            variables_restored = False
+        else:
+            value = value.strip()
+            variables[key] = int(value) if value.isdigit() else value
+    if variables_restored:
+        restored.append("Game variables")
+
+    # Restores the field.
+    try:
+        saved_field = data[data.index("# Field #\n") + 1:]
+        field = engine.new_field(variables["rows"], variables["columns"], sparse)
+        if len(saved_field) != variables["rows"]:
+            errors.append(
+                "Error in restoring field: The game-set number of rows does not match the saved number of rows.")
+        else:
+            for r_index, row in enumerate(saved_field):
+                row = row.strip().split(";")
+                for c_index, cell in enumerate(row):
+                    cell_data = json.loads(cell)
+                    if cell_data != {}:
+                        field[r_index][c_index] = engine.Entity.from_dict(
+                            cell_data)
+            restored.append("Field")
+    except Exception:
+        raise SaveFileError(
+            "An irrecoverable error occurred while reading the game field. For safety, the game will end.")
+
+    return engine.GameState(field, variables, deepcopy(engine.units().characters)), restored, errors
+
+
+####################
+# Execution point
+# Converts save files between the two formats.
+####################
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ["import", "export"]:
+        print("Usage: python3 savefile.py import <text save> <compact save>")
+        print("       python3 savefile.py export <compact save> <text save>")
+        sys.exit(2)
+
+    command, source, destination = sys.argv[1:]
+    try:
+        if command == "import":
+            with open(source, "r") as file:
+                state, restored, errors = read_text(
+                    file.readlines(), engine.GAME_VARIABLES)
+            for error in errors:
+                print(error)
+            if len(restored) != 2:
+                sys.exit(1)
+            with open(destination, "wb") as file:
+                write_compact(state, file)
+        else:
+            with open(source, "rb") as file:
+                state = read_compact(file)
+            with open(destination, "w") as file:
+                write_text(state, file)
+    except (OSError, SaveFileError) as error:
+        print(error)
+        sys.exit(1)
+    print("Saved {} as {}.".format(source, destination))
@@ -0,0 +1,272 @@
+# Desperate Defenders game server
+#
+# Hosts many games at once, for players and spectators connecting over
+# TCP or a Unix socket (for example, with `nc localhost 8765`), as for a
+# classroom or a tournament. Every game is played with the engine and
+# shown with the same field and statistics as the console game.
+#
+# The server runs on a single asyncio event loop. A game only has a task
+# while it has commands to play, so a game nobody is typing in costs no
+# more than its GameState and its list of connections, and thousands of
+# them can be kept waiting on one machine.
+#
+# The protocol is plain text, with one command per line, and everything
+# the server sends is in blocks ending with an empty line. Connections
+# start in the lobby, where they can type:
+#     new [SEED]   starts a new game and plays it
+#     join ID      plays a game someone else started
+#     watch ID     watches a game without playing
+#     list         lists the games being played
+#     leave        leaves the game being played or watched
+#     quit         disconnects
+# Players then type the commands in commands.py (for example, buy
+# archer A1, or end), and after every action the field, the statistics
+# and what happened are sent to everyone in the game. A spectator that
+# falls behind has frames skipped rather than slowing the game down; a
+# player, who needs every frame, is disconnected instead once too far
+# behind, so nobody who stops reading can fill the server's memory.
+#
+# Run with `python3 server.py --help` for the options; see
+# benchmarks/server_load.py for a load test.
+
+import argparse
+import asyncio
+import sys
+from collections import deque
+
+import commands
+import engine
+import render
+
+# The bytes that can be waiting to be sent to a spectator before frames
+# are skipped for them, and to a player before they are disconnected.
+MAX_BUFFERED = 64 * 1024
+MAX_PLAYER_BUFFERED = 1024 * 1024
+
+GREETING = "Welcome to Desperate Defenders! Type new [SEED], join ID, watch ID, list, leave or quit."
+
+
+class Session:
+    """A game on the server, with the connections playing and watching
+    it.
+
+    Attributes:
+        id (int): The number the game is joined and watched by.
+        state (GameState): The game.
+        players (set): The writers of the connections playing the game.
+        spectators (set): The writers of the connections watching it.
+        pending (deque): The commands waiting to be played, as (writer,
+        command) pairs; see GameServer.submit().
+        task (asyncio.Task): The task playing the commands, or None while
+        there are none.
+    """
+    __slots__ = ("id", "state", "players", "spectators", "pending", "task")
+
+    def __init__(self, id: int, state: engine.GameState):
+        self.id, self.state = id, state
+        self.players, self.spectators = set(), set()
+        self.pending, self.task = deque(), None
+
+
+class GameServer:
+    """Keeps the games being played on the server and the connections
+    to them.
+
+    Attributes:
+        variables (dict): The game variables new games start with.
+        sessions (dict): The games, by id.
+    """
+
+    def __init__(self, variables=None):
+        self.variables = dict(engine.GAME_VARIABLES if variables is None else variables)
+        self.sessions = {}
+        self._next_id = 1
+        # Every game is drawn with the same renderer, so games of the
+        # same size share its borders and cell texts.
+        self._renderer = render.FieldRenderer()
+
+    def _frame(self, session: Session, messages: list) -> bytes:
+        state = session.state
+        return "Game {}\n{}{}\n{}\n".format(session.id, self._renderer.render(state), render.render_stats(state),
+                                           "".join(message + "\n" for message in messages)).encode()
+
+    def _send(self, writer: asyncio.StreamWriter, text: str):
+        if not writer.is_closing():
+            writer.write(text.encode() + b"\n\n")
+
+    def _broadcast(self, session: Session, frame: bytes):
+        for writer in session.players:
+            if writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_PLAYER_BUFFERED:
+                # Drops what is waiting to be sent; the connection then
+                # reads as closed, and leaves the game.
+                writer.transport.abort()
+            else:
+                writer.write(frame)
+        for writer in session.spectators:
+            if not writer.is_closing() and writer.transport.get_write_buffer_size() <= MAX_BUFFERED:
+                writer.write(frame)
+
+    def _events_messages(self, events: list) -> list:
+        messages = []
+        for event in events:
+            if isinstance(event, engine.GameOver):
+                messages.append("You have protected the city! You win!" if event.outcome == "win" else
+                                "A {} has reached the city! All is lost!".format(event.catalyst))
+            message = render.describe_event(event)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def new_session(self, seed=None) -> Session:
+        """Starts a new game.
+
+        Parameters:
+            seed (int): The seed of the game; random if not given.
+
+        Returns:
+            Session: The game.
+        """
+        session = Session(self._next_id, engine.new_game(self.variables, seed=seed))
+        self._next_id += 1
+        self.sessions[session.id] = session
+        # The first frame is sent by the game's task, once the player
+        # who started it has been added.
+        self.submit(session, None, self._events_messages(engine.begin_turn(session.state)) + [commands.HELP])
+        return session
+
+    def submit(self, session: Session, writer, command):
+        """Queues a command typed by a player of a game, starting a task
+        to play it if the game has none. A writer of None queues a list
+        of messages to send everyone with the next frame instead."""
+        session.pending.append((writer, command))
+        if session.task is None:
+            session.task = asyncio.get_running_loop().create_task(self._play(session))
+
+    async def _play(self, session: Session):
+        """Plays the commands waiting in a game, then ends."""
+        try:
+            while session.pending:
+                writer, command = session.pending.popleft()
+                if writer is None:
+                    self._broadcast(session, self._frame(session, command))
+                    continue
+                if session.state.outcome is not None:
+                    self._send(writer, "The game is over. Type leave, then new to start another.")
+                    continue
+                try:
+                    action = commands.parse_command(session.state, command)
+                except AssertionError as error:
+                    self._send(writer, str(error))
+                    continue
+                if action == "save":
+                    self._send(writer, "Games on the server are not saved.")
+                    continue
+                self._broadcast(session, self._frame(session, self._events_messages(engine.step(session.state, action))))
+                # Lets the other games and connections have a turn.
+                await asyncio.sleep(0)
+        finally:
+            session.task = None
+
+    def leave(self, session: Session, writer: asyncio.StreamWriter):
+        """Removes a connection from a game, and the game from the server
+        once nobody is left in it."""
+        session.players.discard(writer)
+        session.spectators.discard(writer)
+        if not session.players and not session.spectators:
+            self.sessions.pop(session.id, None)
+            if session.task is not None:
+                session.task.cancel()
+
+    def _find(self, words: list, writer: asyncio.StreamWriter) -> Session:
+        if len(words) != 2 or not words[1].isdigit() or int(words[1]) not in self.sessions:
+            self._send(writer, "There is no game with that number; type list to see the games.")
+            return None
+        return self.sessions[int(words[1])]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves a connection until it disconnects."""
+        session = None
+        self._send(writer, GREETING)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                words = command.lower().split()
+                if not words:
+                    continue
+
+                if words[0] == "quit":
+                    break
+                elif words[0] in ["new", "join", "watch"]:
+                    if session is not None:
+                        self.leave(session, writer)
+                    if words[0] == "new":
+                        session = self.new_session(int(words[1]) if len(words) == 2 and words[1].isdigit() else None)
+                        session.players.add(writer)
+                    else:
+                        session = self._find(words, writer)
+                        if session is not None:
+                            (session.players if words[0] == "join" else session.spectators).add(writer)
+                            writer.write(self._frame(session, []))
+                elif words[0] == "leave" and session is not None:
+                    self.leave(session, writer)
+                    session = None
+                    self._send(writer, GREETING)
+                elif words[0] == "list":
+                    self._send(writer, "\n".join("Game {}: turn {}, {} playing, {} watching{}".format(
+                        game.id, game.state.variables["turn"] + 1, len(game.players), len(game.spectators),
+                        "" if game.state.outcome is None else ", over") for game in self.sessions.values())
+                        or "No games are being played.")
+                elif session is not None and writer in session.players:
+                    self.submit(session, writer, command)
+                elif session is not None:
+                    self._send(writer, "Spectators cannot play; type leave to go back to the lobby.")
+                else:
+                    self._send(writer, GREETING)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if session is not None:
+                self.leave(session, writer)
+            writer.close()
+
+
+async def serve(server: GameServer, host="localhost", port=8765, unix_path=None):
+    """Serves games until the program is stopped.
+
+    Parameters:
+        server (GameServer): The server to serve the games of.
+        host (str): The host to listen on over TCP.
+        port (int): The port to listen on over TCP.
+        unix_path (str): The path of a Unix socket to listen on instead.
+    """
+    if unix_path is not None:
+        listener = await asyncio.start_unix_server(server.handle, unix_path)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    print("Serving Desperate Defenders on {}.".format(
+        unix_path or ", ".join("{}:{}".format(*socket.getsockname()[:2]) for socket in listener.sockets)))
+    sys.stdout.flush()
+    async with listener:
+        await listener.serve_forever()
+
+
+####################
+# Execution point
+####################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hosts Desperate Defenders games for players and spectators.")
+    parser.add_argument("--host", default="localhost", help="the host to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="the port to listen on")
+    parser.add_argument("--unix", metavar="PATH", help="a Unix socket to listen on instead of TCP")
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(serve(GameServer(), arguments.host, arguments.port, arguments.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,345 @@
+# Monte Carlo simulations of Desperate Defenders
+#
+# Plays many games without a player, with a simple policy choosing the
+# actions, to see how changes to the game variables and unit stats
+# affect the balance of the game. Games are spread over several worker
+# processes, and every game has its own seed, so any game can be played
+# again by itself.
+#
+# Run with `python3 simulate.py --help` for the options. For example,
+# to compare the default game against one with stronger zombies:
+#     python3 simulate.py --games 1000 --workers 4
+#     python3 simulate.py --games 1000 --workers 4 --unit ZOMBI.health=20
+#
+# Several configurations can be compared at once by giving a JSON file
+# with a list of them:
+#     [{"name": "default"},
+#      {"name": "rich", "variables": {"gold": 30}},
+#      {"name": "tough", "units": {"ZOMBI": {"health": 20}}},
+#      {"name": "planned", "waves": "waves.json"}]
+# where "waves" is a wave file the games follow (see waves.py).
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+
+import engine
+import sinks
+import waves
+
+# The turns the average gold is reported at.
+GOLD_TURNS = [10, 25, 50, 100]
+
+####################
+# Policies
+# A policy chooses the player's next action in a game. Policies are
+# given their own random number generator, separate from the game's.
+####################
+
+
+def random_policy(state: engine.GameState, rng: random.Random) -> engine.Action:
+    """Buys a random unit in a random free cell of the player's half
+    whenever it can be afforded, and ends the turn otherwise."""
+    affordable = [template for template in state.characters["player"]
+                  if template["cost"] <= state.variables["gold"]]
+    free = [(r_index, c_index) for r_index, row in enumerate(state.field)
+            for c_index in range(state.variables["columns"] // 2) if row[c_index] is None]
+    if affordable and free and rng.random() < 0.5:
+        return engine.Buy(rng.choice(affordable)["id"], *rng.choice(free))
+    return engine.EndTurn()
+
+
+def defend_policy(state: engine.GameState, rng: random.Random) -> engine.Action:
+    """Buys an archer (or, with a catalog without archers, the cheapest
+    defense unit) in the lane of the enemy closest to the city, as far
+    back as there is room, whenever one can be afforded, and ends the
+    turn otherwise."""
+    archer = next((template for template in state.characters["player"] if template["id"] == "ARCHR"),
+                  min(state.characters["player"], key=lambda template: template["cost"]))
+    if archer["cost"] <= state.variables["gold"]:
+        lanes = sorted((enemies[0], r_index)
+                       for r_index, enemies in enumerate(state.enemy_lanes) if enemies)
+        for _, r_index in lanes:
+            for c_index in range(state.variables["columns"] // 2):
+                if state.field[r_index][c_index] is None:
+                    return engine.Buy(archer["id"], r_index, c_index)
+    return engine.EndTurn()
+
+
+# The rollouts the advisor plays for every decision in a simulation. A
+# set number, rather than a time budget, plays a game out the same every
+# time.
+ADVISOR_ROLLOUTS = 200
+
+# The advisor of the game being played in this process, and the game.
+_advisor, _advised_game = None, None
+
+
+def advisor_policy(state: engine.GameState, rng: random.Random) -> engine.Action:
+    """Plays the action the advisor (see advisor.py) rates best. Every
+    game gets an advisor of its own, seeded from the policy's generator,
+    so a game plays out the same however the games are shared out."""
+    global _advisor, _advised_game
+    import advisor
+    if state is not _advised_game:
+        _advisor, _advised_game = advisor.Advisor(seed=rng.getrandbits(64)), state
+    return _advisor.advise(state, rollouts=ADVISOR_ROLLOUTS)
+
+
+POLICIES = {"random": random_policy, "defend": defend_policy, "advisor": advisor_policy}
+
+####################
+# Simulation functions
+####################
+
+
+def build_configuration(name: str, variables=None, units=None, wave_file=None) -> dict:
+    """Builds a configuration to simulate from changes to the default
+    game variables and unit stats.
+
+    Parameters:
+        name (str): The name to report the configuration under.
+        variables (dict): The game variables to change.
+        units (dict): The stats to change, by unit id.
+        wave_file (str): A wave file for the games to follow.
+
+    Returns:
+        dict: The configuration, with its name, variables, characters and
+        wave plan (or None).
+
+    Raises:
+        ValueError: If a variable, unit or stat is not known to the game,
+        or the wave file is not a valid plan for the game.
+    """
+    configuration = {"name": name, "variables": dict(engine.GAME_VARIABLES),
+                     "characters": deepcopy(engine.units().characters), "waves": None}
+    for key, value in (variables or {}).items():
+        if key not in configuration["variables"]:
+            raise ValueError("The key {} is not known to the game.".format(key))
+        configuration["variables"][key] = value
+
+    templates = {template["id"]: template for type in ["player", "enemy"]
+                 for template in configuration["characters"][type]}
+    for unit, stats in (units or {}).items():
+        if unit not in templates:
+            raise ValueError("The unit {} is not known to the game.".format(unit))
+        for stat, value in stats.items():
+            if stat not in templates[unit] or stat in ["id", "name"]:
+                raise ValueError("The unit {} has no stat {}.".format(unit, stat))
+            templates[unit][stat] = value
+
+    if wave_file is not None:
+        configuration["waves"] = waves.load(wave_file, configuration["characters"])
+        configuration["waves"].check(configuration["variables"])
+    return configuration
+
+
+def play_game(configuration: dict, policy: str, seed: int, max_turns: int) -> dict:
+    """Plays a game to its end, or until it reaches the turn limit.
+
+    Parameters:
+        configuration (dict): The configuration to play.
+        policy (str): The name of the policy choosing the actions.
+        seed (int): The seed of the game (and of the policy).
+        max_turns (int): The turn the game is stopped at.
+
+    Returns:
+        dict: The outcome (\"win\", \"loss\" or \"timeout\"), the number of
+        turns played, the number of kills, and the gold at the start of
+        every turn.
+    """
+    state = engine.new_game(
+        configuration["variables"], configuration["characters"], seed=seed)
+    state.waves = configuration.get("waves")
+    choose, rng = POLICIES[policy], random.Random("policy {}".format(seed))
+    gold = [state.variables["gold"]]
+    # Nobody watches the games, so no events are made.
+    events = sinks.NullSink()
+    engine.begin_turn(state, events)
+
+    # A policy choosing actions that never take a turn is stopped too.
+    actions = 0
+    while state.outcome is None and state.variables["turn"] < max_turns and actions < max_turns * 10:
+        turn = state.variables["turn"]
+        engine.step(state, choose(state, rng), events)
+        actions += 1
+        if state.variables["turn"] != turn and state.outcome is None:
+            gold.append(state.variables["gold"])
+
+    return {"outcome": state.outcome or "timeout", "turns": state.variables["turn"],
+            "kills": state.variables["killed"], "gold": gold}
+
+
+def _play_shard(configurations: list, policy: str, max_turns: int, games: list) -> list:
+    """Plays a share of the games in a worker process.
+
+    Returns:
+        list: The index of the configuration and the result of every
+        game, in the order given.
+    """
+    return [(index, play_game(configurations[index], policy, seed, max_turns)) for index, seed in games]
+
+
+def simulate(configurations: list, games: int, policy="defend", seed=0, workers=None, max_turns=1000) -> list:
+    """Plays a number of games of every configuration over a pool of
+    worker processes.
+
+    Game i of every configuration is played with the seed seed + i, so
+    configurations are compared over the same games, and the games are
+    split into contiguous shards so that each worker plays a run of
+    seeds.
+
+    Parameters:
+        configurations (list): The configurations to play.
+        games (int): The number of games to play of every configuration.
+        policy (str): The name of the policy choosing the actions.
+        seed (int): The seed of the first game.
+        workers (int): The number of worker processes. Defaults to the
+        number of processors; with 1, the games are played in this
+        process.
+        max_turns (int): The turn games are stopped at.
+
+    Returns:
+        list: For every configuration, the list of its games' results.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(index, seed + game) for index in range(len(configurations))
+             for game in range(games)]
+    # Several shards per worker even out games of different lengths.
+    shard_count = min(len(tasks), workers * 4) or 1
+    shards = [tasks[len(tasks) * shard // shard_count:len(tasks) * (shard + 1) // shard_count]
+              for shard in range(shard_count)]
+
+    results = [[] for _ in configurations]
+    if workers == 1:
+        finished = [_play_shard(configurations, policy, max_turns, shard)
+                    for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            finished = list(executor.map(_play_shard, [configurations] * len(shards),
+                                         [policy] * len(shards), [max_turns] * len(shards), shards))
+    for shard in finished:
+        for index, result in shard:
+            results[index].append(result)
+    return results
+
+
+def summarise(results: list) -> dict:
+    """Summarises the results of the games of one configuration.
+
+    Returns:
+        dict: The number of games, wins, losses and timeouts, the win
+        rate, the average turns to win and kills, and the average gold
+        at the start of every turn (over the games still being played).
+    """
+    wins = [result for result in results if result["outcome"] == "win"]
+    longest = max([len(result["gold"]) for result in results], default=0)
+    gold_curve = []
+    for turn in range(longest):
+        golds = [result["gold"][turn]
+                 for result in results if turn < len(result["gold"])]
+        gold_curve.append(sum(golds) / len(golds))
+    return {
+        "games": len(results),
+        "wins": len(wins),
+        "losses": sum(result["outcome"] == "loss" for result in results),
+        "timeouts": sum(result["outcome"] == "timeout" for result in results),
+        "win_rate": len(wins) / len(results) if results else 0,
+        "turns_to_win": sum(result["turns"] for result in wins) / len(wins) if wins else None,
+        "kills": sum(result["kills"] for result in results) / len(results) if results else 0,
+        "gold_curve": gold_curve
+    }
+
+
+def _parse_assignment(assignment: str) -> tuple:
+    key, separator, value = assignment.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(
+            "{} should be in the form key=value.".format(assignment))
+    try:
+        return key, int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "The value of {} should be numeric.".format(key))
+
+
+####################
+# Execution point
+####################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Plays many games of Desperate Defenders without a player and reports how they went.")
+    parser.add_argument("--games", type=int, default=1000,
+                        help="the number of games to play of every configuration")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="defend",
+                        help="how the player's actions are chosen")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="the number of worker processes (default: one per processor)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="the seed of the first game")
+    parser.add_argument("--max-turns", type=int, default=1000,
+                        help="the turn games are stopped at")
+    parser.add_argument("--set", type=_parse_assignment, action="append", default=[], metavar="KEY=VALUE",
+                        help="changes a game variable in every configuration, e.g. gold=20")
+    parser.add_argument("--unit", type=_parse_assignment, action="append", default=[], metavar="ID.STAT=VALUE",
+                        help="changes a unit stat in every configuration, e.g. ZOMBI.health=20")
+    parser.add_argument("--waves", metavar="FILE",
+                        help="a wave file for the games of every configuration to follow")
+    parser.add_argument("--config",
+                        help="a JSON file with a list of configurations to compare")
+    parser.add_argument("--json", help="a file to write the summaries to, as JSON")
+    arguments = parser.parse_args()
+
+    try:
+        entries = [{"name": "default"}]
+        if arguments.config is not None:
+            with open(arguments.config, "r") as file:
+                entries = json.load(file)
+        configurations = []
+        for entry in entries:
+            variables = dict(entry.get("variables", {}), **dict(arguments.set))
+            units = deepcopy(entry.get("units", {}))
+            for key, value in arguments.unit:
+                unit, _, stat = key.partition(".")
+                units.setdefault(unit, {})[stat] = value
+            configurations.append(build_configuration(
+                entry.get("name", "configuration {}".format(len(configurations) + 1)), variables, units,
+                entry.get("waves", arguments.waves)))
+    except (OSError, ValueError) as error:
+        print(error)
+        sys.exit(1)
+
+    workers = arguments.workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    results = simulate(configurations, arguments.games, arguments.policy,
+                       arguments.seed, workers, arguments.max_turns)
+    elapsed = time.perf_counter() - start
+    summaries = [dict(summarise(games), name=configuration["name"])
+                 for configuration, games in zip(configurations, results)]
+
+    print("{:<16} {:>7} {:>9} {:>8} {:>13} {:>7}".format(
+        "Configuration", "Games", "Win rate", "Losses", "Turns to win", "Kills") +
+        "".join(" {:>8}".format("Gold@{}".format(turn)) for turn in GOLD_TURNS))
+    for summary in summaries:
+        curve = summary["gold_curve"]
+        print("{:<16} {:>7} {:>8.1f}% {:>8} {:>13} {:>7.1f}".format(
+            summary["name"][:16], summary["games"], summary["win_rate"] * 100, summary["losses"],
+            "-" if summary["turns_to_win"] is None else "{:.1f}".format(
+                summary["turns_to_win"]),
+            summary["kills"]) +
+            "".join(" {:>8}".format("-" if turn >= len(curve) else "{:.1f}".format(curve[turn])) for turn in GOLD_TURNS))
+
+    total = arguments.games * len(configurations)
+    print("\nPlayed {} games in {:.2f} s ({:.0f} games/sec) with {} worker{}.".format(
+        total, elapsed, total / elapsed, workers, "" if workers == 1 else "s"))
+
+    if arguments.json is not None:
+        with open(arguments.json, "w") as file:
+            json.dump({"policy": arguments.policy, "seed": arguments.seed, "games": arguments.games,
+                       "seconds": elapsed, "configurations": summaries}, file, indent=2)
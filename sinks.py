@@ -0,0 +1,87 @@
+# Event sinks
+#
+# The engine describes what happens in a game as events (see the Events
+# chunk of engine.py), and sends them to a sink: anything with an
+# append() method, such as a plain list. The sinks here send the events
+# somewhere useful instead:
+# - NullSink drops them. The engine does not even create the events of
+#   shots, attacks, kills and the like for a sink that is not listening,
+#   so simulations that only look at the outcome of a game do not pay
+#   for them.
+# - ConsoleSink writes the messages the console game shows.
+# - JSONLSink writes every event as a line of JSON, for other programs
+#   to read.
+
+import sys
+
+import render
+
+
+class Sink:
+    """The base of the sinks here.
+
+    Attributes:
+        listening (bool): Whether the sink uses the events it is sent.
+        The engine skips creating events for sinks that do not.
+    """
+    listening = True
+
+    def append(self, event):
+        """Takes an event from the engine."""
+        raise NotImplementedError
+
+    def extend(self, events: list):
+        """Takes several events, in order."""
+        for event in events:
+            self.append(event)
+
+    def close(self):
+        """Finishes with the sink once no more events are coming."""
+
+
+class NullSink(Sink):
+    """Drops every event, for games nobody watches."""
+    listening = False
+
+    def append(self, event):
+        pass
+
+
+class ConsoleSink(Sink):
+    """Writes the message describing every event, as the console game
+    shows them. Events the player is not shown are skipped.
+
+    Attributes:
+        output: The file to write to; defaults to sys.stdout.
+    """
+
+    def __init__(self, output=None):
+        self.output = output
+
+    def append(self, event):
+        message = render.describe_event(event)
+        if message is not None:
+            (self.output or sys.stdout).write(message + "\n")
+
+
+class JSONLSink(Sink):
+    """Writes every event as a line of JSON, with the type of the event
+    under \"event\" and its fields under their names; for example,
+    {"event": "Shot", "lane": 0, "attacker": "Archer", ...}.
+
+    Attributes:
+        file: The text file to write to, closed by close().
+    """
+
+    def __init__(self, file):
+        import json
+        self.file = file
+        self._encode = json.JSONEncoder(separators=(",", ":")).encode
+
+    def append(self, event):
+        record = {"event": type(event).__name__}
+        record.update(event._asdict())
+        self.file.write(self._encode(record) + "\n")
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,294 @@
+# Wave plans for Desperate Defenders
+#
+# Left to itself, a game spawns its enemies as it goes: one whenever the
+# field has none, and one for every 10 threat, with the threat drawn
+# turn by turn from the game's random number generator. A wave plan
+# decides instead, before the game is played, which enemies spawn on
+# which turn, in which lane and with which stats, so that a difficulty
+# curve can be designed, read and compared offline, and spawning during
+# the game is a lookup in a table by turn.
+#
+# Plans are either made by plan_waves() from a seed and a difficulty,
+# following the rules a game without a plan spawns by as closely as can
+# be known before the game is played, or written by hand as wave files:
+#     {"turns": 30,
+#      "waves": [{"turn": 0, "spawns": [{"unit": "ZOMBI", "lane": 2}]},
+#                {"turn": 6, "spawns": [{"unit": "WWOLF", "lane": 0, "health": 14},
+#                                       {"unit": "WWOLF", "lane": 4, "health": 14}]}]}
+# Turns and lanes count from 0. Every spawn names the unit and its
+# lane, and may give its health, min_damage, max_damage and reward;
+# stats not given are the unit's own. The plan covers the given number
+# of turns (by default, up to its last wave); past them, enemies spawn
+# as in a game without a plan. siege_waves.json is a wave file for the
+# default game.
+#
+# A game follows a plan by setting its waves (see engine.spawn_planned()):
+#     state.waves = waves.load("siege_waves.json")
+# While it does, the threat level no longer spawns enemies. Plans can be
+# written out, and summarised turn by turn, from the command line:
+#     python3 waves.py plan my_waves.json --seed 1 --difficulty 2
+#     python3 waves.py show siege_waves.json
+
+import argparse
+import json
+import random
+import sys
+from typing import NamedTuple
+
+import engine
+
+# How many turns a plan made by plan_waves() covers by default.
+PLAN_TURNS = 500
+
+# The stats a spawn may give, which are otherwise the unit's own.
+STATS = ["health", "min_damage", "max_damage", "reward"]
+
+
+class WaveError(ValueError):
+    """Raised when a wave file is not a valid wave plan, or a plan does
+    not fit a game."""
+
+
+class PlannedSpawn(NamedTuple):
+    """An enemy a plan spawns in the last column of a lane."""
+    turn: int
+    lane: int
+    unit: str
+    health: int
+    min_damage: int
+    max_damage: int
+    reward: int
+
+
+class WavePlan:
+    """The enemies to spawn on every turn of a game, indexed by turn.
+
+    Attributes:
+        turns (int): The number of turns the plan covers, from turn 0.
+        spawns (list): The PlannedSpawn of every enemy, in order of turn.
+        kinds (dict): The Kind of every unit in the plan, by id.
+    """
+
+    def __init__(self, spawns: list, turns: int, characters=None):
+        self.turns = turns
+        # Spawns on the same turn keep the order they were given in.
+        self.spawns = sorted(spawns, key=lambda spawn: spawn.turn)
+        templates = {template["id"]: template for template in (characters or engine.units().characters)["enemy"]}
+        self.kinds = {unit: engine.kind_of(templates[unit], "enemy")
+                      for unit in {spawn.unit for spawn in self.spawns}}
+
+        # The spawns of turn t are spawns[starts[t]:starts[t + 1]].
+        self._starts, index = [], 0
+        for turn in range(turns + 1):
+            while index < len(self.spawns) and self.spawns[index].turn < turn:
+                index += 1
+            self._starts.append(index)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, WavePlan) and (self.turns, self.spawns) == (other.turns, other.spawns)
+
+    def covers(self, turn: int) -> bool:
+        """Checks if the plan decides the spawns of a turn."""
+        return 0 <= turn < self.turns
+
+    def spawns_on(self, turn: int) -> list:
+        """Returns the PlannedSpawn of every enemy to spawn on a turn."""
+        if not 0 <= turn < self.turns:
+            return []
+        return self.spawns[self._starts[turn]:self._starts[turn + 1]]
+
+    def check(self, variables: dict):
+        """Checks the plan fits a game.
+
+        Parameters:
+            variables (dict): The game variables of the game.
+
+        Raises:
+            WaveError: If a spawn is in a lane the game does not have.
+        """
+        for spawn in self.spawns:
+            if spawn.lane >= variables["rows"]:
+                raise WaveError("The plan spawns a {} in lane {}, but the field only has lanes 0 to {}.".format(
+                    spawn.unit, spawn.lane, variables["rows"] - 1))
+
+    def to_data(self) -> dict:
+        """Returns the plan in the form of a wave file, with every stat
+        of every spawn given."""
+        waves = []
+        for spawn in self.spawns:
+            if not waves or waves[-1]["turn"] != spawn.turn:
+                waves.append({"turn": spawn.turn, "spawns": []})
+            waves[-1]["spawns"].append(dict(zip(PlannedSpawn._fields[1:], spawn[1:])))
+        return {"turns": self.turns, "waves": waves}
+
+
+def _number(value, name: str, minimum=0) -> int:
+    if type(value) is not int or value < minimum:
+        raise WaveError("{} should be a whole number of at least {}.".format(name, minimum))
+    return value
+
+
+def from_data(data: dict, characters=None) -> WavePlan:
+    """Checks the contents of a wave file and builds the plan.
+
+    Parameters:
+        data (dict): The plan, as described above.
+        characters (dict): The entity templates the units and their
+        stats are taken from. Defaults to engine.units().characters.
+
+    Returns:
+        WavePlan: The plan.
+
+    Raises:
+        WaveError: If the plan is not valid.
+    """
+    templates = {template["id"]: template for template in (characters or engine.units().characters)["enemy"]}
+    if not isinstance(data, dict) or not isinstance(data.get("waves"), list):
+        raise WaveError("A wave file should have a list of waves.")
+
+    spawns = []
+    for wave in data["waves"]:
+        if not isinstance(wave, dict) or not isinstance(wave.get("spawns"), list):
+            raise WaveError("Every wave should have a turn and a list of spawns.")
+        turn = _number(wave.get("turn"), "The turn of every wave")
+        for spawn in wave["spawns"]:
+            if not isinstance(spawn, dict) or spawn.get("unit") not in templates:
+                raise WaveError("Every spawn should name an enemy unit in the catalog ({}).".format(
+                    ", ".join(templates)))
+            unknown = [key for key in spawn if key not in ["unit", "lane"] + STATS]
+            if unknown:
+                raise WaveError("A spawn on turn {} has unknown fields: {}.".format(turn, ", ".join(unknown)))
+            template = templates[spawn["unit"]]
+            stats = [_number(spawn.get(stat, template.get(stat, 0)), "{} of {}".format(stat, spawn["unit"]),
+                             1 if stat == "health" else 0) for stat in STATS]
+            if stats[1] > stats[2]:
+                raise WaveError("min_damage of a {} on turn {} should not be above its max_damage.".format(
+                    spawn["unit"], turn))
+            spawns.append(PlannedSpawn(turn, _number(spawn.get("lane"), "The lane of every spawn"),
+                                       spawn["unit"], *stats))
+
+    last_turn = max([spawn.turn for spawn in spawns], default=-1)
+    turns = _number(data.get("turns", last_turn + 1), "The number of turns")
+    if turns <= last_turn:
+        raise WaveError("The plan covers {} turns, but has a wave on turn {}.".format(turns, last_turn))
+    return WavePlan(spawns, turns, characters)
+
+
+def load(file_name: str, characters=None) -> WavePlan:
+    """Loads a wave file.
+
+    Parameters:
+        file_name (str): The wave file.
+        characters (dict): The entity templates the units and their
+        stats are taken from. Defaults to engine.units().characters.
+
+    Returns:
+        WavePlan: The plan.
+
+    Raises:
+        WaveError: If the file cannot be read or is not a valid plan.
+    """
+    try:
+        with open(file_name, "r") as file:
+            data = json.load(file)
+    except (OSError, ValueError) as error:
+        raise WaveError("The wave file {} could not be read: {}".format(file_name, error))
+    return from_data(data, characters)
+
+
+def plan_waves(variables=None, characters=None, seed=None, difficulty=None, turns=PLAN_TURNS) -> WavePlan:
+    """Plans the enemies of a game from its current turn on, following
+    the rules a game without a plan spawns by: the threat rises by 1 to
+    the danger level every turn, an enemy spawns for every 10 threat,
+    and every 12 turns the danger level rises by one and enemies spawn
+    with 1 more health than the templates they are planned from.
+
+    A game without a plan also spawns an enemy whenever the field has
+    none, and the threat rises with every kill, neither of which can be
+    known before the game is played. Instead, the plan spawns an enemy on
+    the first turn it plans, and whenever the last enemy spawned would
+    have crossed the field unhindered. The first turn has already begun,
+    or is about to, so its threat and enhancement are not planned.
+
+    Parameters:
+        variables (dict): The game variables to plan for; its rows,
+        columns, turn, threat level and danger level are used. Defaults
+        to engine.GAME_VARIABLES.
+        characters (dict): The entity templates the enemies are chosen
+        from, as enhanced by the turn planned from. Defaults to
+        engine.units().characters.
+        seed: The seed the plan is drawn with. The same seed and
+        difficulty always give the same plan.
+        difficulty (int): The danger level to start at, in place of the
+        one in variables.
+        turns (int): The number of turns to plan, from the game's turn.
+
+    Returns:
+        WavePlan: The plan.
+    """
+    variables = engine.GAME_VARIABLES if variables is None else variables
+    enemies = (characters or engine.units().characters)["enemy"]
+    rows, columns, first = variables["rows"], variables["columns"], variables["turn"]
+    danger = variables["danger_level"] if difficulty is None else difficulty
+    threat, enhancements, rng = variables["threat_level"], 0, random.Random(seed)
+    spawns, crossed = [], 0
+
+    def spawn(turn: int):
+        nonlocal crossed
+        enemy = rng.choice(enemies)
+        spawns.append(PlannedSpawn(turn, rng.randint(0, rows - 1), enemy["id"], enemy["health"] + enhancements,
+                                   enemy["min_damage"], enemy["max_damage"], enemy.get("reward", 0)))
+        crossed = turn + -(-columns // enemy["moves"])
+
+    for turn in range(first, first + turns):
+        # In the order of engine.step() and engine.begin_turn().
+        if turn > first:
+            threat += rng.randint(1, danger)
+            while threat >= 10:
+                spawn(turn)
+                threat -= 10
+            if turn % 12 == 0:
+                enhancements += 1
+                danger += 1
+        if turn == first or turn >= crossed:
+            spawn(turn)
+    return WavePlan(spawns, first + turns, characters)
+
+
+####################
+# Execution point
+# Writes out and summarises plans.
+####################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes out and summarises wave plans.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = commands.add_parser("plan", help="writes a plan made from a seed and a difficulty to a wave file")
+    plan_parser.add_argument("file", help="the wave file to write")
+    plan_parser.add_argument("--seed", type=int, default=0, help="the seed the plan is drawn with")
+    plan_parser.add_argument("--difficulty", type=int, default=engine.GAME_VARIABLES["danger_level"],
+                             help="the danger level to start at")
+    plan_parser.add_argument("--turns", type=int, default=100, help="the number of turns to plan")
+    show_parser = commands.add_parser("show", help="summarises a wave file, every 10 turns")
+    show_parser.add_argument("file", help="the wave file to summarise")
+    arguments = parser.parse_args()
+
+    try:
+        if arguments.command == "plan":
+            plan = plan_waves(seed=arguments.seed, difficulty=arguments.difficulty, turns=arguments.turns)
+            with open(arguments.file, "w") as file:
+                json.dump(plan.to_data(), file, indent=1)
+            print("Planned {} enemies over {} turns in {}.".format(len(plan.spawns), plan.turns, arguments.file))
+        else:
+            plan = load(arguments.file)
+            print("{:>9} {:>8} {:>8} {:>12} {:>8}".format("Turns", "Enemies", "Health", "Max damage", "Reward"))
+            for start in range(0, plan.turns, 10):
+                spawns = [spawn for turn in range(start, min(start + 10, plan.turns))
+                          for spawn in plan.spawns_on(turn)]
+                print("{:>9} {:>8} {:>8} {:>12} {:>8}".format(
+                    "{}-{}".format(start, min(start + 10, plan.turns) - 1), len(spawns),
+                    sum(spawn.health for spawn in spawns), sum(spawn.max_damage for spawn in spawns),
+                    sum(spawn.reward for spawn in spawns)))
+    except (OSError, WaveError) as error:
+        print(error)
+        sys.exit(1)